@@ -4,13 +4,19 @@ Run: streamlit run app.py
 """
 import streamlit as st
 import logging
+import uuid
 from datetime import datetime
 
-from config.settings import DISCLAIMER, CHAT_HISTORY_LIMIT
-from src.chatbot import get_chatbot_chain, chat
+from config.settings import DISCLAIMER
+from src.conversation_log import get_conversation_log
 from src.utils import setup_logging
+from src.warmup import start_warmup
 
-# Optional: log to file for debugging (conversation history can be extended to file here)
+# The RAG stack (LangChain, faiss, the embedding model) is imported and loaded
+# on a background thread by src.warmup, so the page renders right away.
+
+# Conversation messages are also written to an append-only audit log on disk
+# when CONVERSATION_LOG_ENABLED is set (see src/conversation_log.py)
 setup_logging(logging.INFO)
 logger = logging.getLogger(__name__)
 
@@ -42,10 +48,15 @@ st.markdown("""
 
 
 @st.cache_resource
+def get_warmup():
+    """Start loading the RAG chain in the background, once per process."""
+    return start_warmup()
+
+
 def load_rag_chain():
-    """Load RAG chain once and reuse across sessions. Returns (chain, None) or (None, error_msg)."""
+    """Wait for the warmed-up RAG chain. Returns (chain, None) or (None, error_msg)."""
     try:
-        return get_chatbot_chain(), None
+        return get_warmup().wait(), None
     except FileNotFoundError as e:
         logger.warning("Vector store not found: %s", e)
         return None, "vector_store"
@@ -57,6 +68,45 @@ def load_rag_chain():
         return None, "other"
 
 
+def log_message(role: str, content: str) -> None:
+    """Record a message in the session log and, if enabled, the persistent audit log."""
+    st.session_state.conversation_log.append({
+        "role": role,
+        "content": content,
+        "timestamp": datetime.utcnow().isoformat(),
+    })
+    writer = get_conversation_log()
+    if writer is not None:
+        writer.log(st.session_state.session_id, role, content)
+
+
+def show_setup_help(load_error: str) -> None:
+    """Explain how to fix a chain that failed to load, then stop the script."""
+    st.error("Could not load the chatbot.")
+    with st.expander("Setup steps (click to expand)", expanded=True):
+        if load_error == "api_key":
+            st.markdown("**1. Set your Groq API key**")
+            st.markdown("- Open the `.env` file in the project folder.")
+            st.markdown("- Set `GROQ_API_KEY=your-groq-api-key-here`.")
+            st.markdown("- Get a key at: https://console.groq.com/keys")
+            st.markdown("**2. Build the vector store** (in a terminal):")
+            st.code("python scripts/build_vector_store.py", language="bash")
+            st.markdown("**3. Restart this app** (stop and run `streamlit run app.py` again).")
+        elif load_error == "vector_store":
+            st.markdown("**1. Build the vector store** (in a terminal):")
+            st.code("python scripts/build_vector_store.py", language="bash")
+            st.markdown("Then **restart this app**.")
+        else:
+            st.markdown("**1. Create a `.env` file** if it does not exist.")
+            st.markdown("**2. Set your Groq API key** in `.env`:")
+            st.code("GROQ_API_KEY=your-groq-api-key-here", language="bash")
+            st.markdown("Get a key at: https://console.groq.com/keys")
+            st.markdown("**3. Build the vector store** (in a terminal):")
+            st.code("python scripts/build_vector_store.py", language="bash")
+            st.markdown("**4. Restart this app.**")
+    st.stop()
+
+
 def main():
     st.title("🩺 Medical AI Chatbot")
     st.caption("General health information assistant. Not a substitute for professional care.")
@@ -74,6 +124,8 @@ def main():
         if st.button("Clear conversation"):
             st.session_state.messages = []
             st.session_state.conversation_log = []
+            st.session_state.session_id = uuid.uuid4().hex
+            st.session_state.pop("history", None)
             st.rerun()
 
     # Initialize conversation state and log
@@ -81,34 +133,18 @@ def main():
         st.session_state.messages = []
     if "conversation_log" not in st.session_state:
         st.session_state.conversation_log = []  # List of {role, content, timestamp}
-
-    # Load RAG chain
-    rag_result, load_error = load_rag_chain()
-    if rag_result is None:
-        st.error("Could not load the chatbot.")
-        with st.expander("Setup steps (click to expand)", expanded=True):
-            if load_error == "api_key":
-                st.markdown("**1. Set your Groq API key**")
-                st.markdown("- Open the `.env` file in the project folder.")
-                st.markdown("- Set `GROQ_API_KEY=your-groq-api-key-here`.")
-                st.markdown("- Get a key at: https://console.groq.com/keys")
-                st.markdown("**2. Build the vector store** (in a terminal):")
-                st.code("python scripts/build_vector_store.py", language="bash")
-                st.markdown("**3. Restart this app** (stop and run `streamlit run app.py` again).")
-            elif load_error == "vector_store":
-                st.markdown("**1. Build the vector store** (in a terminal):")
-                st.code("python scripts/build_vector_store.py", language="bash")
-                st.markdown("Then **restart this app**.")
-            else:
-                st.markdown("**1. Create a `.env` file** if it does not exist.")
-                st.markdown("**2. Set your Groq API key** in `.env`:")
-                st.code("GROQ_API_KEY=your-groq-api-key-here", language="bash")
-                st.markdown("Get a key at: https://console.groq.com/keys")
-                st.markdown("**3. Build the vector store** (in a terminal):")
-                st.code("python scripts/build_vector_store.py", language="bash")
-                st.markdown("**4. Restart this app.**")
-        st.stop()
-    rag_chain = rag_result
+    if "session_id" not in st.session_state:
+        st.session_state.session_id = uuid.uuid4().hex
+
+    # Show setup help as soon as background loading has failed; while it is
+    # still running, let the page render and only wait once a question is asked
+    warmup = get_warmup()
+    if warmup.done:
+        rag_chain, load_error = load_rag_chain()
+        if rag_chain is None:
+            show_setup_help(load_error)
+    else:
+        st.caption("⏳ Loading the knowledge base in the background…")
 
     # Display chat history
     for msg in st.session_state.messages:
@@ -119,42 +155,37 @@ def main():
     if prompt := st.chat_input("Ask a health-related question..."):
         # Append user message to UI and log
         st.session_state.messages.append({"role": "user", "content": prompt})
-        st.session_state.conversation_log.append({
-            "role": "user",
-            "content": prompt,
-            "timestamp": datetime.utcnow().isoformat(),
-        })
+        log_message("user", prompt)
 
         # Show user message
         with st.chat_message("user"):
             st.markdown(prompt)
 
-        # Build history for RAG (last N turns to stay within context window)
-        history = []
-        prev_messages = st.session_state.messages[:-1]  # Exclude current prompt
-        if len(prev_messages) > CHAT_HISTORY_LIMIT:
-            prev_messages = prev_messages[-CHAT_HISTORY_LIMIT:]
-        for m in prev_messages:
-            role = "user" if m["role"] == "user" else "assistant"
-            history.append((role, m["content"]))
+        with st.spinner("Loading the knowledge base…"):
+            rag_chain, load_error = load_rag_chain()
+        if rag_chain is None:
+            show_setup_help(load_error)
+        from src.chatbot import ChatError, chat_stream
+        from src.history import ConversationHistory
+
+        # Compacted history for the prompt (prior turns only), updated each turn
+        if "history" not in st.session_state:
+            st.session_state.history = ConversationHistory()
+        history = st.session_state.history
 
-        # Get bot response
+        # Get bot response, rendering tokens as they arrive
         with st.chat_message("assistant"):
-            with st.spinner("Thinking..."):
-                reply, error = chat(prompt, rag_chain, conversation_history=history)
-            if error:
-                st.error(error)
-                reply = f"[Error: {error}]"
-            else:
-                st.markdown(reply)
+            try:
+                reply = st.write_stream(chat_stream(prompt, rag_chain, conversation_history=history))
+            except ChatError as e:
+                st.error(str(e))
+                reply = f"[Error: {e}]"
 
         # Append assistant reply to state and log
         st.session_state.messages.append({"role": "assistant", "content": reply})
-        st.session_state.conversation_log.append({
-            "role": "assistant",
-            "content": reply,
-            "timestamp": datetime.utcnow().isoformat(),
-        })
+        history.add("user", prompt)
+        history.add("assistant", reply)
+        log_message("assistant", reply)
 
 
 if __name__ == "__main__":
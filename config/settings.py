@@ -17,6 +17,18 @@ GROQ_API_KEY = os.getenv("GROQ_API_KEY", "")
 # Vector Store (FAISS - local, no external API key)
 # -----------------------------------------------------------------------------
 VECTOR_STORE_PATH = Path(os.getenv("VECTOR_STORE_PATH", "vector_store/faiss_index"))
+# FAISS index type as a faiss.index_factory string: "Flat" (exact), "IVF256,Flat",
+# "IVF256,PQ48", "HNSW32", "SQ8", ... Non-flat types trade recall for speed.
+FAISS_INDEX_SPEC = os.getenv("FAISS_INDEX_SPEC", "Flat")
+# Builds write a new version directory and switch VECTOR_STORE_PATH/CURRENT to
+# it atomically; this many versions are kept (current included)
+VECTOR_STORE_KEEP_VERSIONS = int(os.getenv("VECTOR_STORE_KEEP_VERSIONS", "2"))
+# Running apps check for a newly published version this often and swap it in
+# without a restart (0 = never)
+VECTOR_STORE_POLL_SECONDS = float(os.getenv("VECTOR_STORE_POLL_SECONDS", "5"))
+# Search-time knobs for IVF (lists probed) and HNSW (candidate list size)
+FAISS_NPROBE = int(os.getenv("FAISS_NPROBE", "16"))
+FAISS_EF_SEARCH = int(os.getenv("FAISS_EF_SEARCH", "64"))
 
 # Pinecone (optional)
 PINECONE_API_KEY = os.getenv("PINECONE_API_KEY", "")
@@ -27,21 +39,142 @@ PINECONE_INDEX_NAME = os.getenv("PINECONE_INDEX_NAME", "medical-chatbot")
 WEAVIATE_URL = os.getenv("WEAVIATE_URL", "http://localhost:8080")
 WEAVIATE_API_KEY = os.getenv("WEAVIATE_API_KEY", "")
 
+# Index builds: processes loading/splitting raw files (one file per task)
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "1"))
+# Index builds: embedding worker processes and texts per embedding batch
+EMBED_WORKERS = int(os.getenv("EMBED_WORKERS", "1"))
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+# Index builds: skip exact and near-duplicate chunks (MinHash over word
+# trigrams; estimated Jaccard >= DEDUP_THRESHOLD), merging their sources.
+# Opt-in: near-identical medical answers can differ in one dosage line
+DEDUP_ENABLED = os.getenv("DEDUP_ENABLED", "false").lower() == "true"
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.85"))
+# MinHash permutations, split into LSH bands (must divide DEDUP_NUM_PERM)
+DEDUP_NUM_PERM = int(os.getenv("DEDUP_NUM_PERM", "64"))
+DEDUP_BANDS = int(os.getenv("DEDUP_BANDS", "16"))
+# Embedding backend: "torch" (sentence-transformers) or "onnx" (int8 ONNX
+# Runtime export of the same model; see scripts/export_onnx_model.py).
+# Queries always use the backend recorded with the index.
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch").lower()
+ONNX_MODEL_DIR = Path(os.getenv("ONNX_MODEL_DIR", "models/minilm-onnx-int8"))
+# ONNX Runtime intra-op threads per process (0 = let ONNX Runtime decide)
+ONNX_THREADS = int(os.getenv("ONNX_THREADS", "0"))
+# ONNX builds fail if any sampled chunk's cosine to the torch vector is lower
+EMBEDDING_PARITY_MIN_COSINE = float(os.getenv("EMBEDDING_PARITY_MIN_COSINE", "0.98"))
+EMBEDDING_PARITY_SAMPLES = int(os.getenv("EMBEDDING_PARITY_SAMPLES", "64"))
+
 # -----------------------------------------------------------------------------
 # RAG & LLM (Groq + HuggingFace embeddings)
 # -----------------------------------------------------------------------------
 # Number of document chunks to retrieve for context
 MAX_CONTEXT_DOCS = int(os.getenv("MAX_CONTEXT_DOCS", "4"))
+# Fuse BM25 lexical results with vector results (reciprocal rank fusion)
+HYBRID_RETRIEVAL = os.getenv("HYBRID_RETRIEVAL", "true").lower() == "true"
+# Candidates taken from each retriever before fusion, and the RRF constant
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "20"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+# Build one sub-index per FAQ category and search only the PARTITION_PROBE
+# categories whose centroids are closest to the query (see src.partitions)
+CATEGORY_PARTITIONS = os.getenv("CATEGORY_PARTITIONS", "false").lower() == "true"
+PARTITION_PROBE = int(os.getenv("PARTITION_PROBE", "2"))
+# Max estimated tokens of retrieved context sent to the LLM per question
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1200"))
+# Drop a retrieved chunk whose word-trigram Jaccard similarity to one already
+# in the context is at least this (1.0 = only exact duplicates)
+CONTEXT_DEDUP_THRESHOLD = float(os.getenv("CONTEXT_DEDUP_THRESHOLD", "0.9"))
+# Query run once at startup to prime the embedding model and index
+WARMUP_QUERY = os.getenv("WARMUP_QUERY", "What are common flu symptoms?")
+# Coalesce concurrent retrievals into one batched embed + FAISS search
+RETRIEVAL_BATCHING = os.getenv("RETRIEVAL_BATCHING", "false").lower() == "true"
+# Max time a query waits for others to join its batch, and max batch size
+RETRIEVAL_BATCH_MAX_WAIT_MS = float(os.getenv("RETRIEVAL_BATCH_MAX_WAIT_MS", "5"))
+RETRIEVAL_BATCH_MAX_SIZE = int(os.getenv("RETRIEVAL_BATCH_MAX_SIZE", "32"))
 # Groq model name (can be overridden in .env)
 GROQ_MODEL = os.getenv("GROQ_MODEL", "llama-3.1-8b-instant")
 # Max tokens for chatbot response (keep responses short)
 MAX_RESPONSE_TOKENS = int(os.getenv("MAX_RESPONSE_TOKENS", "350"))
 
+# -----------------------------------------------------------------------------
+# FAQ fast path (curated answers for exact FAQ questions, no LLM call)
+# -----------------------------------------------------------------------------
+FAQ_FAST_PATH = os.getenv("FAQ_FAST_PATH", "true").lower() == "true"
+# Also match paraphrases by embedding similarity (embeds FAQ questions at build)
+FAQ_EMBEDDING_MATCH = os.getenv("FAQ_EMBEDDING_MATCH", "false").lower() == "true"
+FAQ_EMBEDDING_THRESHOLD = float(os.getenv("FAQ_EMBEDDING_THRESHOLD", "0.97"))
+
+# -----------------------------------------------------------------------------
+# Semantic answer cache (skip the LLM for near-identical questions)
+# -----------------------------------------------------------------------------
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "true").lower() == "true"
+# Minimum cosine similarity between questions to reuse a cached answer
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92"))
+# Max cached answers (least recently used are evicted first)
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "512"))
+# Seconds before a cached answer expires
+SEMANTIC_CACHE_TTL_SECONDS = float(os.getenv("SEMANTIC_CACHE_TTL_SECONDS", "3600"))
+
+# -----------------------------------------------------------------------------
+# Single-flight (identical questions in flight at once share one LLM call)
+# -----------------------------------------------------------------------------
+SINGLE_FLIGHT_ENABLED = os.getenv("SINGLE_FLIGHT_ENABLED", "true").lower() == "true"
+
+# -----------------------------------------------------------------------------
+# Headless HTTP server (server.py)
+# -----------------------------------------------------------------------------
+SERVER_HOST = os.getenv("SERVER_HOST", "127.0.0.1")
+SERVER_PORT = int(os.getenv("SERVER_PORT", "8080"))
+# Max Groq calls in flight at once; further requests wait for a free slot
+MAX_CONCURRENT_LLM_CALLS = int(os.getenv("MAX_CONCURRENT_LLM_CALLS", "32"))
+# Worker processes forked after loading the model and index once (1 = single process)
+SERVER_WORKERS = int(os.getenv("SERVER_WORKERS", "1"))
+# torch / FAISS threads per worker (0 = CPU cores divided by SERVER_WORKERS)
+SERVER_WORKER_THREADS = int(os.getenv("SERVER_WORKER_THREADS", "0"))
+# Seconds between per-worker memory (RSS/PSS) log lines from the parent (0 = off)
+SERVER_MEMORY_REPORT_SECONDS = float(os.getenv("SERVER_MEMORY_REPORT_SECONDS", "60"))
+
+# -----------------------------------------------------------------------------
+# Metrics (per-stage latency histograms, counters; /metrics on server.py)
+# -----------------------------------------------------------------------------
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "false").lower() == "true"
+# With metrics on, also log one JSON line per request with its stage timings
+METRICS_LOG_REQUESTS = os.getenv("METRICS_LOG_REQUESTS", "true").lower() == "true"
+
+# -----------------------------------------------------------------------------
+# Conversation log (append-only audit log of chat messages; see src/conversation_log.py)
+# -----------------------------------------------------------------------------
+CONVERSATION_LOG_ENABLED = os.getenv("CONVERSATION_LOG_ENABLED", "false").lower() == "true"
+CONVERSATION_LOG_DIR = Path(os.getenv("CONVERSATION_LOG_DIR", "logs/conversations"))
+# Records waiting for the background writer; when full, "drop" discards new
+# records and "block" makes the caller wait
+CONVERSATION_LOG_QUEUE_SIZE = int(os.getenv("CONVERSATION_LOG_QUEUE_SIZE", "10000"))
+CONVERSATION_LOG_OVERFLOW = os.getenv("CONVERSATION_LOG_OVERFLOW", "drop").lower()
+# Max records per write, and max seconds a record waits before being written
+CONVERSATION_LOG_BATCH_SIZE = int(os.getenv("CONVERSATION_LOG_BATCH_SIZE", "256"))
+CONVERSATION_LOG_FLUSH_SECONDS = float(os.getenv("CONVERSATION_LOG_FLUSH_SECONDS", "1.0"))
+# Rotate (and gzip) the log file past this size or age (0 = never)
+CONVERSATION_LOG_MAX_BYTES = int(os.getenv("CONVERSATION_LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+CONVERSATION_LOG_ROTATE_SECONDS = float(os.getenv("CONVERSATION_LOG_ROTATE_SECONDS", "86400"))
+
 # -----------------------------------------------------------------------------
 # Chat & Safety
 # -----------------------------------------------------------------------------
 # Max messages to keep in session history (for context window)
 CHAT_HISTORY_LIMIT = int(os.getenv("CHAT_HISTORY_LIMIT", "20"))
+# Most recent turns (user + assistant message pairs) sent to the LLM verbatim
+HISTORY_RECENT_TURNS = int(os.getenv("HISTORY_RECENT_TURNS", "2"))
+# Max estimated tokens of chat history (summary + recent turns) in the prompt
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "600"))
+# Max estimated tokens of the summary of older turns
+HISTORY_SUMMARY_TOKENS = int(os.getenv("HISTORY_SUMMARY_TOKENS", "200"))
+# Blocked-phrase and PHI rules checked on every user message (see src/safety.py)
+SAFETY_RULES_PATH = Path(
+    os.getenv("SAFETY_RULES_PATH", str(Path(__file__).resolve().parent / "safety_rules.json"))
+)
+# Footer appended to every bot reply for safety
+DISCLAIMER_FOOTER = (
+    "\n\n— This is for general information only, not medical advice. "
+    "Please consult a healthcare provider for your situation."
+)
 # Disclaimer text shown to users
 DISCLAIMER = (
     "This chatbot provides general health information only and does not replace "
@@ -0,0 +1,103 @@
+"""
+Offline performance benchmark (no network, no GROQ_API_KEY needed).
+Builds an index over a synthetic corpus and measures import time (cold
+start), build throughput, retrieval latency, concurrent chat()
+latency/throughput, safety rule check latency vs rule count and peak RSS,
+with a local fake LLM in place of Groq. See src/benchmark.py.
+
+Usage:
+    python scripts/benchmark.py [--faq-entries N] [--text-files N] [--queries N]
+                                [--clients N] [--requests-per-client N]
+                                [--llm-latency-ms MS] [--llm-tokens-per-second N]
+                                [--output results.json] [--baseline old.json]
+    python scripts/benchmark.py --safety-only [--queries N]
+
+The FAQ fast path, semantic cache and single-flight coalescing are off by
+default so every chat() measures the full retrieve + LLM path (concurrent
+clients repeat the same queries, which single-flight would merge into one
+fake LLM call); set FAQ_FAST_PATH / SEMANTIC_CACHE_ENABLED /
+SINGLE_FLIGHT_ENABLED to true to include them (the cache then loads the
+HuggingFace model).
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+# Must be set before config.settings is imported
+os.environ.setdefault("FAQ_FAST_PATH", "false")
+os.environ.setdefault("SEMANTIC_CACHE_ENABLED", "false")
+os.environ.setdefault("SINGLE_FLIGHT_ENABLED", "false")
+
+from src.benchmark import BenchmarkConfig, bench_safety, compare_results, make_queries, run_benchmark
+from src.utils import setup_logging
+
+
+def parse_args(argv=None):
+    defaults = BenchmarkConfig()
+    parser = argparse.ArgumentParser(description="Run the offline performance benchmark.")
+    parser.add_argument("--faq-entries", type=int, default=defaults.faq_entries,
+                        help=f"Synthetic FAQ entries (default: {defaults.faq_entries}).")
+    parser.add_argument("--text-files", type=int, default=defaults.text_files,
+                        help=f"Synthetic text files (default: {defaults.text_files}).")
+    parser.add_argument("--paragraphs-per-file", type=int, default=defaults.paragraphs_per_file,
+                        help=f"Paragraphs per text file (default: {defaults.paragraphs_per_file}).")
+    parser.add_argument("--queries", type=int, default=defaults.queries,
+                        help=f"Retrieval queries to time (default: {defaults.queries}).")
+    parser.add_argument("--clients", type=int, default=defaults.clients,
+                        help=f"Concurrent chat() clients (default: {defaults.clients}).")
+    parser.add_argument("--requests-per-client", type=int, default=defaults.requests_per_client,
+                        help=f"chat() calls per client (default: {defaults.requests_per_client}).")
+    parser.add_argument("--llm-latency-ms", type=float, default=defaults.llm_latency_ms,
+                        help=f"Fake LLM time to first token (default: {defaults.llm_latency_ms}).")
+    parser.add_argument("--llm-tokens-per-second", type=float, default=defaults.llm_tokens_per_second,
+                        help=f"Fake LLM token rate (default: {defaults.llm_tokens_per_second}).")
+    parser.add_argument("--llm-response-tokens", type=int, default=defaults.llm_response_tokens,
+                        help=f"Fake LLM reply length (default: {defaults.llm_response_tokens}).")
+    parser.add_argument("--seed", type=int, default=defaults.seed, help="Corpus random seed.")
+    parser.add_argument("--output", type=Path, default=Path("benchmark_results.json"),
+                        help="Where to write the JSON results (default: benchmark_results.json).")
+    parser.add_argument("--baseline", type=Path, default=None,
+                        help="Earlier results JSON to compare against.")
+    parser.add_argument("--safety-only", action="store_true",
+                        help="Only run the safety rule microbenchmark (no corpus, no index).")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    setup_logging(logging.WARNING)
+    if args.safety_only:
+        print(json.dumps(bench_safety(make_queries([], max(1, args.queries), args.seed)), indent=2))
+        return 0
+    config = BenchmarkConfig(
+        faq_entries=args.faq_entries,
+        text_files=args.text_files,
+        paragraphs_per_file=args.paragraphs_per_file,
+        queries=args.queries,
+        clients=args.clients,
+        requests_per_client=args.requests_per_client,
+        llm_latency_ms=args.llm_latency_ms,
+        llm_tokens_per_second=args.llm_tokens_per_second,
+        llm_response_tokens=args.llm_response_tokens,
+        seed=args.seed,
+    )
+    results = run_benchmark(config)
+    args.output.write_text(json.dumps(results, indent=2), encoding="utf-8")
+    print(json.dumps({k: results[k] for k in ("cold_start", "build", "retrieval", "chat", "safety", "peak_rss_mb")}, indent=2))
+    print(f"Results written to {args.output}")
+    if args.baseline:
+        baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+        print(f"\nCompared with {args.baseline}:")
+        for line in compare_results(baseline, results):
+            print("  " + line)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
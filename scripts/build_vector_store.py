@@ -1,10 +1,24 @@
 """
 Build the vector store from data in data/raw/.
 Run once after adding/changing medical content, and before starting the chatbot.
+Only new or changed chunks are embedded unless --full is given.
 
 Usage:
-    python scripts/build_vector_store.py
+    python scripts/build_vector_store.py [--full] [--workers N] [--batch-size N]
+                                         [--index-spec SPEC] [--ingest-workers N]
+                                         [--partitions | --no-partitions]
+                                         [--dedup | --no-dedup]
+                                         [--lexical | --no-lexical]
+
+SPEC is a faiss.index_factory string such as Flat (default), IVF256,Flat,
+IVF256,PQ48, HNSW32 or SQ8. Non-flat builds log recall@k against the exact
+index and per-query latency. --partitions also writes one sub-index per FAQ
+category for routed retrieval (see src/partitions.py). --dedup skips exact
+and near-duplicate chunks (see src/dedup.py; off by default). --lexical
+writes the BM25 index used by hybrid retrieval (see src/lexical.py; defaults
+to HYBRID_RETRIEVAL).
 """
+import argparse
 import sys
 from pathlib import Path
 
@@ -12,14 +26,84 @@ from pathlib import Path
 PROJECT_ROOT = Path(__file__).resolve().parent.parent
 sys.path.insert(0, str(PROJECT_ROOT))
 
+from config.settings import (
+    CATEGORY_PARTITIONS,
+    DEDUP_ENABLED,
+    EMBED_BATCH_SIZE,
+    EMBED_WORKERS,
+    FAISS_INDEX_SPEC,
+    HYBRID_RETRIEVAL,
+    INGEST_WORKERS,
+)
 from src.utils import setup_logging
 from src.embeddings import build_faiss_index
 
 
-def main():
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Build the FAISS vector store from data/raw/.")
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="Re-embed every chunk instead of only new or changed ones.",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=EMBED_WORKERS,
+        help=f"Embedding worker processes (default: {EMBED_WORKERS}).",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=EMBED_BATCH_SIZE,
+        help=f"Chunks per embedding batch (default: {EMBED_BATCH_SIZE}).",
+    )
+    parser.add_argument(
+        "--index-spec",
+        default=FAISS_INDEX_SPEC,
+        help=f"FAISS index type, e.g. Flat, IVF256,Flat, HNSW32 (default: {FAISS_INDEX_SPEC}).",
+    )
+    parser.add_argument(
+        "--ingest-workers",
+        type=int,
+        default=INGEST_WORKERS,
+        help=f"Processes loading and splitting raw files (default: {INGEST_WORKERS}).",
+    )
+    parser.add_argument(
+        "--partitions",
+        action=argparse.BooleanOptionalAction,
+        default=CATEGORY_PARTITIONS,
+        help=f"Build per-category sub-indexes for routed search (default: {CATEGORY_PARTITIONS}).",
+    )
+    parser.add_argument(
+        "--dedup",
+        action=argparse.BooleanOptionalAction,
+        default=DEDUP_ENABLED,
+        help=f"Skip exact and near-duplicate chunks (default: {DEDUP_ENABLED}).",
+    )
+    parser.add_argument(
+        "--lexical",
+        action=argparse.BooleanOptionalAction,
+        default=HYBRID_RETRIEVAL,
+        help=f"Build the BM25 index for hybrid retrieval (default: {HYBRID_RETRIEVAL}).",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
     setup_logging()
     print("Loading data from data/raw/ and building FAISS index (HuggingFace embeddings)...")
-    build_faiss_index()
+    build_faiss_index(
+        full_rebuild=args.full,
+        workers=args.workers,
+        batch_size=args.batch_size,
+        index_spec=args.index_spec,
+        ingest_workers=args.ingest_workers,
+        category_partitions=args.partitions,
+        dedup=args.dedup,
+        lexical_index=args.lexical,
+    )
     print("Done. Vector store saved to vector_store/faiss_index")
 
 
@@ -0,0 +1,46 @@
+"""
+Export the embedding model to ONNX with int8 dynamic quantization, for
+EMBEDDING_BACKEND=onnx. Needs torch, transformers and onnxruntime (only
+onnxruntime and tokenizers are needed afterwards to serve queries).
+
+Usage:
+    python scripts/export_onnx_model.py [--output-dir DIR]
+
+Then rebuild the index with EMBEDDING_BACKEND=onnx; the build checks the
+cosine drift of the ONNX vectors against the torch model on a sample of chunks.
+"""
+import argparse
+import sys
+from pathlib import Path
+
+# Ensure project root is on path
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from config.settings import ONNX_MODEL_DIR
+from src.embeddings import HF_EMBEDDING_MODEL_NAME
+from src.onnx_embeddings import export_onnx_model
+from src.utils import setup_logging
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Export the embedding model to int8 ONNX.")
+    parser.add_argument(
+        "--output-dir",
+        type=Path,
+        default=ONNX_MODEL_DIR,
+        help=f"Where to write the model and tokenizer (default: {ONNX_MODEL_DIR}).",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    setup_logging()
+    path = export_onnx_model(HF_EMBEDDING_MODEL_NAME, args.output_dir)
+    print(f"Done. Quantized model saved to {path}")
+    print("Set EMBEDDING_BACKEND=onnx and run: python scripts/build_vector_store.py")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,261 @@
+"""
+Medical AI Chatbot - headless HTTP API (JSON and Server-Sent Events).
+Run: python server.py [--host HOST] [--port PORT] [--workers N]
+
+Endpoints:
+    GET  /health       -> {"status": "ok", "pid": ..., "memory_mb": {"rss": ..., ...},
+                           "single_flight": {"in_flight": ..., "leaders": ..., "coalesced": ...}}
+    GET  /metrics      -> Prometheus text format (empty unless METRICS_ENABLED)
+    POST /chat         -> {"reply": "...", "error": null}
+    POST /chat/stream  -> text/event-stream: "token" events, then "done" or "error"
+
+Failed chats answer {"reply": "", "error": "..."} with status 400 (invalid
+message, or categories the index can't filter by), 503 (knowledge base not
+built yet), 502 (the LLM API failed) or 500. /chat/stream does the same for
+errors before the first token; later errors end the stream with an "error"
+event.
+
+Request body for both chat endpoints:
+    {"message": "...", "history": [["user", "..."], ["assistant", "..."]],
+     "categories": ["medication"],   # optional; needs CATEGORY_PARTITIONS
+     "session_id": "..."}            # optional; groups messages in the conversation log
+
+One RAG chain is shared by all requests in the process, and at most
+MAX_CONCURRENT_LLM_CALLS Groq calls run at once (others wait for a slot).
+With CONVERSATION_LOG_ENABLED, each exchange is queued for the background
+audit log writer (see src/conversation_log.py), which is flushed on shutdown.
+
+With --workers N (SERVER_WORKERS) > 1, the model and index are loaded once
+and N forked worker processes share them and one listening socket (see
+src/prefork.py); each worker has its own event loop and LLM slots.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import socket
+import uuid
+
+from aiohttp import web
+
+from config.settings import (
+    CHAT_HISTORY_LIMIT,
+    MAX_CONCURRENT_LLM_CALLS,
+    SERVER_HOST,
+    SERVER_PORT,
+    SERVER_WORKER_THREADS,
+    SERVER_WORKERS,
+)
+from src import metrics
+from src.chatbot import ChatError, achat_result, achat_stream
+from src.conversation_log import get_conversation_log
+from src.prefork import Prefork, process_memory, set_worker_threads
+from src.singleflight import get_single_flight
+from src.utils import setup_logging
+from src.warmup import load_warm_chain, start_warmup, warm_model
+
+logger = logging.getLogger(__name__)
+
+RAG_CHAIN = web.AppKey("rag_chain", object)
+LLM_SLOTS = web.AppKey("llm_slots", asyncio.Semaphore)
+
+# ChatError.kind -> HTTP status
+ERROR_STATUS = {"invalid": 400, "config": 400, "unavailable": 503, "upstream": 502, "internal": 500}
+
+
+def _parse_history(raw) -> list:
+    """Accept [[role, content], ...] or [{"role", "content"}, ...]; keep the last N."""
+    history = []
+    for item in raw or []:
+        if isinstance(item, dict):
+            role, content = item.get("role"), item.get("content")
+        else:
+            role, content = item
+        role = "user" if role == "user" else "assistant"
+        history.append((role, str(content)))
+    return history[-CHAT_HISTORY_LIMIT:]
+
+
+async def _read_request(request: web.Request) -> tuple:
+    try:
+        body = await request.json()
+        categories = body.get("categories") or None
+        if isinstance(categories, str):
+            categories = [categories]
+        elif categories is not None:
+            categories = [str(c) for c in categories]
+        session_id = str(body.get("session_id") or uuid.uuid4().hex)
+        return body.get("message"), _parse_history(body.get("history")), categories, session_id
+    except (ValueError, TypeError, AttributeError):
+        raise web.HTTPBadRequest(
+            text=json.dumps({"error": "Expected JSON body with a 'message' field."}),
+            content_type="application/json",
+        )
+
+
+async def _log_exchange(session_id: str, message, reply: str, error: str | None) -> None:
+    """
+    Queue the exchange for the audit log. Under the "block" overflow policy
+    a full queue makes log() wait, so it then runs off the event loop.
+    """
+    writer = get_conversation_log()
+    if writer is None:
+        return
+
+    def log() -> None:
+        writer.log(session_id, "user", str(message))
+        writer.log(session_id, "assistant", reply, error=error)
+
+    if writer.overflow == "block":
+        await asyncio.to_thread(log)
+    else:
+        log()
+
+
+async def health(request: web.Request) -> web.Response:
+    return web.json_response({
+        "status": "ok",
+        "pid": os.getpid(),
+        "memory_mb": process_memory(),
+        "single_flight": get_single_flight().stats(),
+    })
+
+
+async def metrics_endpoint(request: web.Request) -> web.Response:
+    return web.Response(
+        body=metrics.render_prometheus().encode("utf-8"),
+        headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"},
+    )
+
+
+async def chat_json(request: web.Request) -> web.Response:
+    message, history, categories, session_id = await _read_request(request)
+    reply, error = await achat_result(
+        message,
+        request.app[RAG_CHAIN],
+        conversation_history=history,
+        categories=categories,
+        llm_slots=request.app[LLM_SLOTS],
+    )
+    if error is None:
+        await _log_exchange(session_id, message, reply, None)
+        return web.json_response({"reply": reply, "error": None})
+    return await _error_response(session_id, message, error)
+
+
+async def _error_response(session_id: str, message, error: ChatError) -> web.Response:
+    await _log_exchange(session_id, message, "", str(error))
+    return web.json_response({"reply": "", "error": str(error)}, status=ERROR_STATUS.get(error.kind, 500))
+
+
+def _sse(event: str, data: dict) -> bytes:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n".encode("utf-8")
+
+
+async def chat_sse(request: web.Request) -> web.StreamResponse:
+    message, history, categories, session_id = await _read_request(request)
+    tokens = achat_stream(
+        message,
+        request.app[RAG_CHAIN],
+        conversation_history=history,
+        categories=categories,
+        llm_slots=request.app[LLM_SLOTS],
+    )
+    # Wait for the first token before sending headers, so that validation,
+    # missing-index and LLM connection errors still get their status code
+    try:
+        first = await anext(tokens)
+    except ChatError as e:
+        return await _error_response(session_id, message, e)
+    response = web.StreamResponse(headers={
+        "Content-Type": "text/event-stream",
+        "Cache-Control": "no-cache",
+    })
+    await response.prepare(request)
+    parts, error = [first], None
+    try:
+        await response.write(_sse("token", {"token": first}))
+        async for token in tokens:
+            parts.append(token)
+            await response.write(_sse("token", {"token": token}))
+        await response.write(_sse("done", {}))
+    except ChatError as e:
+        error = str(e)
+        await response.write(_sse("error", {"error": error}))
+    except ConnectionResetError:
+        logger.info("Client disconnected during stream")
+        error = "client disconnected"
+    await _log_exchange(session_id, message, "".join(parts), error)
+    return response
+
+
+def create_app(rag_chain=None, max_concurrent_llm_calls: int = MAX_CONCURRENT_LLM_CALLS) -> web.Application:
+    """Build the aiohttp app. The RAG chain is loaded once at startup if not given."""
+    app = web.Application()
+
+    async def on_startup(app: web.Application) -> None:
+        app[LLM_SLOTS] = asyncio.Semaphore(max_concurrent_llm_calls)
+        if rag_chain is None:
+            # Load and prime the model and index before taking traffic
+            app[RAG_CHAIN] = await asyncio.to_thread(start_warmup().wait)
+        else:
+            app[RAG_CHAIN] = rag_chain
+        logger.info("RAG chain ready (max %d concurrent LLM calls)", max_concurrent_llm_calls)
+
+    async def on_cleanup(app: web.Application) -> None:
+        writer = get_conversation_log()
+        if writer is not None:
+            await asyncio.to_thread(writer.close)
+
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+    app.router.add_get("/health", health)
+    app.router.add_get("/metrics", metrics_endpoint)
+    app.router.add_post("/chat", chat_json)
+    app.router.add_post("/chat/stream", chat_sse)
+    return app
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the Medical AI Chatbot over HTTP.")
+    parser.add_argument("--host", default=SERVER_HOST)
+    parser.add_argument("--port", type=int, default=SERVER_PORT)
+    parser.add_argument("--workers", type=int, default=SERVER_WORKERS,
+                        help="worker processes sharing one loaded model and index")
+    args = parser.parse_args(argv)
+    setup_logging(logging.INFO)
+    if args.workers > 1:
+        serve_prefork(args.host, args.port, args.workers)
+    else:
+        web.run_app(create_app(), host=args.host, port=args.port)
+
+
+def serve_prefork(host: str, port: int, workers: int, threads: int = SERVER_WORKER_THREADS) -> None:
+    """
+    Load the RAG chain once, then serve one socket from `workers` forked
+    processes. The parent only loads: running the model would start torch /
+    OpenMP thread pools, which do not survive fork() (workers can deadlock
+    in them) and would be sized for the whole machine. Each worker limits
+    its threads first and then runs the warm-up query itself.
+    """
+    threads = threads or max(1, (os.cpu_count() or 1) // workers)
+    timings: dict = {}
+    rag_chain = load_warm_chain(timings, query=None)
+    logger.info("Loaded the RAG chain in %s", ", ".join(f"{k} {v:.2f}s" for k, v in timings.items()))
+    sock = socket.create_server((host, port), reuse_port=False)
+    logger.info("Serving on http://%s:%d with %d workers (%d threads each)", host, port, workers, threads)
+
+    def worker() -> None:
+        set_worker_threads(threads)
+        warm_model()
+        web.run_app(create_app(rag_chain=rag_chain), sock=sock, print=None)
+
+    try:
+        Prefork(worker, workers).run()
+    finally:
+        sock.close()
+
+
+if __name__ == "__main__":
+    main()
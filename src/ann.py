@@ -0,0 +1,97 @@
+"""
+Approximate nearest-neighbour (ANN) index types for large corpora.
+
+The build always embeds into an exact flat index first. If an index spec
+other than "Flat" is configured (any faiss.index_factory string, e.g.
+"IVF256,Flat", "IVF256,PQ48", "HNSW32", "SQ8", "IVF256,SQ8"), the vectors are
+copied into that index (trained on a sample when needed) and a report of
+recall@k against the exact index and per-query latency is logged, so a
+speed/accuracy point can be chosen with data. nprobe / efSearch are applied
+when the index is loaded.
+"""
+import logging
+import time
+
+import faiss
+import numpy as np
+
+from config.settings import FAISS_EF_SEARCH, FAISS_NPROBE
+
+logger = logging.getLogger(__name__)
+
+FLAT_SPEC = "Flat"
+# Max vectors used to train IVF / PQ / SQ quantizers
+TRAIN_SAMPLE_SIZE = 50_000
+# Queries sampled from the corpus for the recall/latency report
+REPORT_QUERIES = 200
+
+
+def tune_index(index, nprobe: int = FAISS_NPROBE, ef_search: int = FAISS_EF_SEARCH) -> None:
+    """Set search-time parameters on index types that support them."""
+    params = faiss.ParameterSpace()
+    for name, value in (("nprobe", nprobe), ("efSearch", ef_search)):
+        try:
+            params.set_index_parameter(index, name, value)
+        except RuntimeError:
+            pass  # not applicable to this index type
+
+
+def _sample(n: int, size: int, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    return np.sort(rng.choice(n, size=min(n, size), replace=False))
+
+
+def _time_search(index, queries: np.ndarray, k: int):
+    started = time.perf_counter()
+    _, ids = index.search(queries, k)
+    return ids, (time.perf_counter() - started) / max(len(queries), 1)
+
+
+def recall_report(exact, approx, vectors: np.ndarray, k: int) -> dict:
+    """Compare `approx` to `exact` on queries sampled from `vectors`."""
+    queries = vectors[_sample(len(vectors), REPORT_QUERIES, seed=1)]
+    exact_ids, exact_latency = _time_search(exact, queries, k)
+    approx_ids, approx_latency = _time_search(approx, queries, k)
+    hits = sum(
+        len(set(e[e >= 0]) & set(a[a >= 0])) for e, a in zip(exact_ids, approx_ids)
+    )
+    expected = int((exact_ids >= 0).sum())
+    return {
+        "k": k,
+        "queries": len(queries),
+        f"recall@{k}": hits / expected if expected else 1.0,
+        "exact_ms_per_query": exact_latency * 1000,
+        "approx_ms_per_query": approx_latency * 1000,
+    }
+
+
+def build_ann_index(exact, index_spec: str, k: int = 4):
+    """
+    Return (index, report): `exact`'s vectors copied into an index built from
+    `index_spec`. Falls back to `exact` (report None) if the spec is "Flat"
+    or the corpus is too small to train the requested index.
+    """
+    if index_spec.strip().lower() == FLAT_SPEC.lower():
+        return exact, None
+    vectors = exact.reconstruct_n(0, exact.ntotal)
+    index = faiss.index_factory(exact.d, index_spec, exact.metric_type)
+    if not index.is_trained:
+        train = vectors[_sample(len(vectors), TRAIN_SAMPLE_SIZE)]
+        try:
+            index.train(train)
+        except RuntimeError as e:
+            logger.warning(
+                "Cannot train %r on %d vectors (%s); keeping the exact Flat index",
+                index_spec, len(train), e,
+            )
+            return exact, None
+    index.add(vectors)
+    tune_index(index)
+    report = recall_report(exact, index, vectors, k)
+    report["index_spec"] = index_spec
+    logger.info(
+        "ANN index %s: recall@%d=%.3f, %.3f ms/query (exact %.3f ms/query) over %d queries",
+        index_spec, k, report[f"recall@{k}"], report["approx_ms_per_query"],
+        report["exact_ms_per_query"], report["queries"],
+    )
+    return index, report
@@ -0,0 +1,156 @@
+"""
+Micro-batched retrieval: coalesce concurrent queries into one embed + search.
+
+Callers block in `RetrievalBatcher.search`. A background thread takes the
+first waiting query, collects more for up to `max_wait_ms` (or until
+`max_batch_size` queries are queued), embeds them with one batched
+`embed_documents` call, runs one multi-query FAISS search and hands each
+caller its own documents. Batch sizes are kept in a histogram (`stats()`)
+and, with metrics on, counted in retrieval_batches_total{size}.
+A forked child (see src.prefork) starts its own thread and queue for every
+live batcher (one at-fork hook for the module).
+close() stops the thread (e.g. when a hot swap retires the store); queries
+that still arrive afterwards are searched on the caller's thread.
+"""
+import logging
+import os
+import queue
+import threading
+import time
+import weakref
+from collections import Counter
+from concurrent.futures import Future
+from typing import List
+
+import numpy as np
+from langchain_core.documents import Document
+
+from config.settings import RETRIEVAL_BATCH_MAX_SIZE, RETRIEVAL_BATCH_MAX_WAIT_MS
+from src import metrics
+from src.lexical import rows_to_documents
+
+logger = logging.getLogger(__name__)
+
+_live_batchers: "weakref.WeakSet[RetrievalBatcher]" = weakref.WeakSet()
+
+
+def _restart_after_fork() -> None:
+    # The parent's batching threads did not come along into the child
+    for batcher in list(_live_batchers):
+        batcher._start()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_restart_after_fork)
+
+
+class RetrievalBatcher:
+    """Thread-safe batching front-end for a LangChain FAISS vector store."""
+
+    def __init__(
+        self,
+        vector_store,
+        k: int,
+        max_wait_ms: float = RETRIEVAL_BATCH_MAX_WAIT_MS,
+        max_batch_size: int = RETRIEVAL_BATCH_MAX_SIZE,
+    ):
+        self.vector_store = vector_store
+        self.k = k
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_batch_size = max(1, max_batch_size)
+        self.batch_sizes: Counter = Counter()
+        self._closed = False
+        self._start()
+        _live_batchers.add(self)
+
+    def _start(self) -> None:
+        if self._closed:
+            return
+        self._queue: "queue.Queue[tuple]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="retrieval-batcher", daemon=True)
+        self._thread.start()
+
+    def search_rows(self, query: str) -> List[int]:
+        """Return FAISS rows of the top-k chunks for `query` (blocks until its batch runs)."""
+        future: Future = Future()
+        with self._lock:
+            queued = not self._closed
+            if queued:
+                self._queue.put((query, future))
+        if not queued:
+            return self._search_many([query])[0]
+        return future.result()
+
+    def close(self) -> None:
+        """Stop the batching thread once the queries already queued are answered."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(None)
+        _live_batchers.discard(self)
+
+    def search(self, query: str) -> List[Document]:
+        """Return the top-k documents for `query`."""
+        return rows_to_documents(self.vector_store, self.search_rows(query))
+
+    def _collect(self) -> tuple:
+        """Return (batch, stop): the queries to search and whether close() was called."""
+        item = self._queue.get()
+        if item is None:
+            return [], True
+        batch = [item]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _run(self) -> None:
+        stop = False
+        while not stop:
+            batch, stop = self._collect()
+            if not batch:
+                continue
+            try:
+                results = self._search_many([q for q, _ in batch])
+            except Exception as e:
+                logger.exception("Batched retrieval failed: %s", e)
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            with self._lock:
+                self.batch_sizes[len(batch)] += 1
+            metrics.inc("retrieval_batches_total", size=str(len(batch)))
+            for (_, future), rows in zip(batch, results):
+                future.set_result(rows)
+
+    def _search_many(self, queries: List[str]) -> List[List[int]]:
+        store = self.vector_store
+        with metrics.span("retrieve.batch_embed"):
+            vectors = np.asarray(store.embeddings.embed_documents(queries), dtype=np.float32)
+        if getattr(store, "_normalize_L2", False):
+            vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        with metrics.span("retrieve.batch_search"):
+            _, indices = store.index.search(vectors, self.k)
+        return [[int(i) for i in row if i != -1] for row in indices]
+
+    def stats(self) -> dict:
+        """Histogram of batch sizes plus totals."""
+        with self._lock:
+            hist = dict(sorted(self.batch_sizes.items()))
+        batches = sum(hist.values())
+        queries = sum(size * n for size, n in hist.items())
+        return {
+            "batches": batches,
+            "queries": queries,
+            "mean_batch_size": queries / batches if batches else 0.0,
+            "batch_size_histogram": hist,
+        }
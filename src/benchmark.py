@@ -0,0 +1,409 @@
+"""
+Offline performance benchmark: no network, no Groq key, no model download.
+
+A synthetic corpus of configurable size is written to a temporary data
+directory, indexed with `build_faiss_index`, and queried through the real
+retrieval and `chat()` code paths. The LLM is replaced by `FakeChatModel`,
+a local chat model with configurable first-token latency and token rate, and
+embeddings default to LangChain's deterministic fake embeddings. Measured:
+
+- import time of the UI entry point and the chat stack (cold start)
+- index build throughput (chunks/sec)
+- retrieval latency (p50/p95/p99)
+- end-to-end `chat()` latency and throughput under N concurrent clients
+- safety rule check latency as the number of rules grows (microbenchmark)
+- peak RSS of the process (and of worker processes, if any)
+
+Results are plain dicts, written as JSON by scripts/benchmark.py so runs of
+different versions can be compared.
+"""
+import asyncio
+import json
+import platform
+import random
+import re
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, Iterator, List
+
+import numpy as np
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+RESULTS_VERSION = 1
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+# Modules whose import time is tracked: what the UI imports before its first
+# render, and the full chat stack loaded in the background
+COLD_START_MODULES = ("src.warmup", "src.chatbot")
+FAKE_EMBEDDING_SIZE = 384  # same width as all-MiniLM-L6-v2
+# Rule counts timed by the safety rule microbenchmark
+SAFETY_RULE_COUNTS = (10, 100, 1000)
+
+_TOPICS = [
+    "flu", "dehydration", "headache", "ibuprofen", "aspirin", "fever", "cough",
+    "diabetes", "metformin", "blood pressure", "allergies", "asthma", "sleep",
+    "vitamin d", "sunburn", "migraine", "insomnia", "back pain", "anxiety", "nausea",
+]
+_WORDS = (
+    "symptoms include rest fluids doctor pharmacist dose daily water hours "
+    "persistent severe mild common signs treatment avoid consult infection "
+    "viral chronic acute medication side effects children adults elderly "
+    "monitor increase reduce diet exercise healthy risk emergency care"
+).split()
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Local stand-in for the Groq chat model. Waits `latency_ms` before the
+    first token, then emits `response_tokens` words at `tokens_per_second`.
+    The reply is deterministic for a given prompt.
+    """
+
+    latency_ms: float = 200.0
+    tokens_per_second: float = 200.0
+    response_tokens: int = 60
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-benchmark"
+
+    def _words(self, messages: List[BaseMessage]) -> List[str]:
+        seed = sum(len(str(m.content)) for m in messages)
+        rng = random.Random(seed)
+        return [rng.choice(_WORDS) for _ in range(self.response_tokens)]
+
+    def _token_delay(self) -> float:
+        return 1.0 / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        words = self._words(messages)
+        time.sleep(self.latency_ms / 1000.0 + len(words) * self._token_delay())
+        message = AIMessage(content=" ".join(words) + ".")
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        words = self._words(messages)
+        await asyncio.sleep(self.latency_ms / 1000.0 + len(words) * self._token_delay())
+        message = AIMessage(content=" ".join(words) + ".")
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs) -> Iterator[ChatGenerationChunk]:
+        time.sleep(self.latency_ms / 1000.0)
+        words = self._words(messages)
+        for i, word in enumerate(words):
+            time.sleep(self._token_delay())
+            text = ("" if i == 0 else " ") + word + ("." if i == len(words) - 1 else "")
+            yield ChatGenerationChunk(message=AIMessageChunk(content=text))
+
+    async def _astream(
+        self, messages, stop=None, run_manager=None, **kwargs
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        await asyncio.sleep(self.latency_ms / 1000.0)
+        words = self._words(messages)
+        for i, word in enumerate(words):
+            await asyncio.sleep(self._token_delay())
+            text = ("" if i == 0 else " ") + word + ("." if i == len(words) - 1 else "")
+            yield ChatGenerationChunk(message=AIMessageChunk(content=text))
+
+
+@dataclass
+class BenchmarkConfig:
+    """Knobs for one benchmark run (all have CI-friendly defaults)."""
+    faq_entries: int = 2000
+    text_files: int = 20
+    paragraphs_per_file: int = 50
+    queries: int = 200
+    clients: int = 8
+    requests_per_client: int = 10
+    llm_latency_ms: float = 200.0
+    llm_tokens_per_second: float = 200.0
+    llm_response_tokens: int = 60
+    seed: int = 0
+
+
+def _sentence(rng: random.Random, topic: str, n: int) -> str:
+    return f"{topic.capitalize()} " + " ".join(rng.choice(_WORDS) for _ in range(n)) + "."
+
+
+def write_synthetic_corpus(data_dir: Path, config: BenchmarkConfig) -> List[str]:
+    """
+    Write FAQ JSON and text files into `data_dir`; returns the FAQ questions
+    (useful as realistic queries).
+    """
+    rng = random.Random(config.seed)
+    data_dir.mkdir(parents=True, exist_ok=True)
+    questions = []
+    per_file = 500
+    for start in range(0, config.faq_entries, per_file):
+        entries = []
+        for i in range(start, min(start + per_file, config.faq_entries)):
+            topic = rng.choice(_TOPICS)
+            question = f"What should I know about {topic} case {i}?"
+            questions.append(question)
+            entries.append({
+                "question": question,
+                "answer": " ".join(_sentence(rng, topic, 12) for _ in range(3)),
+                "category": topic,
+            })
+        (data_dir / f"faq_{start // per_file:04d}.json").write_text(json.dumps(entries), encoding="utf-8")
+    for f in range(config.text_files):
+        paragraphs = [
+            " ".join(_sentence(rng, rng.choice(_TOPICS), 15) for _ in range(4))
+            for _ in range(config.paragraphs_per_file)
+        ]
+        (data_dir / f"article_{f:04d}.txt").write_text("\n\n".join(paragraphs), encoding="utf-8")
+    return questions
+
+
+def make_queries(questions: List[str], n: int, seed: int = 0) -> List[str]:
+    """Paraphrase-like queries: FAQ questions with a trailing word swapped."""
+    rng = random.Random(seed + 1)
+    queries = []
+    for _ in range(n):
+        base = rng.choice(questions) if questions else f"Tell me about {rng.choice(_TOPICS)}"
+        queries.append(base.rstrip("?") + f" and {rng.choice(_WORDS)}?")
+    return queries
+
+
+def latency_summary(seconds: List[float]) -> Dict[str, float]:
+    """p50/p95/p99/mean/max in milliseconds."""
+    if not seconds:
+        return {"count": 0}
+    ms = np.asarray(seconds) * 1000.0
+    return {
+        "count": len(ms),
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p95_ms": float(np.percentile(ms, 95)),
+        "p99_ms": float(np.percentile(ms, 99)),
+        "mean_ms": float(ms.mean()),
+        "max_ms": float(ms.max()),
+    }
+
+
+def peak_rss_mb() -> Dict[str, float]:
+    """Peak resident set size of this process and of reaped children, in MiB."""
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    scale = 1 / (1024 * 1024) if sys.platform == "darwin" else 1 / 1024
+    return {
+        "self": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale,
+        "children": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale,
+    }
+
+
+def measure_import_time(module: str, top: int = 10) -> Dict[str, Any]:
+    """
+    Import `module` in a fresh interpreter with `python -X importtime` and
+    return its cumulative import time plus the `top` slowest dependencies.
+    """
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=PROJECT_ROOT, capture_output=True, text=True, check=True,
+    )
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|", 2)
+        if cumulative.strip().isdigit():
+            rows.append((int(cumulative) / 1000.0, name.rstrip()))
+    # Names are indented two spaces per nesting level; a module's imports are
+    # listed right before it
+    def depth(name: str) -> int:
+        return (len(name) - len(name.lstrip()) - 1) // 2
+
+    end = next((i for i in range(len(rows) - 1, -1, -1) if rows[i][1].strip() == module), None)
+    if end is None:
+        return {"import_ms": 0.0, "slowest": []}
+    begin = end
+    while begin > 0 and depth(rows[begin - 1][1]) > depth(rows[end][1]):
+        begin -= 1
+    children = [
+        (ms, name.strip()) for ms, name in rows[begin:end]
+        if depth(name) == depth(rows[end][1]) + 1
+    ]
+    slowest = sorted(children, reverse=True)[:top]
+    return {"import_ms": rows[end][0], "slowest": [{"module": n, "ms": ms} for ms, n in slowest]}
+
+
+def bench_cold_start(modules=COLD_START_MODULES) -> Dict[str, Any]:
+    """Import time of each module in `modules`, each in a fresh interpreter."""
+    results: Dict[str, Any] = {}
+    for module in modules:
+        measured = measure_import_time(module)
+        results[f"{module}.import_ms"] = measured["import_ms"]
+        results[f"{module}.slowest"] = measured["slowest"]
+    return results
+
+
+def bench_build(data_dir: Path, persist_path: Path, embeddings) -> Dict[str, Any]:
+    """Full index build over `data_dir`."""
+    from src.embeddings import build_faiss_index
+
+    started = time.perf_counter()
+    store = build_faiss_index(
+        data_dir=data_dir, persist_path=persist_path, embeddings=embeddings, full_rebuild=True
+    )
+    seconds = time.perf_counter() - started
+    chunks = store.index.ntotal
+    return {"chunks": chunks, "seconds": seconds, "chunks_per_sec": chunks / max(seconds, 1e-9)}
+
+
+def bench_retrieval(retrieve, queries: List[str]) -> Dict[str, Any]:
+    """Sequential retrieval latency."""
+    retrieve(queries[0])  # warm-up
+    timings = []
+    for q in queries:
+        started = time.perf_counter()
+        retrieve(q)
+        timings.append(time.perf_counter() - started)
+    return latency_summary(timings)
+
+
+def bench_chat(chain, queries: List[str], clients: int, requests_per_client: int) -> Dict[str, Any]:
+    """End-to-end `chat()` with `clients` concurrent callers."""
+    from src.chatbot import chat
+
+    def client(offset: int) -> List[float]:
+        timings = []
+        for i in range(requests_per_client):
+            q = queries[(offset * requests_per_client + i) % len(queries)]
+            started = time.perf_counter()
+            _, err = chat(q, chain, conversation_history=[])
+            if err:
+                raise RuntimeError(err)
+            timings.append(time.perf_counter() - started)
+        return timings
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        results = list(pool.map(client, range(clients)))
+    wall = time.perf_counter() - started
+    timings = [t for r in results for t in r]
+    summary = latency_summary(timings)
+    summary.update({
+        "clients": clients,
+        "wall_seconds": wall,
+        "requests_per_sec": len(timings) / max(wall, 1e-9),
+    })
+    return summary
+
+
+def synthetic_safety_rules(n: int, seed: int = 0) -> List[Dict[str, Any]]:
+    """
+    `n` safety rules, alternately five phrases or one regex, over made-up
+    words, so they never match the queries and every check scans everything.
+    """
+    rng = random.Random(seed)
+    syllables = ("ka", "lo", "mi", "ra", "tu", "ve", "zo", "ni", "pe", "su", "qa", "xi")
+
+    def word() -> str:
+        return "".join(rng.choice(syllables) for _ in range(3))
+
+    rules = []
+    for i in range(n):
+        if i % 2:
+            rules.append({"id": f"phrase-{i}", "phrases": [f"{word()} {word()}" for _ in range(5)]})
+        else:
+            rules.append({"id": f"pattern-{i}", "pattern": rf"\b{word()}{word()}\s*\d+"})
+    return rules
+
+
+def _check_us(check, queries: List[str]) -> List[float]:
+    timings = []
+    for q in queries:
+        started = time.perf_counter()
+        check(q)
+        timings.append((time.perf_counter() - started) * 1e6)
+    return timings
+
+
+def bench_safety(queries: List[str], rule_counts=SAFETY_RULE_COUNTS) -> Dict[str, Any]:
+    """
+    SafetyEngine.check latency in microseconds for each rule count, next to
+    a per-pattern `re.search` loop over the same regex rules (the old check).
+    """
+    from src.safety import SafetyEngine
+
+    results: Dict[str, Any] = {}
+    for n in rule_counts:
+        rules = synthetic_safety_rules(n)
+        started = time.perf_counter()
+        engine = SafetyEngine(rules)
+        results[f"rules_{n}.compile_ms"] = (time.perf_counter() - started) * 1000.0
+        engine.check(queries[0])  # warm-up
+        us = np.asarray(_check_us(engine.check, queries))
+        results[f"rules_{n}.p50_us"] = float(np.percentile(us, 50))
+        results[f"rules_{n}.p99_us"] = float(np.percentile(us, 99))
+
+        patterns = [re.compile(r["pattern"], re.IGNORECASE) for r in rules if "pattern" in r]
+        loop = np.asarray(_check_us(lambda q: any(p.search(q) for p in patterns), queries))
+        results[f"rules_{n}.regex_loop_p50_us"] = float(np.percentile(loop, 50))
+    return results
+
+
+def run_benchmark(config: BenchmarkConfig, embeddings=None, workdir: Path | None = None) -> Dict[str, Any]:
+    """Run every stage and return the results dict."""
+    from src.lexical import load_lexical_index
+    from src.rag import _build_retriever, build_rag_chain
+
+    embeddings = embeddings or DeterministicFakeEmbedding(size=FAKE_EMBEDDING_SIZE)
+    llm = FakeChatModel(
+        latency_ms=config.llm_latency_ms,
+        tokens_per_second=config.llm_tokens_per_second,
+        response_tokens=config.llm_response_tokens,
+    )
+    with tempfile.TemporaryDirectory(dir=workdir) as tmp:
+        data_dir, persist_path = Path(tmp) / "raw", Path(tmp) / "index"
+        questions = write_synthetic_corpus(data_dir, config)
+        queries = make_queries(questions, max(1, config.queries), config.seed)
+
+        build = bench_build(data_dir, persist_path, embeddings)
+        from src.embeddings import load_faiss_index
+        store = load_faiss_index(persist_path, embeddings)
+        lexical = load_lexical_index(persist_path)
+        retrieval = bench_retrieval(_build_retriever(store, lexical, False), queries)
+        chain = build_rag_chain(store, batch_retrieval=False, lexical_index=lexical, llm=llm)
+        chat_results = bench_chat(chain, queries, max(1, config.clients), config.requests_per_client)
+        safety = bench_safety(queries)
+
+    return {
+        "version": RESULTS_VERSION,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": asdict(config),
+        "cold_start": bench_cold_start(),
+        "build": build,
+        "retrieval": retrieval,
+        "chat": chat_results,
+        "safety": safety,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+# Metrics where a larger value is better (everything else: smaller is better)
+_HIGHER_IS_BETTER = ("chunks_per_sec", "requests_per_sec")
+
+
+def compare_results(baseline: Dict[str, Any], current: Dict[str, Any]) -> List[str]:
+    """Human-readable per-metric change lines (current vs baseline)."""
+    lines = []
+    for section in ("cold_start", "build", "retrieval", "chat", "safety", "peak_rss_mb"):
+        old, new = baseline.get(section, {}), current.get(section, {})
+        for key, value in new.items():
+            base = old.get(key)
+            if not isinstance(value, (int, float)) or not isinstance(base, (int, float)) or not base:
+                continue
+            change = (value - base) / base * 100.0
+            better = change > 0 if key in _HIGHER_IS_BETTER else change < 0
+            verdict = "better" if better else "worse" if change else "same"
+            lines.append(f"{section}.{key}: {base:.2f} -> {value:.2f} ({change:+.1f}%, {verdict})")
+    return lines
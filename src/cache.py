@@ -0,0 +1,217 @@
+"""
+Semantic answer cache: reuse answers for questions that mean the same thing.
+
+Incoming questions are embedded with the shared embedding model from
+`src.embeddings`. If a recently answered question is close enough (cosine
+similarity above SEMANTIC_CACHE_THRESHOLD), its answer is returned and the
+LLM call is skipped. Entries are evicted LRU-first, expire after a TTL, and
+the whole cache is cleared when the FAISS index on disk is rebuilt. Each
+entry records the index version it was answered from; an answer whose
+lookup saw an older version than the current one is not stored, so a
+request that retrieved from the old index cannot repopulate the cache
+after a swap.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+import numpy as np
+
+from config.settings import (
+    SEMANTIC_CACHE_ENABLED,
+    SEMANTIC_CACHE_MAX_ENTRIES,
+    SEMANTIC_CACHE_THRESHOLD,
+    SEMANTIC_CACHE_TTL_SECONDS,
+)
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class CacheEntry:
+    question: str
+    vector: np.ndarray
+    answer: str
+    created_at: float
+    index_version: Optional[str] = None
+
+
+@dataclass
+class CacheLookup:
+    """Result of a cache lookup. `vector` and `index_version` can be passed back to `store`."""
+    answer: Optional[str]
+    vector: Optional[np.ndarray]
+    similarity: float = 0.0
+    index_version: Optional[str] = None
+
+
+class SemanticCache:
+    """
+    Size-bounded LRU/TTL cache of answers keyed by question embeddings.
+    Thread-safe; one instance is shared per process (see get_semantic_cache).
+    """
+
+    def __init__(
+        self,
+        embeddings=None,
+        threshold: float = SEMANTIC_CACHE_THRESHOLD,
+        max_entries: int = SEMANTIC_CACHE_MAX_ENTRIES,
+        ttl_seconds: float = SEMANTIC_CACHE_TTL_SECONDS,
+        index_version_fn: Callable[[], Optional[str]] | None = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self._embeddings = embeddings
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._index_version_fn = index_version_fn
+        self._clock = clock
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._matrix: Optional[np.ndarray] = None
+        self._keys: list = []
+        self._lock = threading.Lock()
+        self._index_version = index_version_fn() if index_version_fn else None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.stale_stores = 0
+
+    @property
+    def embeddings(self):
+        if self._embeddings is None:
+            from src.embeddings import get_embeddings
+            self._embeddings = get_embeddings()
+        return self._embeddings
+
+    def _embed(self, question: str) -> np.ndarray:
+        vec = np.asarray(self.embeddings.embed_query(question), dtype=np.float32)
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm > 0 else vec
+
+    def _check_index_version(self) -> None:
+        """Drop everything if the index was rebuilt since entries were stored."""
+        if self._index_version_fn is None:
+            return
+        version = self._index_version_fn()
+        if version != self._index_version:
+            if self._entries:
+                logger.info("Index changed (%s -> %s); clearing semantic cache",
+                            self._index_version, version)
+            self._clear_locked()
+            self.invalidations += 1
+            self._index_version = version
+
+    def _clear_locked(self) -> None:
+        self._entries.clear()
+        self._matrix = None
+        self._keys = []
+
+    def _expire_locked(self, now: float) -> None:
+        if self.ttl_seconds <= 0:
+            return
+        expired = [k for k, e in self._entries.items() if now - e.created_at > self.ttl_seconds]
+        for k in expired:
+            del self._entries[k]
+        if expired:
+            self._matrix = None
+
+    def _ensure_matrix_locked(self) -> None:
+        if self._matrix is None:
+            self._keys = list(self._entries.keys())
+            self._matrix = (
+                np.vstack([self._entries[k].vector for k in self._keys])
+                if self._keys else None
+            )
+
+    def lookup(self, question: str) -> CacheLookup:
+        """Return the cached answer for the nearest question, or answer=None on a miss."""
+        vector = self._embed(question)
+        with self._lock:
+            self._check_index_version()
+            self._expire_locked(self._clock())
+            self._ensure_matrix_locked()
+            if self._matrix is not None:
+                sims = self._matrix @ vector
+                best = int(np.argmax(sims))
+                similarity = float(sims[best])
+                if similarity >= self.threshold:
+                    key = self._keys[best]
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return CacheLookup(self._entries[key].answer, vector, similarity, self._index_version)
+            self.misses += 1
+            return CacheLookup(None, vector, index_version=self._index_version)
+
+    def store(
+        self,
+        question: str,
+        answer: str,
+        vector: Optional[np.ndarray] = None,
+        index_version: Optional[str] = None,
+    ) -> None:
+        """
+        Cache an answer. Pass the vector from `lookup` to avoid re-embedding,
+        and its index_version: if the index changed since that lookup, the
+        answer may come from the old index and is not stored.
+        """
+        if vector is None:
+            vector = self._embed(question)
+        key = question.strip().lower()
+        with self._lock:
+            self._check_index_version()
+            if index_version is not None and index_version != self._index_version:
+                self.stale_stores += 1
+                logger.debug("Not caching an answer from index version %s (now %s)",
+                             index_version, self._index_version)
+                return
+            self._entries[key] = CacheEntry(question, vector, answer, self._clock(), self._index_version)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+            self._matrix = None
+
+    def invalidate(self) -> None:
+        """Clear all entries (e.g. after rebuilding the index in-process)."""
+        with self._lock:
+            self._clear_locked()
+            self.invalidations += 1
+            if self._index_version_fn is not None:
+                self._index_version = self._index_version_fn()
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "stale_stores": self.stale_stores,
+            }
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+_cache: Optional[SemanticCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_semantic_cache() -> Optional[SemanticCache]:
+    """Return the process-wide semantic cache, or None if disabled in settings."""
+    global _cache
+    if not SEMANTIC_CACHE_ENABLED:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                from src.embeddings import get_index_version
+                _cache = SemanticCache(index_version_fn=get_index_version)
+    return _cache
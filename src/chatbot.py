@@ -1,65 +1,406 @@
 """
 Chatbot orchestration: validation, RAG query, disclaimers, and conversation logging.
 """
+import asyncio
+import contextlib
 import logging
-from typing import List, Tuple
+from typing import AsyncIterator, Iterator, List, Sequence, Tuple
 
-from src.utils import validate_query, sanitize_for_display
-from src.rag import build_rag_chain, query_rag
+from config.settings import DISCLAIMER_FOOTER
+from src import metrics
+from src.history import ConversationHistory
+from src.utils import StreamSanitizer, validate_query, sanitize_for_display
+from src.rag import aquery_rag, astream_rag, build_rag_chain, query_rag, stream_rag
+from src.cache import get_semantic_cache
+from src.faq import get_faq_lookup
+from src.singleflight import FlightAbandoned, flight_key, get_single_flight
 
 logger = logging.getLogger(__name__)
 
-# Footer appended to every bot reply for safety
-DISCLAIMER_FOOTER = (
-    "\n\n— This is for general information only, not medical advice. "
-    "Please consult a healthcare provider for your situation."
-)
-
 
 def get_chatbot_chain():
     """Build and return the RAG chain (lazy load vector store)."""
     return build_rag_chain()
 
 
+NO_ANSWER_MESSAGE = (
+    "I couldn't find enough relevant information to answer that. "
+    "Please rephrase or consult a healthcare provider."
+)
+
+
+class ChatError(Exception):
+    """
+    A user-facing error message, raised by chat_stream and returned by
+    achat_result. `kind` says what failed: "invalid" (the message failed
+    validation), "config" (a request the index can't serve, e.g. unknown
+    categories), "unavailable" (no knowledge base yet, or a shared answer
+    was abandoned), "upstream" (the LLM API failed) or "internal".
+    """
+
+    def __init__(self, message: str, kind: str = "internal"):
+        super().__init__(message)
+        self.kind = kind
+
+
+# Top-level packages of the LLM API clients; their errors are "upstream"
+_UPSTREAM_ERROR_PACKAGES = ("groq", "httpx")
+
+
+def _chat_error(e: Exception) -> ChatError:
+    """Log a RAG failure and return the error to show the user."""
+    if isinstance(e, FileNotFoundError):
+        logger.exception("Vector store not found: %s", e)
+        return ChatError(
+            "The knowledge base is not ready. Please run: python scripts/build_vector_store.py", "unavailable"
+        )
+    if isinstance(e, ValueError):
+        logger.warning("Configuration error: %s", e)
+        return ChatError(str(e), "config")
+    if isinstance(e, FlightAbandoned):
+        logger.warning("Shared answer abandoned: %s", e)
+        return ChatError("The answer to this question was interrupted. Please try again.", "unavailable")
+    logger.exception("RAG query failed: %s", e)
+    kind = "upstream" if type(e).__module__.split(".")[0] in _UPSTREAM_ERROR_PACKAGES else "internal"
+    return ChatError("Something went wrong while answering. Please try again or rephrase your question.", kind)
+
+
+def _faq_reply(user_message: str, categories=None) -> str | None:
+    """
+    Curated reply if the message is a known FAQ question, else None.
+    Category-restricted questions skip the fast path (entries may belong to
+    other categories), as they skip the semantic cache.
+    """
+    if categories:
+        return None
+    try:
+        with metrics.span("faq_lookup"):
+            faq = get_faq_lookup()
+            entry = faq.match(user_message) if faq is not None else None
+    except Exception as e:
+        logger.warning("FAQ lookup failed: %s", e)
+        return None
+    if faq is not None:
+        metrics.inc("cache_lookups_total", cache="faq", result="miss" if entry is None else "hit")
+    if entry is None:
+        return None
+    logger.info("FAQ fast path hit: %r (%s)", entry["question"], entry["category"])
+    return sanitize_for_display(entry["answer"]) + DISCLAIMER_FOOTER
+
+
+def _cache_lookup(user_message: str, conversation_history, categories=None):
+    """Return (cache, lookup) for standalone, unfiltered questions, or (None, None)."""
+    cache = get_semantic_cache() if not conversation_history and not categories else None
+    if cache is None:
+        return None, None
+    try:
+        with metrics.span("cache_lookup"):
+            lookup = cache.lookup(user_message)
+    except Exception as e:
+        logger.warning("Semantic cache lookup failed: %s", e)
+        return cache, None
+    metrics.inc(
+        "cache_lookups_total", cache="semantic",
+        result="hit" if lookup.answer is not None else "miss",
+    )
+    return cache, lookup
+
+
+def _store_streamed(cache, lookup, user_message: str, tokens: List[str]) -> None:
+    """
+    Cache a streamed answer in the form chat() caches it: the raw answer,
+    stripped, before display sanitizing. Callers skip answers the sanitizer
+    cut off, since the rest of the raw text was never read.
+    """
+    cache.store(
+        user_message, "".join(tokens).strip(), vector=lookup.vector, index_version=lookup.index_version
+    )
+
+
+def _validate(user_message: str) -> tuple[bool, str]:
+    with metrics.span("validate"):
+        return validate_query(user_message)
+
+
 def chat(
     user_message: str,
     rag_chain,
-    conversation_history: List[Tuple[str, str]] | None = None,
+    conversation_history: List[Tuple[str, str]] | ConversationHistory | None = None,
+    categories: Sequence[str] | None = None,
 ) -> Tuple[str, str | None]:
     """
     Process one user message and return (bot_reply, error_message).
     If error_message is not None, bot_reply may be empty or a fallback message.
+
+    Known FAQ questions get their curated answer without calling the LLM.
+    Standalone questions (no conversation history) are served from the
+    semantic answer cache when a near-identical question was answered recently.
+    Identical questions (same history and categories) asked while one is
+    already being answered share its LLM call (see src.singleflight).
+    `conversation_history` is a list of (role, content) pairs or a
+    ConversationHistory, which keeps its compacted prompt messages between turns.
+    `categories` restricts retrieval to those FAQ categories (needs an index
+    built with category partitions) and bypasses the semantic cache.
+    Each stage is timed when metrics are enabled (see src.metrics).
+    """
+    with metrics.request_trace("chat") as trace:
+        is_valid, err = _validate(user_message)
+        if not is_valid:
+            trace.set_outcome("invalid")
+            return "", err
+        faq_reply = _faq_reply(user_message, categories)
+        if faq_reply is not None:
+            trace.set_outcome("faq")
+            return faq_reply, None
+
+        conversation_history = conversation_history or []
+        cache, lookup = _cache_lookup(user_message, conversation_history, categories)
+        if lookup is not None and lookup.answer is not None:
+            logger.info("Semantic cache hit (similarity %.3f)", lookup.similarity)
+            trace.set_outcome("cache")
+            return sanitize_for_display(lookup.answer) + DISCLAIMER_FOOTER, None
+        try:
+            answer = get_single_flight().call(
+                flight_key(user_message, rag_chain, conversation_history, categories),
+                lambda: query_rag(
+                    user_message, rag_chain, chat_history=conversation_history, categories=categories
+                ).get("answer", ""),
+            )
+            with metrics.span("postprocess"):
+                answer = answer.strip()
+                if not answer:
+                    trace.set_outcome("no_answer")
+                    answer = NO_ANSWER_MESSAGE
+                elif lookup is not None:
+                    cache.store(
+                        user_message, answer, vector=lookup.vector, index_version=lookup.index_version
+                    )
+                # Keep responses user-friendly and append disclaimer
+                answer = sanitize_for_display(answer)
+                answer = answer + DISCLAIMER_FOOTER
+            return answer, None
+        except Exception as e:
+            trace.set_outcome("error")
+            return "", str(_chat_error(e))
+
+
+def chat_stream(
+    user_message: str,
+    rag_chain,
+    conversation_history: List[Tuple[str, str]] | ConversationHistory | None = None,
+    categories: Sequence[str] | None = None,
+) -> Iterator[str]:
     """
-    is_valid, err = validate_query(user_message)
+    Streaming variant of chat: yields reply text as the LLM generates it,
+    sanitized on the fly and followed by DISCLAIMER_FOOTER.
+    Raises ChatError with a user-facing message on invalid input or failure.
+    """
+    return metrics.traced_stream(
+        "chat_stream",
+        lambda trace: _chat_stream(trace, user_message, rag_chain, conversation_history, categories),
+    )
+
+
+def _chat_stream(
+    trace,
+    user_message: str,
+    rag_chain,
+    conversation_history: List[Tuple[str, str]] | ConversationHistory | None = None,
+    categories: Sequence[str] | None = None,
+) -> Iterator[str]:
+    is_valid, err = _validate(user_message)
     if not is_valid:
-        return "", err
+        trace.set_outcome("invalid")
+        raise ChatError(err, "invalid")
+    faq_reply = _faq_reply(user_message, categories)
+    if faq_reply is not None:
+        trace.set_outcome("faq")
+        yield faq_reply
+        return
 
     conversation_history = conversation_history or []
+    cache, lookup = _cache_lookup(user_message, conversation_history, categories)
+    if lookup is not None and lookup.answer is not None:
+        logger.info("Semantic cache hit (similarity %.3f)", lookup.similarity)
+        trace.set_outcome("cache")
+        yield sanitize_for_display(lookup.answer) + DISCLAIMER_FOOTER
+        return
+    sanitizer = StreamSanitizer()
+    raw, shown = [], False
     try:
-        result = query_rag(user_message, rag_chain, chat_history=conversation_history)
-        answer = result.get("answer", "").strip()
-        if not answer:
-            answer = (
-                "I couldn't find enough relevant information to answer that. "
-                "Please rephrase or consult a healthcare provider."
-            )
-        # Keep responses user-friendly and append disclaimer
-        answer = sanitize_for_display(answer)
-        answer = answer + DISCLAIMER_FOOTER
-        return answer, None
-    except FileNotFoundError as e:
-        logger.exception("Vector store not found: %s", e)
-        return "", (
-            "The knowledge base is not ready. Please run: python scripts/build_vector_store.py"
+        tokens = get_single_flight().stream(
+            flight_key(user_message, rag_chain, conversation_history, categories),
+            lambda: stream_rag(
+                user_message, rag_chain, chat_history=conversation_history, categories=categories
+            ),
         )
-    except ValueError as e:
-        logger.warning("Configuration error: %s", e)
-        return "", str(e)
+        for token in tokens:
+            raw.append(token or "")
+            piece = sanitizer.feed(token)
+            if piece:
+                shown = True
+                yield piece
+            if sanitizer.done:
+                break
     except Exception as e:
-        logger.exception("RAG query failed: %s", e)
-        return "", (
-            "Something went wrong while answering. Please try again or rephrase your question."
-        )
+        raise _chat_error(e) from e
+    truncated = sanitizer.done
+    rest = sanitizer.finish()
+    if rest:
+        shown = True
+        yield rest
+    if not shown:
+        trace.set_outcome("no_answer")
+        yield NO_ANSWER_MESSAGE
+    elif lookup is not None and not truncated:
+        _store_streamed(cache, lookup, user_message, raw)
+    yield DISCLAIMER_FOOTER
+
+
+async def achat(
+    user_message: str,
+    rag_chain,
+    conversation_history: List[Tuple[str, str]] | ConversationHistory | None = None,
+    categories: Sequence[str] | None = None,
+    llm_slots: asyncio.Semaphore | None = None,
+) -> Tuple[str, str | None]:
+    """
+    Async variant of chat. If `llm_slots` is given, the LLM call waits for a
+    free slot so the number of in-flight Groq requests stays bounded;
+    requests that share an identical in-flight call do not take a slot.
+    """
+    reply, error = await achat_result(user_message, rag_chain, conversation_history, categories, llm_slots)
+    return reply, None if error is None else str(error)
+
+
+async def achat_result(
+    user_message: str,
+    rag_chain,
+    conversation_history: List[Tuple[str, str]] | ConversationHistory | None = None,
+    categories: Sequence[str] | None = None,
+    llm_slots: asyncio.Semaphore | None = None,
+) -> Tuple[str, ChatError | None]:
+    """Like achat, but returns the error as a ChatError (with its kind)."""
+    with metrics.request_trace("chat") as trace:
+        is_valid, err = _validate(user_message)
+        if not is_valid:
+            trace.set_outcome("invalid")
+            return "", ChatError(err, "invalid")
+        faq_reply = await asyncio.to_thread(_faq_reply, user_message, categories)
+        if faq_reply is not None:
+            trace.set_outcome("faq")
+            return faq_reply, None
+
+        conversation_history = conversation_history or []
+        cache, lookup = await asyncio.to_thread(_cache_lookup, user_message, conversation_history, categories)
+        if lookup is not None and lookup.answer is not None:
+            logger.info("Semantic cache hit (similarity %.3f)", lookup.similarity)
+            trace.set_outcome("cache")
+            return sanitize_for_display(lookup.answer) + DISCLAIMER_FOOTER, None
+
+        async def generate() -> str:
+            async with llm_slots or contextlib.nullcontext():
+                result = await aquery_rag(
+                    user_message, rag_chain, chat_history=conversation_history, categories=categories
+                )
+            return result.get("answer", "")
+
+        try:
+            answer = await get_single_flight().acall(
+                flight_key(user_message, rag_chain, conversation_history, categories), generate
+            )
+            with metrics.span("postprocess"):
+                answer = answer.strip()
+                if not answer:
+                    trace.set_outcome("no_answer")
+                    answer = NO_ANSWER_MESSAGE
+                elif lookup is not None:
+                    cache.store(
+                        user_message, answer, vector=lookup.vector, index_version=lookup.index_version
+                    )
+                answer = sanitize_for_display(answer)
+            return answer + DISCLAIMER_FOOTER, None
+        except Exception as e:
+            trace.set_outcome("error")
+            return "", _chat_error(e)
+
+
+def achat_stream(
+    user_message: str,
+    rag_chain,
+    conversation_history: List[Tuple[str, str]] | ConversationHistory | None = None,
+    categories: Sequence[str] | None = None,
+    llm_slots: asyncio.Semaphore | None = None,
+) -> AsyncIterator[str]:
+    """
+    Async variant of chat_stream. The LLM slot (if any) is held for the
+    whole stream. Raises ChatError with a user-facing message on failure.
+    """
+    return metrics.atraced_stream(
+        "chat_stream",
+        lambda trace: _achat_stream(trace, user_message, rag_chain, conversation_history, categories, llm_slots),
+    )
+
+
+async def _achat_stream(
+    trace,
+    user_message: str,
+    rag_chain,
+    conversation_history: List[Tuple[str, str]] | ConversationHistory | None = None,
+    categories: Sequence[str] | None = None,
+    llm_slots: asyncio.Semaphore | None = None,
+) -> AsyncIterator[str]:
+    is_valid, err = _validate(user_message)
+    if not is_valid:
+        trace.set_outcome("invalid")
+        raise ChatError(err, "invalid")
+    faq_reply = await asyncio.to_thread(_faq_reply, user_message, categories)
+    if faq_reply is not None:
+        trace.set_outcome("faq")
+        yield faq_reply
+        return
+
+    conversation_history = conversation_history or []
+    cache, lookup = await asyncio.to_thread(_cache_lookup, user_message, conversation_history, categories)
+    if lookup is not None and lookup.answer is not None:
+        logger.info("Semantic cache hit (similarity %.3f)", lookup.similarity)
+        trace.set_outcome("cache")
+        yield sanitize_for_display(lookup.answer) + DISCLAIMER_FOOTER
+        return
+
+    async def generate() -> AsyncIterator[str]:
+        async with llm_slots or contextlib.nullcontext():
+            async for token in astream_rag(
+                user_message, rag_chain, chat_history=conversation_history, categories=categories
+            ):
+                yield token
+
+    sanitizer = StreamSanitizer()
+    raw, shown = [], False
+    try:
+        async for token in get_single_flight().astream(
+            flight_key(user_message, rag_chain, conversation_history, categories), generate
+        ):
+            raw.append(token or "")
+            piece = sanitizer.feed(token)
+            if piece:
+                shown = True
+                yield piece
+            if sanitizer.done:
+                break
+    except Exception as e:
+        raise _chat_error(e) from e
+    truncated = sanitizer.done
+    rest = sanitizer.finish()
+    if rest:
+        shown = True
+        yield rest
+    if not shown:
+        trace.set_outcome("no_answer")
+        yield NO_ANSWER_MESSAGE
+    elif lookup is not None and not truncated:
+        _store_streamed(cache, lookup, user_message, raw)
+    yield DISCLAIMER_FOOTER
 
 
 def get_disclaimer() -> str:
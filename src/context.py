@@ -0,0 +1,153 @@
+"""
+Context packing: turn retrieved chunks into a compact, token-budgeted prompt.
+
+Chunks overlap by CHUNK_OVERLAP characters, so neighbouring hits from the
+same file repeat text, and near-identical FAQ entries are often retrieved
+together. `pack_context` merges overlapping or touching chunks of the same
+source (using the `part` / `start_index` metadata written at ingest), drops
+near-duplicates and then fills CONTEXT_TOKEN_BUDGET in relevance order using
+the `n_tokens` counts precomputed at ingest. Tokens saved versus joining the
+raw chunks are logged per request.
+"""
+import logging
+from dataclasses import dataclass
+from typing import List, Sequence
+
+from langchain_core.documents import Document
+
+from config.settings import CONTEXT_DEDUP_THRESHOLD, CONTEXT_TOKEN_BUDGET
+from src import metrics
+from src.faq import normalize_question
+from src.utils import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+CONTEXT_SEPARATOR = "\n\n"
+# Word n-gram size used for near-duplicate detection
+SHINGLE_SIZE = 3
+
+
+@dataclass(eq=False)
+class _Span:
+    """A run of text from one source part, built from one or more chunks."""
+    source: str
+    part: int | None
+    start: int | None
+    text: str
+    tokens: int
+
+    @property
+    def end(self) -> int:
+        return self.start + len(self.text)
+
+
+def _chunk_tokens(doc: Document) -> int:
+    n = doc.metadata.get("n_tokens")
+    return n if isinstance(n, int) else estimate_tokens(doc.page_content)
+
+
+def _to_span(doc: Document) -> _Span:
+    meta = doc.metadata
+    start = meta.get("start_index")
+    part = meta.get("part")
+    positioned = isinstance(start, int) and start >= 0 and isinstance(part, int)
+    return _Span(
+        source=meta.get("source", ""),
+        part=part if positioned else None,
+        start=start if positioned else None,
+        text=doc.page_content,
+        tokens=_chunk_tokens(doc),
+    )
+
+
+def _merge_into(span: _Span, other: _Span) -> bool:
+    """Extend `span` with `other` if they overlap or touch; returns True if merged."""
+    if span.part is None or other.part is None:
+        return False
+    if (span.source, span.part) != (other.source, other.part):
+        return False
+    # Order the pair by position; the splitter strips whitespace at chunk
+    # edges, so a gap of a couple of characters still counts as touching
+    first, second = (span, other) if span.start <= other.start else (other, span)
+    gap = second.start - first.end
+    if gap > 2:
+        return False
+    if second.end <= first.end:
+        text = first.text
+    elif gap > 0:
+        text = first.text + "\n" + second.text
+    else:
+        text = first.text + second.text[first.end - second.start:]
+    span.start, span.text = first.start, text
+    span.tokens = estimate_tokens(text)
+    return True
+
+
+def _shingles(text: str) -> frozenset:
+    words = normalize_question(text).split()
+    if len(words) <= SHINGLE_SIZE:
+        return frozenset([" ".join(words)])
+    return frozenset(
+        " ".join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)
+    )
+
+
+def _is_near_duplicate(shingles: frozenset, kept: List[frozenset], threshold: float) -> bool:
+    for other in kept:
+        union = len(shingles | other)
+        if union and len(shingles & other) / union >= threshold:
+            return True
+    return False
+
+
+def pack_context(
+    docs: Sequence[Document],
+    budget: int = CONTEXT_TOKEN_BUDGET,
+    dedup_threshold: float = CONTEXT_DEDUP_THRESHOLD,
+) -> str:
+    """
+    Join `docs` (best first) into one context string of at most `budget`
+    estimated tokens. A merged span keeps the rank of its best chunk; a span
+    that does not fit is skipped so smaller, lower-ranked ones can still be
+    used. The top span is always included, even when it alone exceeds the
+    budget, so the model never gets an empty context.
+    """
+    raw_tokens = sum(_chunk_tokens(doc) for doc in docs)
+
+    spans: List[_Span] = []
+    for doc in docs:
+        span = _to_span(doc)
+        # Merging can make a span touch an earlier one, so repeat until stable
+        merged = True
+        while merged:
+            merged = False
+            for existing in spans:
+                if existing is not span and _merge_into(existing, span):
+                    if span in spans:
+                        spans.remove(span)
+                    span, merged = existing, True
+                    break
+        if span not in spans:
+            spans.append(span)
+
+    kept_shingles: List[frozenset] = []
+    parts: List[str] = []
+    used = 0
+    for span in spans:
+        shingles = _shingles(span.text)
+        if _is_near_duplicate(shingles, kept_shingles, dedup_threshold):
+            continue
+        if parts and used + span.tokens > budget:
+            continue
+        kept_shingles.append(shingles)
+        parts.append(span.text)
+        used += span.tokens
+
+    metrics.inc("tokens_total", used, kind="context")
+    metrics.inc("tokens_total", max(raw_tokens - used, 0), kind="context_saved")
+    if docs:
+        logger.info(
+            "Packed %d chunk(s) into %d span(s): %d prompt tokens (saved %d)",
+            len(docs), len(parts), used, max(raw_tokens - used, 0),
+        )
+    return CONTEXT_SEPARATOR.join(parts)
@@ -0,0 +1,238 @@
+"""
+Persistent, append-only conversation log for audit.
+
+Messages are handed to `ConversationLogWriter.log`, which only puts a record
+on a bounded in-memory queue, so the request path never touches the disk.
+A background thread takes records off the queue in batches (up to
+`batch_size`, or whatever arrived within `flush_interval` seconds), writes
+each batch as JSON lines with one write + flush, and rotates the file when
+it grows past `max_bytes` or gets older than `rotate_seconds`: the current
+file is renamed with a timestamp and gzip-compressed. Pending records are
+written when the writer is closed (also at interpreter exit).
+
+A file must have a single writer: rotation renames it under any other
+process still appending. Pre-fork workers (see src.prefork) therefore each
+write their own file, conversations-<worker index>.jsonl, in the same
+directory.
+
+If the queue is full, the overflow policy decides: "drop" discards the
+record and counts it (chat latency is never affected), "block" waits for
+the writer to catch up (no loss, but a slow disk slows down requests).
+log() may then block, so async callers should run it in a thread (as
+server.py does) rather than on the event loop.
+"""
+import atexit
+import gzip
+import json
+import logging
+import os
+import queue
+import shutil
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import List, Optional
+
+from config.settings import (
+    CONVERSATION_LOG_BATCH_SIZE,
+    CONVERSATION_LOG_DIR,
+    CONVERSATION_LOG_ENABLED,
+    CONVERSATION_LOG_FLUSH_SECONDS,
+    CONVERSATION_LOG_MAX_BYTES,
+    CONVERSATION_LOG_OVERFLOW,
+    CONVERSATION_LOG_QUEUE_SIZE,
+    CONVERSATION_LOG_ROTATE_SECONDS,
+)
+from src import metrics
+from src.prefork import worker_index
+
+logger = logging.getLogger(__name__)
+
+LOG_FILE = "conversations.jsonl"
+OVERFLOW_POLICIES = ("drop", "block")
+
+_CLOSE = object()  # queue sentinel
+
+
+class ConversationLogWriter:
+    """Batches conversation records to a rotating JSONL file on a background thread."""
+
+    def __init__(
+        self,
+        directory: Path = CONVERSATION_LOG_DIR,
+        queue_size: int = CONVERSATION_LOG_QUEUE_SIZE,
+        batch_size: int = CONVERSATION_LOG_BATCH_SIZE,
+        flush_interval: float = CONVERSATION_LOG_FLUSH_SECONDS,
+        max_bytes: int = CONVERSATION_LOG_MAX_BYTES,
+        rotate_seconds: float = CONVERSATION_LOG_ROTATE_SECONDS,
+        overflow: str = CONVERSATION_LOG_OVERFLOW,
+        file_name: str = LOG_FILE,
+    ):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy {overflow!r}; expected one of {OVERFLOW_POLICIES}")
+        self.directory = Path(directory)
+        self.path = self.directory / file_name
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.rotate_seconds = rotate_seconds
+        self.overflow = overflow
+        self.written = 0
+        self.dropped = 0
+        self.rotations = 0
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max(1, queue_size))
+        self._file = None
+        self._opened_at = 0.0
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="conversation-log", daemon=True)
+
+    def start(self) -> "ConversationLogWriter":
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._thread.start()
+        return self
+
+    def log(self, session_id: str, role: str, content: str, **fields) -> bool:
+        """
+        Queue one message for writing. Returns False if it was dropped
+        (queue full under the "drop" policy, or the writer is closed).
+        """
+        if self._closed:
+            return False
+        record = {
+            "ts": datetime.now(timezone.utc).isoformat(),
+            "session": session_id,
+            "role": role,
+            "content": content,
+            **fields,
+        }
+        try:
+            self._queue.put(record, block=self.overflow == "block")
+        except queue.Full:
+            self.dropped += 1
+            metrics.inc("conversation_log_dropped_total")
+            if self.dropped == 1 or self.dropped % 1000 == 0:
+                logger.warning("Conversation log queue full; %d record(s) dropped so far", self.dropped)
+            return False
+        return True
+
+    def close(self, timeout: float | None = 10.0) -> None:
+        """Write everything queued so far, close the file and stop the thread."""
+        if self._closed:
+            return
+        self._closed = True
+        if not self._thread.is_alive():
+            return
+        self._queue.put(_CLOSE)  # blocks only until there is room
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            logger.warning("Conversation log writer did not finish within %.1fs", timeout)
+
+    def stats(self) -> dict:
+        return {
+            "written": self.written,
+            "dropped": self.dropped,
+            "queued": self._queue.qsize(),
+            "rotations": self.rotations,
+        }
+
+    # -- writer thread -------------------------------------------------------
+
+    def _collect(self) -> tuple[List[dict], bool]:
+        """Wait for the next batch; returns (records, closing)."""
+        try:
+            first = self._queue.get(timeout=self.flush_interval)
+        except queue.Empty:
+            return [], False
+        if first is _CLOSE:
+            return [], True
+        batch = [first]
+        while len(batch) < self.batch_size:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _CLOSE:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _run(self) -> None:
+        closing = False
+        while not closing:
+            batch, closing = self._collect()
+            try:
+                self._maybe_rotate()
+                if batch:
+                    self._write(batch)
+            except Exception as e:  # keep the thread alive; the next batch retries
+                logger.exception("Conversation log write failed (%d record(s) lost): %s", len(batch), e)
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _open(self) -> None:
+        path = self.path
+        self._file = open(path, "ab")
+        # An existing file is at least as old as its last write (from an earlier run)
+        self._opened_at = path.stat().st_mtime if path.stat().st_size else time.time()
+
+    def _write(self, batch: List[dict]) -> None:
+        if self._file is None:
+            self._open()
+        data = b"".join(
+            json.dumps(record, ensure_ascii=False, default=str).encode("utf-8") + b"\n"
+            for record in batch
+        )
+        self._file.write(data)
+        self._file.flush()
+        self.written += len(batch)
+
+    def _maybe_rotate(self) -> None:
+        path = self.path
+        if self._file is None:
+            if not path.exists():
+                return
+            self._open()
+        size = self._file.tell()
+        if not size:
+            return
+        too_big = self.max_bytes > 0 and size >= self.max_bytes
+        too_old = self.rotate_seconds > 0 and time.time() - self._opened_at >= self.rotate_seconds
+        if too_big or too_old:
+            self._rotate(path)
+
+    def _rotate(self, path: Path) -> None:
+        self._file.close()
+        self._file = None
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%f")
+        rotated = path.with_name(f"{path.stem}-{stamp}{path.suffix}")
+        os.replace(path, rotated)
+        with open(rotated, "rb") as src, gzip.open(f"{rotated}.gz", "wb") as dst:
+            shutil.copyfileobj(src, dst)
+        rotated.unlink()
+        self.rotations += 1
+        logger.info("Rotated conversation log to %s.gz", rotated)
+
+
+_writer: Optional[ConversationLogWriter] = None
+_writer_lock = threading.Lock()
+
+
+def log_file_name() -> str:
+    """This process's log file: one per pre-fork worker, else LOG_FILE."""
+    index = worker_index()
+    return LOG_FILE if index is None else f"{Path(LOG_FILE).stem}-{index}{Path(LOG_FILE).suffix}"
+
+
+def get_conversation_log() -> Optional[ConversationLogWriter]:
+    """Return the process-wide log writer (started on first use), or None if disabled."""
+    global _writer
+    if not CONVERSATION_LOG_ENABLED:
+        return None
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = ConversationLogWriter(file_name=log_file_name()).start()
+                atexit.register(_writer.close)
+    return _writer
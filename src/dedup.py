@@ -0,0 +1,169 @@
+"""
+Near-duplicate chunk removal at ingest time.
+
+FAQ collections and scraped pages repeat boilerplate, so many chunks are
+copies or near-copies of each other. `NearDuplicateFilter` sits between
+splitting and embedding: each chunk is compared with the representatives
+kept so far, first by a hash of its normalized text (exact duplicates), then
+by MinHash signatures over word-trigram shingles with LSH banding (near
+duplicates, estimated Jaccard >= DEDUP_THRESHOLD). A duplicate is not
+embedded or stored; it is recorded as `duplicate id -> representative id`
+(kept in the build manifest) and its source is merged into the
+representative's `sources` metadata. A representative's vector stays in the
+index as long as any chunk of its cluster is still in the corpus.
+
+Memory is one small signature per representative (DEDUP_NUM_PERM uint32s),
+so the filter streams like the rest of the build.
+"""
+import hashlib
+import logging
+import time
+import zlib
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+from config.settings import DEDUP_BANDS, DEDUP_NUM_PERM, DEDUP_THRESHOLD
+from src.faq import normalize_question
+
+logger = logging.getLogger(__name__)
+
+SHINGLE_SIZE = 3
+# Mersenne prime 2^31 - 1: a * h + b stays below 2^64 for 32-bit shingle hashes
+_PRIME = (1 << 31) - 1
+
+
+def shingle_hashes(text: str) -> np.ndarray:
+    """CRC32 of each normalized word trigram (the whole text if shorter)."""
+    words = normalize_question(text).split()
+    if len(words) <= SHINGLE_SIZE:
+        shingles = {" ".join(words)}
+    else:
+        shingles = {" ".join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+    return np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingles), dtype=np.uint64, count=len(shingles))
+
+
+class NearDuplicateFilter:
+    """Streaming exact + MinHash/LSH near-duplicate detector over chunk texts."""
+
+    def __init__(
+        self,
+        threshold: float = DEDUP_THRESHOLD,
+        num_perm: int = DEDUP_NUM_PERM,
+        bands: int = DEDUP_BANDS,
+        seed: int = 1,
+    ):
+        if num_perm % bands:
+            raise ValueError(f"DEDUP_NUM_PERM ({num_perm}) must be a multiple of DEDUP_BANDS ({bands})")
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = num_perm // bands
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, _PRIME, size=num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, _PRIME, size=num_perm, dtype=np.uint64)
+        self._exact: Dict[bytes, str] = {}
+        self._buckets: Dict[Tuple[int, bytes], List[str]] = {}
+        self._signatures: Dict[str, np.ndarray] = {}
+        self.seen = 0
+        self.exact = 0
+        self.near = 0
+        self.seconds = 0.0
+
+    def signature(self, text: str) -> np.ndarray:
+        hashes = shingle_hashes(text)
+        return ((np.outer(self._a, hashes) + self._b[:, None]) % _PRIME).min(axis=1).astype(np.uint32)
+
+    def _band_keys(self, signature: np.ndarray) -> List[Tuple[int, bytes]]:
+        return [
+            (band, signature[band * self.rows:(band + 1) * self.rows].tobytes())
+            for band in range(self.bands)
+        ]
+
+    def _keep(self, cid: str, digest: bytes, signature: np.ndarray, keys) -> None:
+        self._exact[digest] = cid
+        self._signatures[cid] = signature
+        for key in keys:
+            self._buckets.setdefault(key, []).append(cid)
+
+    def register(self, cid: str, text: str) -> None:
+        """Add a chunk that is already in the index as a representative."""
+        signature = self.signature(text)
+        self._keep(cid, self._digest(text), signature, self._band_keys(signature))
+
+    @staticmethod
+    def _digest(text: str) -> bytes:
+        return hashlib.sha1(normalize_question(text).encode("utf-8")).digest()
+
+    def add(self, cid: str, text: str) -> str | None:
+        """
+        Return the id of the representative `text` duplicates, or None after
+        registering the chunk as a new representative.
+        """
+        started = time.perf_counter()
+        try:
+            self.seen += 1
+            digest = self._digest(text)
+            rep = self._exact.get(digest)
+            if rep is not None:
+                self.exact += 1
+                return rep
+            signature = self.signature(text)
+            keys = self._band_keys(signature)
+            candidates = {c for key in keys for c in self._buckets.get(key, ())}
+            for candidate in sorted(candidates):
+                if np.mean(self._signatures[candidate] == signature) >= self.threshold:
+                    self.near += 1
+                    return candidate
+            self._keep(cid, digest, signature, keys)
+            return None
+        finally:
+            self.seconds += time.perf_counter() - started
+
+    def filter(
+        self, pending: Iterable[Tuple[Document, str]], duplicates: Dict[str, str]
+    ) -> Iterator[Tuple[Document, str]]:
+        """Yield the (chunk, id) pairs that are not duplicates; record the others in `duplicates`."""
+        for chunk, cid in pending:
+            rep = self.add(cid, chunk.page_content)
+            if rep is None:
+                yield chunk, cid
+            elif rep != cid:  # rep == cid: this chunk already has a vector
+                duplicates[cid] = rep
+
+    def log_summary(self) -> None:
+        dropped = self.exact + self.near
+        if not self.seen:
+            return
+        logger.info(
+            "Deduplication: %d chunk(s) checked, dropped %d exact and %d near duplicate(s) "
+            "(%.1f%% reduction, %.2fs)",
+            self.seen, self.exact, self.near, 100.0 * dropped / self.seen, self.seconds,
+        )
+
+
+def cluster_metadata(
+    duplicates: Dict[str, str], sources: Dict[str, str], representatives: Iterable[str]
+) -> Dict[str, dict]:
+    """
+    Metadata updates for `representatives`: "sources" lists the sources of
+    every chunk in the cluster still in the corpus (the representative's own
+    first), and "source" moves to a surviving one if the representative's
+    own file was removed. `sources` maps chunk id -> source for the corpus.
+    """
+    members: Dict[str, List[str]] = {}
+    for dup, rep in duplicates.items():
+        members.setdefault(rep, []).append(dup)
+    updates = {}
+    for rep in representatives:
+        names = []
+        for cid in [rep] + sorted(members.get(rep, [])):
+            source = sources.get(cid)
+            if source is not None and source not in names:
+                names.append(source)
+        update: Dict[str, object] = {"sources": names if len(names) > 1 else None}
+        if rep not in sources and names:
+            update["source"] = names[0]
+        updates[rep] = update
+    return updates
+
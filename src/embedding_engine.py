@@ -0,0 +1,143 @@
+"""
+Build-time embedding engine: batched, optionally multi-process.
+
+Chunks are consumed lazily and grouped into batches of EMBED_BATCH_SIZE
+texts. With more than one worker, batches are sharded across a process pool
+where every worker loads its own copy of the SentenceTransformers model;
+vectors are yielded back in corpus order as soon as each batch is done so
+the caller can stream them into the FAISS index. Throughput (chunks/sec) is
+logged as batches finish.
+"""
+import logging
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Iterable, Iterator, List, Tuple, TypeVar
+
+from config.settings import EMBED_BATCH_SIZE, EMBED_WORKERS
+from src import metrics
+from src.ingest import batched
+
+T = TypeVar("T")
+
+logger = logging.getLogger(__name__)
+
+# Log progress at most this often (seconds)
+PROGRESS_INTERVAL = 5.0
+
+# Per-process model used by pool workers (set in _init_worker)
+_worker_embeddings = None
+
+
+def _init_worker(spec: Tuple[str, str], batch_size: int, threads: int) -> None:
+    """Load the embedding model once per worker process."""
+    global _worker_embeddings
+    backend, name = spec
+    if backend == "onnx":
+        from src.onnx_embeddings import OnnxEmbeddings
+        _worker_embeddings = OnnxEmbeddings(name, threads=threads, batch_size=batch_size)
+        return
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+    from langchain_community.embeddings import HuggingFaceEmbeddings
+    _worker_embeddings = HuggingFaceEmbeddings(
+        model_name=name,
+        model_kwargs={"device": "cpu"},
+        encode_kwargs={"batch_size": batch_size},
+    )
+
+
+def _embed_batch(texts: List[str]) -> List[List[float]]:
+    return _worker_embeddings.embed_documents(texts)
+
+
+def _worker_spec(embeddings) -> Tuple[str, str] | None:
+    """(backend, model) if `embeddings` can be recreated in a worker process, else None."""
+    from langchain_community.embeddings import HuggingFaceEmbeddings
+    from src.onnx_embeddings import OnnxEmbeddings
+    if isinstance(embeddings, HuggingFaceEmbeddings):
+        return "torch", embeddings.model_name
+    if isinstance(embeddings, OnnxEmbeddings):
+        return "onnx", str(embeddings.model_dir)
+    return None
+
+
+def embed_batches(
+    items: Iterable[T],
+    embeddings,
+    workers: int = EMBED_WORKERS,
+    batch_size: int = EMBED_BATCH_SIZE,
+    text: Callable[[T], str] = lambda item: item,
+) -> Iterator[Tuple[List[T], List[List[float]]]]:
+    """
+    Embed `items` (any iterable, consumed lazily) and yield (batch, vectors)
+    per batch, in input order. `text` maps an item to the string to embed.
+
+    `workers` > 1 shards batches across a process pool; this needs a
+    HuggingFace or ONNX embeddings object (other embeddings run in-process). At most
+    2 * workers batches are in flight, so memory stays bounded.
+    """
+    batch_size = max(1, batch_size)
+    spec = _worker_spec(embeddings) if workers > 1 else None
+    if workers > 1 and spec is None:
+        logger.info("Embeddings cannot be shared with worker processes; using 1 worker")
+    workers = workers if spec else 1
+
+    started = last_report = time.perf_counter()
+    done = 0
+
+    def progress(n: int, final: bool = False) -> None:
+        nonlocal done, last_report
+        done += n
+        now = time.perf_counter()
+        if final or now - last_report >= PROGRESS_INTERVAL:
+            last_report = now
+            elapsed = max(now - started, 1e-9)
+            logger.info(
+                "Embedded %d chunks (%.1f chunks/sec, %d worker(s), batch %d)",
+                done, done / elapsed, workers, batch_size,
+            )
+
+    if workers == 1:
+        for batch in batched(items, batch_size):
+            with metrics.span("build.embed"):
+                vectors = embeddings.embed_documents([text(item) for item in batch])
+            yield batch, vectors
+            progress(len(batch))
+        metrics.inc("build_chunks_total", done)
+        if done:
+            progress(0, final=True)
+        return
+
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=ctx,
+        initializer=_init_worker,
+        initargs=(spec, batch_size, threads),
+    ) as pool:
+        in_flight: deque = deque()
+        for batch in batched(items, batch_size):
+            in_flight.append((batch, pool.submit(_embed_batch, [text(item) for item in batch])))
+            # Yield finished batches in order while all workers stay busy
+            while len(in_flight) >= 2 * workers:
+                done_batch, future = in_flight.popleft()
+                with metrics.span("build.embed_wait"):
+                    vectors = future.result()
+                yield done_batch, vectors
+                progress(len(done_batch))
+        while in_flight:
+            done_batch, future = in_flight.popleft()
+            with metrics.span("build.embed_wait"):
+                vectors = future.result()
+            yield done_batch, vectors
+            progress(len(done_batch))
+    metrics.inc("build_chunks_total", done)
+    if done:
+        progress(0, final=True)
@@ -3,90 +3,535 @@ Embedding generation and vector store management.
 
 Uses HuggingFace SentenceTransformers embeddings
 (`sentence-transformers/all-MiniLM-L6-v2`) with a local FAISS index.
-No OpenAI or other external embedding API is required.
+No OpenAI or other external embedding API is required. The same model can
+run through an int8 ONNX Runtime export instead (EMBEDDING_BACKEND=onnx,
+see src.onnx_embeddings); the backend is recorded with the index so query
+vectors always come from the backend that built it.
 """
 import logging
+import shutil
+import time
+from functools import lru_cache
 from pathlib import Path
-from typing import List
+from typing import Callable, Dict, Iterable, Iterator, List, Tuple
+
+import faiss
+import numpy as np
 
 from langchain_community.embeddings import HuggingFaceEmbeddings
 from langchain_community.vectorstores import FAISS
 from langchain_core.documents import Document
 
-from config.settings import VECTOR_STORE_PATH
-from src.ingest import load_all_raw_data, split_documents
+from config.settings import (
+    CATEGORY_PARTITIONS,
+    DEDUP_ENABLED,
+    DEDUP_THRESHOLD,
+    EMBED_BATCH_SIZE,
+    EMBED_WORKERS,
+    EMBEDDING_BACKEND,
+    EMBEDDING_PARITY_MIN_COSINE,
+    EMBEDDING_PARITY_SAMPLES,
+    FAISS_INDEX_SPEC,
+    FAQ_EMBEDDING_MATCH,
+    HYBRID_RETRIEVAL,
+    INGEST_WORKERS,
+    MAX_CONTEXT_DOCS,
+    VECTOR_STORE_PATH,
+)
+from src.ann import FLAT_SPEC, build_ann_index, tune_index
+from src.dedup import NearDuplicateFilter, cluster_metadata
+from src.embedding_engine import embed_batches
+from src import metrics
+from src.faq import FAQ_LOOKUP_FILE, build_faq_lookup
+from src.lexical import build_lexical_index, load_lexical_index
+from src.partitions import build_partitions, load_partitions
+from src.store import StoreWriter, has_store, load_store, merge_metadata, save_store
+from src.versions import (
+    current_version,
+    new_version,
+    prune_versions,
+    publish_version,
+    resolve_store_path,
+)
+from src.ingest import (
+    CHUNK_FORMAT_VERSION,
+    CHUNK_OVERLAP,
+    CHUNK_SIZE,
+    iter_chunks,
+    iter_raw_file,
+    iter_split_files,
+    list_raw_files,
+    log_file_timing,
+)
+from src.manifest import (
+    ChunkIdAssigner,
+    build_params,
+    file_sha256,
+    manifest_chunk_ids,
+    read_manifest,
+    write_manifest,
+)
 
 logger = logging.getLogger(__name__)
 
 EMBEDDING_TYPE_FILE = "embedding_type.txt"
+# Backend name -> value written to embedding_type.txt
+EMBEDDING_TYPES = {"torch": "local_hf", "onnx": "local_onnx_int8"}
 
 # HuggingFace model name corresponding to your “AL-MINI-L6”
 HF_EMBEDDING_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
 
 
-def get_embeddings():
+def _check_backend(backend: str) -> str:
+    if backend not in EMBEDDING_TYPES:
+        raise ValueError(
+            f"Unknown EMBEDDING_BACKEND {backend!r}; expected one of {sorted(EMBEDDING_TYPES)}"
+        )
+    return backend
+
+
+def index_embedding_backend(persist_path: Path | None = None) -> str:
+    """Backend recorded in embedding_type.txt of an index (EMBEDDING_BACKEND if none)."""
+    path = resolve_store_path(Path(persist_path or VECTOR_STORE_PATH)) / EMBEDDING_TYPE_FILE
+    try:
+        recorded = path.read_text(encoding="utf-8").strip()
+    except OSError:
+        return _check_backend(EMBEDDING_BACKEND)
+    for backend, name in EMBEDDING_TYPES.items():
+        if name == recorded:
+            return backend
+    raise ValueError(f"Unknown embedding type {recorded!r} in {path}; rebuild the index")
+
+
+def embedding_model_id(backend: str) -> str:
+    """Model identifier stored in the build manifest (a change forces a full rebuild)."""
+    return HF_EMBEDDING_MODEL_NAME if backend == "torch" else f"{HF_EMBEDDING_MODEL_NAME}@onnx-int8"
+
+
+def get_embeddings(backend: str | None = None):
     """
-    Return HuggingFace SentenceTransformers embeddings.
+    Return the embedding model for `backend` ("torch" or "onnx"); by default
+    the backend recorded with the index at VECTOR_STORE_PATH, so queries are
+    embedded exactly like the indexed chunks.
 
-    This uses a local model from HuggingFace Hub and does not require any
-    API key. If you have a GPU, you can change `device` to "cuda".
+    Both backends run locally and do not require any API key. The model is
+    loaded once per process and shared by the index, the retriever and the
+    semantic answer cache.
     """
+    return _load_embeddings(_check_backend(backend or index_embedding_backend()))
+
+
+@lru_cache(maxsize=2)
+def _load_embeddings(backend: str):
+    if backend == "onnx":
+        from src.onnx_embeddings import OnnxEmbeddings
+        return OnnxEmbeddings()
+    # If you have a GPU, you can change `device` to "cuda"
     return HuggingFaceEmbeddings(
         model_name=HF_EMBEDDING_MODEL_NAME,
         model_kwargs={"device": "cpu"},
     )
 
 
+def _check_parity(vector_store: FAISS, embeddings) -> None:
+    """
+    Compare ONNX vectors with the torch model on a sample of indexed chunks;
+    raise ValueError if the cosine drift is above the configured limit.
+    """
+    try:
+        reference = _load_embeddings("torch")
+        n = min(EMBEDDING_PARITY_SAMPLES, vector_store.index.ntotal)
+        texts = [
+            vector_store.docstore.search(vector_store.index_to_docstore_id[row]).page_content
+            for row in range(n)
+        ]
+        from src.onnx_embeddings import cosine_parity
+        parity = cosine_parity(texts, embeddings, reference)
+    except ImportError as e:
+        logger.warning("Skipping ONNX parity check (torch model unavailable): %s", e)
+        return
+    logger.info(
+        "ONNX parity vs torch on %d chunk(s): min cosine %.4f, mean %.4f",
+        parity["samples"], parity["min_cosine"], parity["mean_cosine"],
+    )
+    if parity["samples"] and parity["min_cosine"] < EMBEDDING_PARITY_MIN_COSINE:
+        raise ValueError(
+            f"ONNX embeddings drift from the torch model (min cosine "
+            f"{parity['min_cosine']:.4f} < {EMBEDDING_PARITY_MIN_COSINE}); re-export the model"
+        )
+
+
+def _iter_pending(
+    documents: Iterable[Document] | None,
+    data_dir: Path | None,
+    previous: dict | None,
+    files: Dict[str, dict],
+    ingest_workers: int = INGEST_WORKERS,
+) -> Iterator[Tuple[Document, str]]:
+    """
+    Stream (chunk, id) pairs for chunks that do not have a vector yet.
+    Fills `files` (the manifest entry per source) as the corpus is read.
+    Raw files whose hash matches the previous manifest are not re-read.
+    With ingest_workers > 1, changed files are loaded and split in a process
+    pool (one file per task, results kept in file order).
+    """
+    old_files = previous["files"] if previous else {}
+    # Chunks that already have a vector (e.g. unchanged parts of an edited file)
+    known = manifest_chunk_ids(previous) if previous else set()
+
+    def register(source: str, digest: str | None, chunks: Iterable[Document]):
+        entry = files.setdefault(source, {"sha256": digest, "chunks": []})
+        assign = ChunkIdAssigner()
+        for chunk in chunks:
+            cid = assign(chunk)
+            entry["chunks"].append(cid)
+            if cid not in known:
+                yield chunk, cid
+
+    if documents is not None:
+        assign = ChunkIdAssigner()
+        for chunk in documents:
+            cid = assign(chunk)
+            source = str(chunk.metadata.get("source", ""))
+            files.setdefault(source, {"sha256": None, "chunks": []})["chunks"].append(cid)
+            if cid not in known:
+                yield chunk, cid
+        return
+
+    changed = []
+    with metrics.span("build.hash_files"):
+        for path in list_raw_files(data_dir):
+            digest = file_sha256(path)
+            if old_files.get(str(path), {}).get("sha256") == digest:
+                files[str(path)] = old_files[str(path)]
+            else:
+                changed.append((path, digest))
+
+    started = time.perf_counter()
+    timings = []
+    if ingest_workers > 1:
+        digests = {path: digest for path, digest in changed}
+        for result in iter_split_files([path for path, _ in changed], ingest_workers):
+            log_file_timing(result.path, len(result.chunks), result.seconds)
+            metrics.record_stage("build.split_file", result.seconds)
+            timings.append((result.seconds, result.path))
+            yield from register(str(result.path), digests[result.path], result.chunks)
+    else:
+        for path, digest in changed:
+            elapsed = [0.0]
+            yield from register(str(path), digest, _timed(iter_chunks(iter_raw_file(path)), elapsed))
+            log_file_timing(path, len(files[str(path)]["chunks"]), elapsed[0])
+            metrics.record_stage("build.split_file", elapsed[0])
+            timings.append((elapsed[0], path))
+    if timings:
+        slowest = max(timings, key=lambda t: t[0])
+        logger.info(
+            "Loaded and split %d changed file(s) (%.2fs wall incl. embedding); slowest: %s (%.2fs)",
+            len(timings), time.perf_counter() - started, slowest[1], slowest[0],
+        )
+
+
+def _timed(iterable: Iterable, elapsed: list) -> Iterator:
+    """Yield from `iterable`, adding the time spent producing items to elapsed[0]."""
+    it = iter(iterable)
+    while True:
+        started = time.perf_counter()
+        try:
+            item = next(it)
+        except StopIteration:
+            elapsed[0] += time.perf_counter() - started
+            return
+        elapsed[0] += time.perf_counter() - started
+        yield item
+
+
+def _embed_pending(pending, embeddings, workers: int, batch_size: int):
+    """Embed (chunk, id) pairs; yields (batch, float32 vector array) per batch."""
+    for batch, vectors in embed_batches(
+        pending, embeddings, workers, batch_size, text=lambda pair: pair[0].page_content
+    ):
+        yield batch, np.asarray(vectors, dtype=np.float32)
+
+
+def _full_build(pending, persist_path: Path, embeddings, workers: int,
+                batch_size: int, index_spec: str,
+                metadata_updates: Callable[[], Dict[str, dict]] | None = None) -> int:
+    """
+    Stream chunks into a new exact index and write records straight to disk,
+    so peak memory is the vectors plus one batch. `metadata_updates` is called
+    once the stream is consumed (see StoreWriter.finish). Returns the chunk count.
+    """
+    writer = StoreWriter(persist_path)
+    index = None
+    try:
+        for batch, vectors in _embed_pending(pending, embeddings, workers, batch_size):
+            if index is None:
+                index = faiss.IndexFlatL2(vectors.shape[1])
+            with metrics.span("build.index_add"):
+                index.add(vectors)
+            with metrics.span("build.write_records"):
+                for chunk, cid in batch:
+                    writer.add(cid, chunk)
+    except BaseException:
+        writer.abort()
+        raise
+    if index is None:
+        writer.abort()
+        raise ValueError("No documents to index. Add files to data/raw/ and run again.")
+    if index_spec.strip().lower() != FLAT_SPEC.lower():
+        with metrics.span("build.ann_index"):
+            index, _ = build_ann_index(index, index_spec, k=MAX_CONTEXT_DOCS)
+    with metrics.span("build.save"):
+        writer.finish(index, metadata_updates() if metadata_updates else None)
+    return len(writer)
+
+
 def build_faiss_index(
-    documents: List[Document] | None = None,
+    documents: Iterable[Document] | None = None,
     persist_path: Path | None = None,
+    data_dir: Path | None = None,
+    embeddings=None,
+    full_rebuild: bool = False,
+    workers: int = EMBED_WORKERS,
+    batch_size: int = EMBED_BATCH_SIZE,
+    index_spec: str = FAISS_INDEX_SPEC,
+    ingest_workers: int = INGEST_WORKERS,
+    category_partitions: bool = CATEGORY_PARTITIONS,
+    dedup: bool = DEDUP_ENABLED,
+    lexical_index: bool = HYBRID_RETRIEVAL,
 ) -> FAISS:
     """
-    Build a FAISS index from documents. If documents not provided,
-    load from data/raw.
+    Build a FAISS index from documents (chunks; any iterable). If documents
+    not provided, load from data/raw.
 
-    Saves index to persist_path (default from settings).
+    Saves index to persist_path (default from settings) as a new version:
+    the complete store is written to persist_path/versions/<version>/ and
+    only then published by atomically switching persist_path/CURRENT to it,
+    so readers never see a half-written store and running apps can swap it
+    in without a restart; old versions are pruned (see src.versions). A
+    failed build leaves the current version untouched.
     Uses local HuggingFace embeddings only (no external API).
+
+    Builds are incremental: a manifest of file and chunk hashes is kept next to
+    the index, and only new or changed chunks are embedded; vectors of removed
+    chunks are deleted. If nothing changed, no new version is created. A full
+    rebuild happens when `full_rebuild` is set, when there is no usable index
+    yet, or when CHUNK_SIZE, CHUNK_OVERLAP or the embedding model changed
+    since the last build.
+
+    The corpus is streamed (load -> split -> embed -> add) in batches of
+    `batch_size` across `workers` processes (see src.embedding_engine). Full
+    builds write chunk records straight to disk, so embedding needs the index
+    vectors plus one batch in memory; incremental builds load the existing
+    store into RAM. The BM25 index (if built) then holds its postings in flat
+    arrays, about 12 bytes per distinct term per chunk, plus the vocabulary.
+    With `ingest_workers` > 1, raw files are loaded and split in parallel, one
+    file per process task, in a deterministic order.
+
+    `index_spec` selects the FAISS index type (see src.ann). Approximate index
+    types are rebuilt in full on every run, since not all of them support
+    deleting vectors; a recall/latency report against the exact index is logged.
+    With `lexical_index` (default: HYBRID_RETRIEVAL), a BM25 index over the
+    same chunks is saved alongside for hybrid retrieval (see src.lexical).
+    When building from data/raw, the FAQ fast-path table is saved too (see
+    src.faq).
+    With `category_partitions`, one sub-index per chunk category is saved
+    for routed search (see src.partitions). With `dedup`, exact and near-
+    duplicate chunks are not embedded; their sources are merged into the
+    chunk kept in their place (see src.dedup).
+    Build stages are timed when metrics are enabled (see src.metrics).
     """
-    persist_path = persist_path or VECTOR_STORE_PATH
-    persist_path = Path(persist_path)
-    persist_path.mkdir(parents=True, exist_ok=True)
+    with metrics.request_trace("build"):
+        root = Path(persist_path or VECTOR_STORE_PATH)
+        root.mkdir(parents=True, exist_ok=True)
+        current = resolve_store_path(root)
+        version, target = new_version(root)
+        try:
+            vector_store, changed = _build_version(
+                documents, current, target, data_dir, embeddings, full_rebuild,
+                workers, batch_size, index_spec, ingest_workers, category_partitions, dedup,
+                lexical_index,
+            )
+        except BaseException:
+            shutil.rmtree(target, ignore_errors=True)
+            raise
+        if not changed:
+            shutil.rmtree(target, ignore_errors=True)
+            return vector_store
+        publish_version(root, version)
+        prune_versions(root)
+        return vector_store
 
-    if documents is None:
-        raw_docs = load_all_raw_data()
-        documents = split_documents(raw_docs)
-    if not documents:
-        raise ValueError("No documents to index. Add files to data/raw/ and run again.")
 
-    embeddings = get_embeddings()
-    vector_store = FAISS.from_documents(documents, embeddings)
-    vector_store.save_local(str(persist_path))
+def _build_version(
+    documents, current: Path, target: Path, data_dir, embeddings, full_rebuild: bool,
+    workers: int, batch_size: int, index_spec: str, ingest_workers: int,
+    category_partitions: bool, dedup: bool, lexical_index: bool,
+) -> Tuple[FAISS, bool]:
+    """
+    Build a complete store in `target` from the corpus, reusing vectors from
+    the store in `current` where possible. Returns (vector_store, changed);
+    if nothing changed, `target` is left unused and `current` stays active.
+    """
+    backend = _check_backend(EMBEDDING_BACKEND)
+    check_parity = embeddings is None and backend == "onnx"
+    if embeddings is None:
+        embeddings = get_embeddings(backend)
+
+    params = build_params(
+        CHUNK_SIZE, CHUNK_OVERLAP, embedding_model_id(backend), index_spec, CHUNK_FORMAT_VERSION,
+        DEDUP_THRESHOLD if dedup else None,
+    )
+    exact = index_spec.strip().lower() == FLAT_SPEC.lower()
+    previous = None if full_rebuild or not exact else read_manifest(current)
+    if previous is not None and (
+        previous.get("params") != params or not has_store(current)
+    ):
+        logger.info("Build parameters or index changed; doing a full rebuild")
+        previous = None
+
+    files: Dict[str, dict] = {}
+    pending = _iter_pending(documents, data_dir, previous, files, ingest_workers)
+    previous_duplicates: Dict[str, str] = previous.get("duplicates", {}) if previous else {}
+    duplicates = dict(previous_duplicates)
+    dedup_filter = NearDuplicateFilter() if dedup else None
+
+    def cluster_updates(representatives) -> Dict[str, dict]:
+        sources = {cid: source for source, entry in files.items() for cid in entry["chunks"]}
+        return cluster_metadata(duplicates, sources, representatives)
+
+    if previous is None:
+        if dedup_filter is not None:
+            pending = dedup_filter.filter(pending, duplicates)
+        added = _full_build(
+            pending, target, embeddings, workers, batch_size, index_spec,
+            lambda: cluster_updates(set(duplicates.values())),
+        )
+        vector_store = load_store(target, embeddings)
+        logger.info("Full build: embedded %d chunk(s)", added)
+    else:
+        vector_store = load_store(current, embeddings, editable=True)
+        stored = set(vector_store.index_to_docstore_id.values())
+        if dedup_filter is not None:
+            with metrics.span("build.dedup_seed"):
+                for cid in stored:
+                    dedup_filter.register(cid, vector_store.docstore.search(cid).page_content)
+            pending = dedup_filter.filter(pending, duplicates)
+        added = 0
+        for batch, vectors in _embed_pending(pending, embeddings, workers, batch_size):
+            with metrics.span("build.index_add"):
+                vector_store.add_embeddings(
+                    [(chunk.page_content, vec) for (chunk, _), vec in zip(batch, vectors)],
+                    metadatas=[chunk.metadata for chunk, _ in batch],
+                    ids=[cid for _, cid in batch],
+                )
+            added += len(batch)
+        current_ids = {cid for entry in files.values() for cid in entry["chunks"]}
+        if not current_ids:
+            raise ValueError("No documents to index. Add files to data/raw/ and run again.")
+        duplicates = {dup: rep for dup, rep in duplicates.items() if dup in current_ids}
+        # A chunk's vector stays while it or any of its duplicates is in the corpus
+        removed = sorted(stored - current_ids - set(duplicates.values()))
+        if (not removed and not added and duplicates == previous_duplicates
+                and current_ids == manifest_chunk_ids(previous)):
+            # Published versions are never modified: if files alongside the
+            # index are missing (older builds) or stale, write a new version
+            outdated = [name for name, stale in (
+                ("BM25 index", lexical_index != (load_lexical_index(current) is not None)),
+                ("partitions", category_partitions != (load_partitions(current) is not None)),
+                ("FAQ table", documents is None and not (current / FAQ_LOOKUP_FILE).exists()),
+            ) if stale]
+            if not outdated:
+                logger.info("Index at %s is up to date; nothing to embed", current)
+                return vector_store, False
+            logger.info("Index at %s is up to date; writing a new version for: %s",
+                        current, ", ".join(outdated))
+        if removed:
+            with metrics.span("build.delete"):
+                vector_store.delete(removed)
+        representatives = (set(duplicates.values()) | set(previous_duplicates.values())) - set(removed)
+        for cid, update in cluster_updates(representatives).items():
+            doc = vector_store.docstore.search(cid)
+            if isinstance(doc, Document):
+                doc.metadata = merge_metadata(doc.metadata, update)
+        logger.info(
+            "Incremental build: embedded %d new chunk(s), removed %d, kept %d",
+            added, len(removed), vector_store.index.ntotal - added,
+        )
+        with metrics.span("build.save"):
+            save_store(vector_store, target)
+    if dedup_filter is not None:
+        metrics.record_stage("build.dedup", dedup_filter.seconds)
+        dedup_filter.log_summary()
+
+    if check_parity:
+        with metrics.span("build.parity_check"):
+            _check_parity(vector_store, embeddings)
+    if lexical_index:
+        with metrics.span("build.lexical_index"):
+            build_lexical_index(vector_store, target)
+    if category_partitions:
+        with metrics.span("build.partitions"):
+            build_partitions(vector_store, target)
+    if documents is None:
+        with metrics.span("build.faq_lookup"):
+            build_faq_lookup(target, data_dir, embeddings if FAQ_EMBEDDING_MATCH else None)
+    write_manifest(target, params, files, duplicates)
 
     # Remember which embeddings we used so load can use the same
-    (persist_path / EMBEDDING_TYPE_FILE).write_text(
-        "local_hf",
+    (target / EMBEDDING_TYPE_FILE).write_text(
+        EMBEDDING_TYPES[backend],
         encoding="utf-8",
     )
     logger.info(
         "FAISS index saved to %s (embeddings: %s)",
-        persist_path,
-        HF_EMBEDDING_MODEL_NAME,
+        target,
+        embedding_model_id(backend),
     )
-    return vector_store
+    return vector_store, True
 
 
-def load_faiss_index(persist_path: Path | None = None) -> FAISS:
+def get_index_version(persist_path: Path | None = None) -> str | None:
+    """
+    Return a fingerprint of the saved index (the current version name, or
+    mtime and size of index.faiss for unversioned stores), or None if no
+    index exists. Changes whenever the index is rebuilt.
+    """
+    persist_path = Path(persist_path or VECTOR_STORE_PATH)
+    version = current_version(persist_path)
+    if version is not None:
+        return version
+    index_file = persist_path / "index.faiss"
+    try:
+        st = index_file.stat()
+    except OSError:
+        return None
+    return f"{st.st_mtime_ns}-{st.st_size}"
+
+
+def load_faiss_index(persist_path: Path | None = None, embeddings=None) -> FAISS:
     """
     Load an existing FAISS index from disk.
-    Always uses the same HuggingFace embeddings as when the index was built.
+    Always uses the same embeddings (model and backend) as when the index was built.
+
+    The index is memory-mapped and chunk texts are read lazily per hit
+    (see src.store). Stores written by older versions with save_local are
+    still loaded through FAISS.load_local until the next build.
+    `persist_path` may be a versioned store root (its current version is
+    loaded) or a single store directory.
     """
-    persist_path = persist_path or VECTOR_STORE_PATH
-    persist_path = Path(persist_path)
+    persist_path = resolve_store_path(Path(persist_path or VECTOR_STORE_PATH))
     if not persist_path.exists():
         raise FileNotFoundError(
             f"Vector store not found at {persist_path}. "
             "Run: python scripts/build_vector_store.py"
         )
 
-    embeddings = get_embeddings()
+    if embeddings is None:
+        embeddings = get_embeddings(index_embedding_backend(persist_path))
+    if has_store(persist_path):
+        vector_store = load_store(persist_path, embeddings)
+        tune_index(vector_store.index)
+        return vector_store
+    logger.warning("Loading legacy pickled index from %s; rebuild to upgrade", persist_path)
     return FAISS.load_local(str(persist_path), embeddings, allow_dangerous_deserialization=True)
@@ -0,0 +1,167 @@
+"""
+Exact-match FAQ fast path: answer curated questions without the LLM.
+
+At build time every FAQ entry in data/raw/*.json(l) is stored in
+faq_lookup.json next to the index, keyed by its normalized question (case,
+punctuation and whitespace folded). `chat()` checks this table first, so a
+user who types a curated question verbatim gets the curated answer in
+microseconds. Optionally (FAQ_EMBEDDING_MATCH) the question embeddings are
+saved too and a near-exact paraphrase above FAQ_EMBEDDING_THRESHOLD also hits.
+"""
+import json
+import logging
+import re
+import threading
+import unicodedata
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+
+from config.settings import (
+    FAQ_EMBEDDING_MATCH,
+    FAQ_EMBEDDING_THRESHOLD,
+    FAQ_FAST_PATH,
+    VECTOR_STORE_PATH,
+)
+from src.versions import resolve_store_path
+
+logger = logging.getLogger(__name__)
+
+FAQ_LOOKUP_FILE = "faq_lookup.json"
+FAQ_VECTORS_FILE = "faq_vectors.npy"
+
+_PUNCT_RE = re.compile(r"[^\w\s]", re.UNICODE)
+_SPACE_RE = re.compile(r"\s+")
+
+
+def normalize_question(text: str) -> str:
+    """Fold case, punctuation and whitespace: "What's  flu?" -> "whats flu"."""
+    text = unicodedata.normalize("NFKC", text).casefold()
+    text = _PUNCT_RE.sub("", text)
+    return _SPACE_RE.sub(" ", text).strip()
+
+
+def _add_entry(entries: List[dict], seen: set, item: dict, path: Path) -> None:
+    question, answer = item.get("question", ""), item.get("answer", "")
+    key = normalize_question(question)
+    if not key or not answer or key in seen:
+        return
+    seen.add(key)
+    entries.append({
+        "key": key,
+        "question": question,
+        "answer": answer,
+        "category": item.get("category", "general"),
+        "source": str(path),
+    })
+
+
+def build_faq_lookup(
+    persist_path: Path,
+    data_dir: Path | None = None,
+    embeddings=None,
+) -> int:
+    """
+    Write faq_lookup.json (and faq_vectors.npy if `embeddings` is given) from
+    the FAQ JSON files in data_dir. Returns the number of entries.
+    """
+    from src.ingest import iter_faq_entries, list_raw_files
+
+    persist_path = Path(persist_path)
+    entries: List[dict] = []
+    seen = set()
+    for path in list_raw_files(data_dir):
+        if path.suffix.lower() not in (".json", ".jsonl"):
+            continue
+        try:
+            for item in iter_faq_entries(path):
+                _add_entry(entries, seen, item, path)
+        except Exception as e:
+            logger.warning("Skipping rest of %s for FAQ lookup: %s", path, e)
+    (persist_path / FAQ_LOOKUP_FILE).write_text(
+        json.dumps(entries, ensure_ascii=False, indent=1), encoding="utf-8"
+    )
+    vectors_path = persist_path / FAQ_VECTORS_FILE
+    if embeddings is not None and entries:
+        vectors = np.asarray(
+            embeddings.embed_documents([e["question"] for e in entries]), dtype=np.float32
+        )
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        np.save(vectors_path, vectors)
+    else:
+        vectors_path.unlink(missing_ok=True)
+    logger.info("FAQ lookup saved with %d entries", len(entries))
+    return len(entries)
+
+
+class FaqLookup:
+    """In-memory FAQ table with exact (normalized) and optional embedding match."""
+
+    def __init__(
+        self,
+        entries: List[dict],
+        vectors: Optional[np.ndarray] = None,
+        embeddings=None,
+        threshold: float = FAQ_EMBEDDING_THRESHOLD,
+    ):
+        self.entries = entries
+        self.by_key = {e["key"]: e for e in entries}
+        self.vectors = vectors
+        self.embeddings = embeddings
+        self.threshold = threshold
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def load(cls, persist_path: Path, embeddings=None) -> "FaqLookup":
+        persist_path = resolve_store_path(persist_path)
+        path = persist_path / FAQ_LOOKUP_FILE
+        entries = json.loads(path.read_text(encoding="utf-8")) if path.exists() else []
+        vectors = None
+        if embeddings is not None and (persist_path / FAQ_VECTORS_FILE).exists():
+            vectors = np.load(persist_path / FAQ_VECTORS_FILE, allow_pickle=False)
+        return cls(entries, vectors, embeddings)
+
+    def match(self, question: str) -> Optional[dict]:
+        """Return the matching FAQ entry, or None."""
+        entry = self.by_key.get(normalize_question(question))
+        if entry is None and self.vectors is not None:
+            vec = np.asarray(self.embeddings.embed_query(question), dtype=np.float32)
+            vec /= max(float(np.linalg.norm(vec)), 1e-12)
+            sims = self.vectors @ vec
+            best = int(np.argmax(sims))
+            if sims[best] >= self.threshold:
+                entry = self.entries[best]
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entry
+
+    def stats(self) -> dict:
+        return {"size": len(self.entries), "hits": self.hits, "misses": self.misses}
+
+
+_lookup: Optional[FaqLookup] = None
+_lookup_version = None
+_lookup_lock = threading.Lock()
+
+
+def get_faq_lookup() -> Optional[FaqLookup]:
+    """
+    Return the process-wide FAQ table for VECTOR_STORE_PATH (reloaded when the
+    index is rebuilt), or None if the fast path is disabled.
+    """
+    global _lookup, _lookup_version
+    if not FAQ_FAST_PATH:
+        return None
+    from src.embeddings import get_embeddings, get_index_version
+    version = get_index_version(VECTOR_STORE_PATH)
+    if _lookup is None or version != _lookup_version:
+        with _lookup_lock:
+            if _lookup is None or version != _lookup_version:
+                embeddings = get_embeddings() if FAQ_EMBEDDING_MATCH else None
+                _lookup = FaqLookup.load(VECTOR_STORE_PATH, embeddings)
+                _lookup_version = version
+    return _lookup
@@ -0,0 +1,174 @@
+"""
+Conversation history compaction for the RAG prompt.
+
+Sending every prior message verbatim makes the prompt (and LLM latency) grow
+each turn, and every stored reply repeats DISCLAIMER_FOOTER. A
+`ConversationHistory` strips the footer when a message is added, keeps the
+last HISTORY_RECENT_TURNS turns verbatim and folds older messages into a
+short extractive summary (the question, and the first sentence of each
+answer). The summary is updated incrementally as messages age out, and the
+LangChain message list is cached between turns. The whole history portion of
+the prompt is held under HISTORY_TOKEN_BUDGET estimated tokens.
+"""
+import re
+from collections import deque
+from typing import Iterable, List, Tuple
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
+
+from config.settings import (
+    CHAT_HISTORY_LIMIT,
+    DISCLAIMER_FOOTER,
+    HISTORY_RECENT_TURNS,
+    HISTORY_SUMMARY_TOKENS,
+    HISTORY_TOKEN_BUDGET,
+)
+from src.utils import estimate_tokens
+
+SUMMARY_PREFIX = "Summary of the earlier conversation:\n"
+# Words kept per message in the summary
+SUMMARY_QUESTION_WORDS = 30
+SUMMARY_ANSWER_WORDS = 40
+# Replies the UI stores for failed turns; never useful as context
+ERROR_REPLY_PREFIX = "[Error:"
+
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?])\s")
+
+
+def strip_footer(text: str) -> str:
+    """Remove the disclaimer footer appended to bot replies."""
+    text = text.rstrip()
+    footer = DISCLAIMER_FOOTER.strip()
+    if text.endswith(footer):
+        text = text[: -len(footer)]
+    return text.rstrip()
+
+
+def _first_words(text: str, n: int) -> str:
+    words = text.split()
+    return " ".join(words[:n]) + (" …" if len(words) > n else "")
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Drop words from the front of `text` until it fits in `max_tokens`."""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    words = text.split()
+    max_tokens -= estimate_tokens("…")  # room for the truncation marker
+    lo, hi = 0, len(words)
+    # Smallest number of leading words to drop so the rest fits
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if estimate_tokens(" ".join(words[mid:])) <= max_tokens:
+            hi = mid
+        else:
+            lo = mid + 1
+    return "… " + " ".join(words[lo:]) if lo < len(words) else ""
+
+
+def summarize_message(role: str, text: str) -> str:
+    """One summary line: the user's question, or the first sentence of a reply."""
+    if role == "user":
+        return "User asked: " + _first_words(text, SUMMARY_QUESTION_WORDS)
+    first = _SENTENCE_END_RE.split(text.strip(), maxsplit=1)[0]
+    return "Assistant said: " + _first_words(first, SUMMARY_ANSWER_WORDS)
+
+
+class ConversationHistory:
+    """
+    Compacted chat history: recent messages verbatim plus a rolling summary.
+
+    Add messages as the conversation goes; `messages()` returns the LangChain
+    messages for the prompt. Work is incremental: each message is stripped,
+    token-counted and converted once, and summarized once when it ages out.
+    """
+
+    def __init__(
+        self,
+        recent_turns: int = HISTORY_RECENT_TURNS,
+        token_budget: int = HISTORY_TOKEN_BUDGET,
+        summary_tokens: int = HISTORY_SUMMARY_TOKENS,
+    ):
+        self.recent_messages = max(0, 2 * recent_turns)
+        self.token_budget = max(0, token_budget)
+        self.summary_tokens = max(0, min(summary_tokens, self.token_budget))
+        self._recent: deque = deque()  # (role, text, tokens, message)
+        self._summary: deque = deque()  # (line, tokens)
+        self._recent_tokens = 0
+        self._summary_line_tokens = 0
+        self._cached: List[BaseMessage] | None = None
+        self._count = 0
+
+    @classmethod
+    def from_pairs(cls, pairs: Iterable[Tuple[str, str]], **kwargs) -> "ConversationHistory":
+        """Build a history from (role, content) pairs, oldest first."""
+        history = cls(**kwargs)
+        for role, content in list(pairs)[-CHAT_HISTORY_LIMIT:]:
+            history.add(role, content)
+        return history
+
+    def __len__(self) -> int:
+        return self._count
+
+    def add(self, role: str, content: str) -> None:
+        """Append a message ("user" or "assistant")."""
+        role = "user" if role == "user" else "assistant"
+        text = strip_footer(content or "")
+        if not text or (role == "assistant" and text.startswith(ERROR_REPLY_PREFIX)):
+            return
+        message = HumanMessage(content=text) if role == "user" else AIMessage(content=text)
+        tokens = estimate_tokens(text)
+        self._recent.append((role, text, tokens, message))
+        self._recent_tokens += tokens
+        self._count += 1
+        self._cached = None
+        while len(self._recent) > self.recent_messages:
+            self._fold_oldest()
+
+    def _fold_oldest(self) -> None:
+        role, text, tokens, _ = self._recent.popleft()
+        self._recent_tokens -= tokens
+        line = summarize_message(role, text)
+        line_tokens = estimate_tokens(line)
+        self._summary.append((line, line_tokens))
+        self._summary_line_tokens += line_tokens
+        while self._summary and self._summary_line_tokens > self.summary_tokens:
+            _, dropped = self._summary.popleft()
+            self._summary_line_tokens -= dropped
+
+    @property
+    def summary(self) -> str:
+        return "\n".join(line for line, _ in self._summary)
+
+    def token_count(self) -> int:
+        """Estimated tokens of the history portion of the prompt."""
+        return sum(estimate_tokens(m.content) for m in self.messages())
+
+    def messages(self) -> List[BaseMessage]:
+        """LangChain messages for the prompt (cached until the next `add`)."""
+        if self._cached is not None:
+            return self._cached
+        # Fold recent messages until recent + summary fit the budget
+        while len(self._recent) > 1 and (
+            self._recent_tokens + self._summary_prompt_tokens() > self.token_budget
+        ):
+            self._fold_oldest()
+        result: List[BaseMessage] = []
+        if self._summary:
+            result.append(SystemMessage(content=SUMMARY_PREFIX + self.summary))
+        remaining = self.token_budget - self._summary_prompt_tokens()
+        for role, text, tokens, message in self._recent:
+            if tokens > remaining:
+                # A single oversized message: keep its end, which is closest to now
+                text = truncate_to_tokens(text, max(remaining, 0))
+                if not text:
+                    continue
+                message = type(message)(content=text)
+            result.append(message)
+        self._cached = result
+        return result
+
+    def _summary_prompt_tokens(self) -> int:
+        if not self._summary:
+            return 0
+        return estimate_tokens(SUMMARY_PREFIX) + self._summary_line_tokens
@@ -0,0 +1,116 @@
+"""
+Zero-downtime index reloads.
+
+`HotSwapRetriever` serves retrieval from the current version of a versioned
+store (see src.versions). A daemon thread checks the CURRENT pointer every
+`poll_seconds`; when a build publishes a new version, the thread loads it
+(index, BM25 and partitions, via the `load` callable) while requests keep
+using the old one, then replaces the retriever with a single reference
+assignment. A request reads that reference once, so in-flight requests
+finish on the version they started with and never block on a reload. The
+replaced retriever's close() (if it has one) is then called to stop its
+background threads; it must keep answering requests that already hold it.
+If loading fails the old version keeps serving and the error is logged.
+After fork() (pre-fork workers, see src.prefork) the child restarts the
+watcher thread of every live retriever (one at-fork hook for the module).
+"""
+import logging
+import os
+import threading
+import weakref
+from pathlib import Path
+from typing import Callable, List, Sequence
+
+from config.settings import VECTOR_STORE_POLL_SECONDS
+from src import metrics
+from src.versions import current_version, resolve_store_path, version_path
+
+logger = logging.getLogger(__name__)
+
+Retrieve = Callable[[str, Sequence[str] | None], List]
+
+_live_retrievers: "weakref.WeakSet[HotSwapRetriever]" = weakref.WeakSet()
+
+
+def _restart_after_fork() -> None:
+    for retriever in list(_live_retrievers):
+        retriever._after_fork()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_restart_after_fork)
+
+
+class HotSwapRetriever:
+    """Callable retriever that follows the CURRENT version of a store root."""
+
+    def __init__(
+        self,
+        root: Path,
+        load: Callable[[Path], Retrieve],
+        poll_seconds: float = VECTOR_STORE_POLL_SECONDS,
+    ):
+        self.root = Path(root)
+        self._load = load
+        self.version = current_version(self.root)
+        self._retrieve = load(resolve_store_path(self.root))
+        self._failed_version: str | None = None
+        self._poll_seconds = poll_seconds
+        self._reload_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._start_watcher()
+        _live_retrievers.add(self)
+
+    def __call__(self, question: str, categories: Sequence[str] | None = None) -> List:
+        return self._retrieve(question, categories)
+
+    def check(self) -> bool:
+        """Load and swap in a newly published version; returns True if it swapped."""
+        with self._reload_lock:
+            version = current_version(self.root)
+            if version is None or version in (self.version, self._failed_version):
+                return False
+            logger.info("Loading vector store version %s in the background", version)
+            try:
+                with metrics.span("index_reload"):
+                    retrieve = self._load(version_path(self.root, version))
+            except Exception as e:
+                # Don't retry this version on every poll; a newer build will be picked up
+                self._failed_version = version
+                logger.exception("Could not load vector store version %s; still serving %s: %s",
+                                 version, self.version, e)
+                return False
+            retired, self._retrieve = self._retrieve, retrieve
+            previous, self.version = self.version, version
+            metrics.inc("index_swaps_total")
+            logger.info("Swapped vector store version %s -> %s", previous, version)
+            close = getattr(retired, "close", None)
+            if close is not None:
+                close()
+            return True
+
+    def _start_watcher(self) -> None:
+        if self._poll_seconds > 0 and not self._stop.is_set():
+            self._thread = threading.Thread(
+                target=self._watch, args=(self._poll_seconds,), name="index-watcher", daemon=True
+            )
+            self._thread.start()
+
+    def _after_fork(self) -> None:
+        # The parent's watcher thread (and any lock it held) did not come along
+        self._reload_lock = threading.Lock()
+        self._stop = threading.Event() if not self._stop.is_set() else self._stop
+        self._start_watcher()
+
+    def _watch(self, poll_seconds: float) -> None:
+        while not self._stop.wait(poll_seconds):
+            try:
+                self.check()
+            except Exception as e:  # keep watching
+                logger.exception("Index version check failed: %s", e)
+
+    def close(self) -> None:
+        """Stop watching for new versions."""
+        self._stop.set()
+        _live_retrievers.discard(self)
@@ -1,41 +1,159 @@
 """
 Data ingestion: load medical content from files and split into chunks for embedding.
-Supports JSON (e.g. FAQs) and plain text.
+Supports JSON (e.g. FAQs), JSONL and plain text.
+
+The iter_* functions stream: JSON arrays are parsed item by item, JSONL line
+by line and text files in blocks, so builds can run over corpora larger than
+memory. The load_* functions return lists for small inputs and tests.
 """
 import json
 import logging
+import multiprocessing
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from itertools import islice
 from pathlib import Path
-from typing import List
+from typing import Iterable, Iterator, List
 
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_core.documents import Document
 
-from config.settings import DATA_RAW
+from config.settings import DATA_RAW, INGEST_WORKERS
+from src.utils import estimate_tokens
 
 logger = logging.getLogger(__name__)
 
 # Chunk size tuned for embedding models (e.g. OpenAI) and retrieval quality
 CHUNK_SIZE = 400
 CHUNK_OVERLAP = 50
+# Bump when chunk metadata changes so existing indexes are rebuilt in full
+CHUNK_FORMAT_VERSION = 2
 
 
-def load_faq_json(path: Path) -> List[Document]:
+# Files that take longer than this to load and split are logged at INFO
+SLOW_FILE_SECONDS = 1.0
+# Characters read from a text file at a time (split at a paragraph break)
+TEXT_BLOCK_CHARS = 1 << 20
+# Characters read from a JSON file at a time while parsing an array
+JSON_READ_CHARS = 1 << 16
+
+
+def iter_json_array(path: Path, read_chars: int = JSON_READ_CHARS) -> Iterator:
     """
-    Load a JSON file with FAQ entries: list of {question, answer, category?}.
-    Each entry becomes one or more Document chunks.
+    Yield the items of a top-level JSON array one at a time without loading
+    the whole file. A top-level object is yielded as a single item.
     """
-    docs = []
+    decoder = json.JSONDecoder()
     with open(path, "r", encoding="utf-8") as f:
-        data = json.load(f)
-    if not isinstance(data, list):
-        data = [data]
-    for item in data:
+        buf = ""
+        pos = 0
+        eof = False
+
+        def fill() -> bool:
+            nonlocal buf, pos, eof
+            if eof:
+                return False
+            data = f.read(read_chars)
+            if not data:
+                eof = True
+                return False
+            buf = buf[pos:] + data
+            pos = 0
+            return True
+
+        def skip_ws() -> None:
+            nonlocal pos
+            while True:
+                while pos < len(buf) and buf[pos].isspace():
+                    pos += 1
+                if pos < len(buf) or not fill():
+                    return
+
+        skip_ws()
+        if pos >= len(buf):
+            return
+        if buf[pos] != "[":
+            # Not an array: parse the single top-level value
+            while fill():
+                pass
+            yield json.loads(buf[pos:])
+            return
+        pos += 1
+        while True:
+            skip_ws()
+            if pos >= len(buf):
+                raise ValueError(f"Unterminated JSON array in {path}")
+            if buf[pos] == "]":
+                return
+            if buf[pos] == ",":
+                pos += 1
+                continue
+            while True:
+                try:
+                    item, end = decoder.raw_decode(buf, pos)
+                except json.JSONDecodeError:
+                    if not fill():
+                        raise
+                    continue
+                # A number at the end of the buffer may continue in the next read
+                if end == len(buf) and not eof and fill():
+                    continue
+                break
+            pos = end
+            yield item
+
+
+def iter_faq_entries(path: Path) -> Iterator[dict]:
+    """Stream FAQ entries ({question, answer, category?}) from .json or .jsonl."""
+    if path.suffix.lower() == ".jsonl":
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        return
+    yield from iter_json_array(path)
+
+
+def iter_faq_documents(path: Path) -> Iterator[Document]:
+    """Yield one Document per FAQ entry in a .json or .jsonl file."""
+    for item in iter_faq_entries(path):
         q = item.get("question", "")
         a = item.get("answer", "")
         cat = item.get("category", "general")
         text = f"Q: {q}\nA: {a}\nCategory: {cat}"
-        docs.append(Document(page_content=text, metadata={"source": str(path), "category": cat}))
-    return docs
+        yield Document(page_content=text, metadata={"source": str(path), "category": cat})
+
+
+def load_faq_json(path: Path) -> List[Document]:
+    """
+    Load a JSON file with FAQ entries: list of {question, answer, category?}.
+    Each entry becomes one or more Document chunks.
+    """
+    return list(iter_faq_documents(path))
+
+
+def iter_text_file(path: Path, block_chars: int = TEXT_BLOCK_CHARS) -> Iterator[Document]:
+    """
+    Yield a text file as Documents of about `block_chars` characters, cut at
+    paragraph breaks where possible. Small files come back as one Document.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        carry = ""
+        data = f.read(block_chars)
+        while data:
+            following = f.read(block_chars)
+            text = carry + data
+            carry = ""
+            cut = text.rfind("\n\n") if following else -1
+            if cut > 0:
+                carry, text = text[cut + 2:], text[:cut]
+            if text:
+                yield Document(page_content=text, metadata={"source": str(path)})
+            data = following
+        if carry:
+            yield Document(page_content=carry, metadata={"source": str(path)})
 
 
 def load_text_file(path: Path) -> List[Document]:
@@ -45,42 +163,145 @@ def load_text_file(path: Path) -> List[Document]:
     return [Document(page_content=text, metadata={"source": str(path)})]
 
 
+SUPPORTED_SUFFIXES = (".json", ".jsonl", ".txt", ".md")
+
+
+def list_raw_files(data_dir: Path | None = None) -> List[Path]:
+    """Return supported files in data_dir, sorted by name for reproducible builds."""
+    data_dir = data_dir or DATA_RAW
+    if not data_dir.exists():
+        logger.warning("Data directory does not exist: %s", data_dir)
+        return []
+    return sorted(
+        p for p in data_dir.iterdir()
+        if p.is_file() and p.suffix.lower() in SUPPORTED_SUFFIXES
+    )
+
+
+def iter_raw_file(path: Path) -> Iterator[Document]:
+    """Stream Documents from one supported file; logs and stops on read errors."""
+    try:
+        if path.suffix.lower() in (".json", ".jsonl"):
+            yield from iter_faq_documents(path)
+        elif path.suffix.lower() in (".txt", ".md"):
+            yield from iter_text_file(path)
+    except Exception as e:
+        logger.exception("Failed to load %s: %s", path, e)
+
+
+@dataclass
+class SplitFile:
+    """Chunks of one raw file plus how long loading and splitting took."""
+    path: Path
+    chunks: List[Document]
+    seconds: float
+
+
+def split_file(path: Path) -> SplitFile:
+    """Load and split one file (runs in a worker process for parallel builds)."""
+    started = time.perf_counter()
+    chunks = list(iter_chunks(iter_raw_file(path)))
+    return SplitFile(path, chunks, time.perf_counter() - started)
+
+
+def iter_split_files(paths: Iterable[Path], workers: int = INGEST_WORKERS) -> Iterator[SplitFile]:
+    """
+    Load and split files across a process pool, one file per task, yielding
+    results in input order so builds stay reproducible. At most 2 * workers
+    files are in flight.
+    """
+    if workers <= 1:
+        for path in paths:
+            yield split_file(path)
+        return
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as pool:
+        in_flight: deque = deque()
+        for path in paths:
+            in_flight.append(pool.submit(split_file, path))
+            while len(in_flight) >= 2 * workers:
+                yield in_flight.popleft().result()
+        while in_flight:
+            yield in_flight.popleft().result()
+
+
+def log_file_timing(path: Path, n_chunks: int, seconds: float) -> None:
+    """Log per-file load/split time; slow files are logged at INFO."""
+    level = logging.INFO if seconds >= SLOW_FILE_SECONDS else logging.DEBUG
+    logger.log(level, "Split %s into %d chunk(s) in %.3fs", path, n_chunks, seconds)
+
+
+def load_raw_file(path: Path) -> List[Document]:
+    """Load one supported file. Returns [] (and logs) if it cannot be read."""
+    try:
+        if path.suffix.lower() in (".json", ".jsonl"):
+            return load_faq_json(path)
+        if path.suffix.lower() in (".txt", ".md"):
+            return load_text_file(path)
+    except Exception as e:
+        logger.exception("Failed to load %s: %s", path, e)
+    return []
+
+
 def load_all_raw_data(data_dir: Path | None = None) -> List[Document]:
     """
     Load all supported files from data/raw.
     Returns a list of LangChain Documents (may be large; split in next step).
     """
     data_dir = data_dir or DATA_RAW
-    if not data_dir.exists():
-        logger.warning("Data directory does not exist: %s", data_dir)
-        return []
     documents = []
-    for path in data_dir.iterdir():
-        if path.suffix.lower() == ".json":
-            try:
-                documents.extend(load_faq_json(path))
-            except Exception as e:
-                logger.exception("Failed to load %s: %s", path, e)
-        elif path.suffix.lower() in (".txt", ".md"):
-            try:
-                documents.extend(load_text_file(path))
-            except Exception as e:
-                logger.exception("Failed to load %s: %s", path, e)
+    for path in list_raw_files(data_dir):
+        documents.extend(load_raw_file(path))
     logger.info("Loaded %d document(s) from %s", len(documents), data_dir)
     return documents
 
 
-def split_documents(documents: List[Document]) -> List[Document]:
-    """
-    Split documents into smaller chunks for embedding.
-    Uses RecursiveCharacterTextSplitter to keep sentences intact when possible.
-    """
-    splitter = RecursiveCharacterTextSplitter(
+def _splitter() -> RecursiveCharacterTextSplitter:
+    return RecursiveCharacterTextSplitter(
         chunk_size=CHUNK_SIZE,
         chunk_overlap=CHUNK_OVERLAP,
         length_function=len,
         separators=["\n\n", "\n", ". ", " ", ""],
+        add_start_index=True,
     )
-    chunks = splitter.split_documents(documents)
+
+
+def split_documents(documents: List[Document]) -> List[Document]:
+    """
+    Split documents into smaller chunks for embedding.
+    Uses RecursiveCharacterTextSplitter to keep sentences intact when possible.
+    """
+    chunks = _splitter().split_documents(documents)
     logger.info("Split into %d chunks", len(chunks))
     return chunks
+
+
+def iter_chunks(documents: Iterable[Document]) -> Iterator[Document]:
+    """
+    Streaming split_documents: yields chunks one input Document at a time.
+
+    Each chunk's metadata also gets `part` (index of its input Document within
+    the source), `start_index` (offset within that Document) and `n_tokens`
+    (estimated LLM tokens), which the context packer uses to merge overlapping
+    chunks and budget the prompt without re-tokenizing.
+    """
+    splitter = _splitter()
+    parts: dict = {}
+    for doc in documents:
+        source = doc.metadata.get("source", "")
+        part = parts.get(source, 0)
+        parts[source] = part + 1
+        for chunk in splitter.split_documents([doc]):
+            chunk.metadata["part"] = part
+            chunk.metadata["n_tokens"] = estimate_tokens(chunk.page_content)
+            yield chunk
+
+
+def batched(items: Iterable, size: int) -> Iterator[list]:
+    """Yield lists of up to `size` items."""
+    it = iter(items)
+    while True:
+        batch = list(islice(it, size))
+        if not batch:
+            return
+        yield batch
@@ -0,0 +1,217 @@
+"""
+Lexical (BM25) retrieval and hybrid fusion with vector search.
+
+Embedding similarity alone often misses exact drug names and rare terms.
+At build time a BM25 inverted index is created from the same chunks as the
+FAISS index (rows line up with FAISS rows) and saved as lexical.npz. At
+query time lexical and vector rankings are merged with reciprocal rank
+fusion (RRF). BM25 weights are precomputed per posting, so a query is a few
+numpy scatter-adds plus a partial sort. The vocabulary is saved as one UTF-8
+byte string plus term offsets (indexes saved with a fixed-width unicode
+`vocab` array still load).
+"""
+import logging
+import re
+from array import array
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+from config.settings import HYBRID_CANDIDATES, RRF_K
+from src import metrics
+from src.versions import resolve_store_path
+
+logger = logging.getLogger(__name__)
+
+LEXICAL_FILE = "lexical.npz"
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased word tokens (letters, digits, underscore)."""
+    return _TOKEN_RE.findall(text.lower())
+
+
+class BM25Index:
+    """
+    Inverted index with precomputed BM25 weights.
+    Postings for term t are rows[starts[t]:starts[t+1]] / weights[...].
+    """
+
+    def __init__(self, vocab: Sequence[str], starts: np.ndarray, rows: np.ndarray,
+                 weights: np.ndarray, n_docs: int):
+        self.vocab = {term: i for i, term in enumerate(vocab)}
+        self.starts = starts
+        self.rows = rows
+        self.weights = weights
+        self.n_docs = n_docs
+
+    @classmethod
+    def build(cls, texts: Iterable[str], k1: float = BM25_K1, b: float = BM25_B) -> "BM25Index":
+        """
+        Stream `texts` (one per FAISS row) into an index. Postings are
+        collected as flat int32 (term id, row, tf) arrays, about 12 bytes per
+        distinct term in a chunk, instead of per-term lists of Python tuples,
+        then grouped by term with one stable sort (rows stay in order).
+        """
+        term_ids: Dict[str, int] = {}
+        post_terms, post_rows, post_tfs, lengths = array("i"), array("i"), array("i"), array("i")
+        for row, text in enumerate(texts):
+            tokens = tokenize(text)
+            lengths.append(len(tokens))
+            for term, tf in Counter(tokens).items():
+                post_terms.append(term_ids.setdefault(term, len(term_ids)))
+                post_rows.append(row)
+                post_tfs.append(tf)
+        n = len(lengths)
+        doc_lengths = np.frombuffer(lengths, dtype=np.int32).astype(np.float64)
+        avgdl = float(doc_lengths.mean()) if n else 0.0
+        vocab = sorted(term_ids)
+        # Term ids were assigned in order of appearance; renumber them alphabetically
+        alphabetical = np.empty(len(vocab), dtype=np.int32)
+        alphabetical[[term_ids[term] for term in vocab]] = np.arange(len(vocab), dtype=np.int32)
+        del term_ids
+        terms = alphabetical[np.frombuffer(post_terms, dtype=np.int32)]
+        del post_terms
+        order = np.argsort(terms, kind="stable")
+        terms = terms[order]
+        rows = np.frombuffer(post_rows, dtype=np.int32)[order]
+        del post_rows
+        tf = np.frombuffer(post_tfs, dtype=np.int32)[order].astype(np.float64)
+        del post_tfs, order
+        df = np.bincount(terms, minlength=len(vocab))
+        starts = np.zeros(len(vocab) + 1, dtype=np.int64)
+        np.cumsum(df, out=starts[1:])
+        idf = np.log(1.0 + (n - df + 0.5) / (df + 0.5))
+        norm = k1 * (1.0 - b + b * doc_lengths[rows] / avgdl) if avgdl else k1
+        weights = idf[terms] * tf * (k1 + 1.0) / (tf + norm)
+        return cls(vocab, starts, rows, weights.astype(np.float32), n)
+
+    def search(self, query: str, k: int, allowed: np.ndarray | None = None) -> List[Tuple[int, float]]:
+        """
+        Return up to k (row, score) pairs with score > 0, best first.
+        `allowed` (boolean mask over rows) restricts the rows that can match.
+        """
+        scores = np.zeros(self.n_docs, dtype=np.float32)
+        for term in set(tokenize(query)):
+            t = self.vocab.get(term)
+            if t is None:
+                continue
+            lo, hi = self.starts[t], self.starts[t + 1]
+            scores[self.rows[lo:hi]] += self.weights[lo:hi]
+        if allowed is not None:
+            scores[~allowed] = 0.0
+        hits = np.flatnonzero(scores)
+        if len(hits) > k:
+            hits = hits[np.argpartition(-scores[hits], k - 1)[:k]]
+        hits = hits[np.argsort(-scores[hits], kind="stable")]
+        return [(int(r), float(scores[r])) for r in hits]
+
+    def save(self, persist_path: Path) -> None:
+        encoded = [term.encode("utf-8") for term in sorted(self.vocab, key=self.vocab.get)]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(term) for term in encoded], out=offsets[1:])
+        np.savez(
+            Path(persist_path) / LEXICAL_FILE,
+            vocab_bytes=np.frombuffer(b"".join(encoded), dtype=np.uint8),
+            vocab_offsets=offsets,
+            starts=self.starts,
+            rows=self.rows,
+            weights=self.weights,
+            n_docs=np.asarray([self.n_docs], dtype=np.int64),
+        )
+
+    @classmethod
+    def load(cls, persist_path: Path) -> "BM25Index":
+        with np.load(Path(persist_path) / LEXICAL_FILE, allow_pickle=False) as data:
+            if "vocab_offsets" in data:
+                blob, offsets = data["vocab_bytes"].tobytes(), data["vocab_offsets"].tolist()
+                vocab = [blob[lo:hi].decode("utf-8") for lo, hi in zip(offsets, offsets[1:])]
+            else:
+                vocab = data["vocab"].tolist()
+            return cls(vocab, data["starts"], data["rows"], data["weights"], int(data["n_docs"][0]))
+
+
+def build_lexical_index(vector_store, persist_path: Path) -> BM25Index:
+    """Build and save a BM25 index over the chunks of `vector_store`, in row order."""
+    texts = (
+        vector_store.docstore.search(vector_store.index_to_docstore_id[row]).page_content
+        for row in range(vector_store.index.ntotal)
+    )
+    index = BM25Index.build(texts)
+    index.save(persist_path)
+    logger.info("BM25 index saved (%d terms, %d postings)", len(index.vocab), len(index.rows))
+    return index
+
+
+def load_lexical_index(persist_path: Path) -> BM25Index | None:
+    """Load lexical.npz, or return None if the store has no lexical index."""
+    persist_path = resolve_store_path(persist_path)
+    if not (persist_path / LEXICAL_FILE).exists():
+        return None
+    return BM25Index.load(persist_path)
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[int]], k: int = RRF_K) -> List[int]:
+    """Merge ranked row lists; each list contributes 1 / (k + rank)."""
+    scores = defaultdict(float)
+    for ranking in rankings:
+        for rank, row in enumerate(ranking, start=1):
+            scores[row] += 1.0 / (k + rank)
+    return sorted(scores, key=lambda row: (-scores[row], row))
+
+
+def vector_rows(vector_store, query: str, k: int) -> List[int]:
+    """FAISS row ids of the k nearest chunks to `query`."""
+    with metrics.span("retrieve.embed_query"):
+        vector = np.asarray([vector_store.embeddings.embed_query(query)], dtype=np.float32)
+    if getattr(vector_store, "_normalize_L2", False):
+        vector /= np.linalg.norm(vector, axis=1, keepdims=True)
+    with metrics.span("retrieve.vector_search"):
+        _, indices = vector_store.index.search(vector, k)
+    return [int(i) for i in indices[0] if i != -1]
+
+
+def rows_to_documents(vector_store, rows: Sequence[int]) -> List[Document]:
+    """Look up the documents stored at FAISS rows."""
+    docs = []
+    with metrics.span("retrieve.docstore"):
+        for row in rows:
+            doc = vector_store.docstore.search(vector_store.index_to_docstore_id[row])
+            if isinstance(doc, Document):
+                docs.append(doc)
+    return docs
+
+
+class HybridRetriever:
+    """Fuses BM25 and vector rankings with RRF and returns the top-k documents."""
+
+    def __init__(
+        self,
+        vector_store,
+        lexical_index: BM25Index,
+        k: int,
+        candidates: int = HYBRID_CANDIDATES,
+        vector_search: Callable[[str], List[int]] | None = None,
+    ):
+        self.vector_store = vector_store
+        self.lexical_index = lexical_index
+        self.k = k
+        self.candidates = max(candidates, k)
+        self.vector_search = vector_search or (
+            lambda q: vector_rows(vector_store, q, self.candidates)
+        )
+
+    def invoke(self, query: str) -> List[Document]:
+        dense = self.vector_search(query)
+        with metrics.span("retrieve.lexical_search"):
+            sparse = [row for row, _ in self.lexical_index.search(query, self.candidates)]
+        with metrics.span("retrieve.fusion"):
+            fused = reciprocal_rank_fusion([dense, sparse])[: self.k]
+        return rows_to_documents(self.vector_store, fused)
@@ -0,0 +1,107 @@
+"""
+Build manifest: content hashes of raw files and their chunks.
+
+Saved as manifest.json next to the FAISS index so `build_faiss_index` can
+embed only new or changed chunks and delete vectors for removed ones.
+A manifest is only reused when the chunking parameters and embedding model
+match the current build; otherwise the index is rebuilt from scratch.
+"""
+import hashlib
+import json
+import logging
+from pathlib import Path
+from typing import Dict
+
+from langchain_core.documents import Document
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILE = "manifest.json"
+MANIFEST_VERSION = 1
+
+
+def file_sha256(path: Path) -> str:
+    """Hash a file's bytes in 1 MiB blocks."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+class ChunkIdAssigner:
+    """
+    Streaming chunk id generator: a stable content-derived id per chunk.
+    Identical chunks from the same source get distinct ids by occurrence.
+    """
+
+    def __init__(self):
+        self._seen: Dict[str, int] = {}
+
+    def __call__(self, doc: Document) -> str:
+        base = hashlib.sha256(
+            "\0".join([
+                str(doc.metadata.get("source", "")),
+                doc.page_content,
+                json.dumps(doc.metadata, sort_keys=True, default=str),
+            ]).encode("utf-8")
+        ).hexdigest()[:32]
+        n = self._seen.get(base, 0)
+        self._seen[base] = n + 1
+        return base if n == 0 else f"{base}-{n}"
+
+
+def build_params(
+    chunk_size: int,
+    chunk_overlap: int,
+    embedding_model: str,
+    index_spec: str = "Flat",
+    chunk_format: int = 1,
+    dedup_threshold: float | None = None,
+) -> dict:
+    """Parameters that invalidate every stored vector when they change."""
+    return {
+        "chunk_size": chunk_size,
+        "chunk_overlap": chunk_overlap,
+        "chunk_format": chunk_format,
+        "dedup_threshold": dedup_threshold,
+        "embedding_model": embedding_model,
+        "index_spec": index_spec,
+    }
+
+
+def read_manifest(persist_path: Path) -> dict | None:
+    """Return the saved manifest, or None if missing or unreadable."""
+    path = Path(persist_path) / MANIFEST_FILE
+    if not path.exists():
+        return None
+    try:
+        manifest = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError) as e:
+        logger.warning("Ignoring unreadable manifest %s: %s", path, e)
+        return None
+    if manifest.get("version") != MANIFEST_VERSION:
+        return None
+    return manifest
+
+
+def write_manifest(
+    persist_path: Path, params: dict, files: Dict[str, dict], duplicates: Dict[str, str] | None = None
+) -> None:
+    """
+    Write manifest.json. `files` maps source -> {"sha256", "chunks"};
+    `duplicates` maps chunk ids that were not indexed to the chunk that
+    represents them (see src.dedup).
+    """
+    manifest = {"version": MANIFEST_VERSION, "params": params, "files": files}
+    if duplicates:
+        manifest["duplicates"] = duplicates
+    (Path(persist_path) / MANIFEST_FILE).write_text(
+        json.dumps(manifest, indent=1, sort_keys=True),
+        encoding="utf-8",
+    )
+
+
+def manifest_chunk_ids(manifest: dict) -> set:
+    """All chunk ids recorded in a manifest."""
+    return {cid for entry in manifest.get("files", {}).values() for cid in entry["chunks"]}
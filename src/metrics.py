@@ -0,0 +1,342 @@
+"""
+Per-stage latency tracing and metrics (Prometheus text export).
+
+Code marks stages with `span("retrieve.vector_search")` and counts events
+with `inc("cache_lookups_total", result="hit")`. A `request_trace("chat")`
+around a request collects the time of every span entered during it (also
+across LangChain's worker threads, which copy the context) and, when it ends,
+logs one structured JSON line per request. Spans feed the
+`medchat_stage_seconds` histogram; counters and histograms are rendered in
+Prometheus text format by `render_prometheus()` (served on /metrics by
+server.py).
+
+With METRICS_ENABLED off (the default), `span` returns a shared no-op
+context manager and `inc` / `observe` return immediately, so instrumented
+code pays one global lookup per call.
+"""
+import contextlib
+import contextvars
+import json
+import logging
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from typing import AsyncIterator, Callable, Dict, Iterable, Iterator, Tuple
+
+from config.settings import METRICS_ENABLED, METRICS_LOG_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+METRIC_PREFIX = "medchat_"
+# Histogram bucket upper bounds in seconds
+LATENCY_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+)
+
+_enabled = METRICS_ENABLED
+_log_requests = METRICS_LOG_REQUESTS
+_lock = threading.Lock()
+_counters: Dict[Tuple[str, Tuple], float] = defaultdict(float)
+# (name, labels) -> [bucket counts..., +Inf count], sum
+_histograms: Dict[Tuple[str, Tuple], list] = {}
+_trace: contextvars.ContextVar = contextvars.ContextVar("metrics_trace", default=None)
+
+_HELP = {
+    "stage_seconds": "Time spent in each pipeline stage.",
+    "request_seconds": "End-to-end request time.",
+    "requests_total": "Requests handled, by kind and outcome.",
+    "cache_lookups_total": "FAQ and semantic cache lookups, by cache and result.",
+    "tokens_total": "Estimated or reported LLM tokens, by kind.",
+    "build_chunks_total": "Chunks embedded by index builds.",
+    "partition_searches_total": "Category partitions searched by routed retrieval.",
+    "safety_blocks_total": "User messages blocked by a safety rule, by rule id.",
+    "singleflight_coalesced_total": "Requests that shared an identical in-flight LLM call, by kind.",
+    "retrieval_batches_total": "Micro-batched retrieval searches, by number of queries in the batch.",
+    "conversation_log_dropped_total": "Conversation log records dropped because the queue was full.",
+}
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def enable(on: bool = True, log_requests: bool | None = None) -> None:
+    """Turn metrics on or off at runtime (settings give the initial state)."""
+    global _enabled, _log_requests
+    _enabled = on
+    if log_requests is not None:
+        _log_requests = log_requests
+
+
+def reset() -> None:
+    """Clear all recorded metrics."""
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+
+
+def _key(name: str, labels: dict) -> Tuple[str, Tuple]:
+    return name, tuple(sorted(labels.items()))
+
+
+def inc(name: str, value: float = 1.0, **labels) -> None:
+    """Add `value` to a counter (and to the current request's counters)."""
+    if not _enabled:
+        return
+    with _lock:
+        _counters[_key(name, labels)] += value
+    trace = _trace.get()
+    if trace is not None:
+        label = ",".join(str(v) for _, v in sorted(labels.items()))
+        field = f"{name}[{label}]" if label else name
+        trace.counters[field] = trace.counters.get(field, 0) + value
+
+
+def observe(name: str, seconds: float, **labels) -> None:
+    """Record one histogram sample."""
+    if not _enabled:
+        return
+    i = bisect_left(LATENCY_BUCKETS, seconds)
+    with _lock:
+        hist = _histograms.get(_key(name, labels))
+        if hist is None:
+            hist = _histograms[_key(name, labels)] = [[0] * (len(LATENCY_BUCKETS) + 1), 0.0]
+        hist[0][i] += 1
+        hist[1] += seconds
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP = _NoopSpan()
+
+
+class _Span:
+    __slots__ = ("stage", "started")
+
+    def __init__(self, stage: str):
+        self.stage = stage
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        seconds = time.perf_counter() - self.started
+        observe("stage_seconds", seconds, stage=self.stage)
+        trace = _trace.get()
+        if trace is not None:
+            trace.stages[self.stage] = trace.stages.get(self.stage, 0.0) + seconds
+        return False
+
+
+def span(stage: str):
+    """Context manager timing one pipeline stage (repeated entries add up)."""
+    return _Span(stage) if _enabled else _NOOP
+
+
+def record_stage(stage: str, seconds: float) -> None:
+    """Record a stage timed elsewhere (e.g. in a worker process)."""
+    if not _enabled:
+        return
+    observe("stage_seconds", seconds, stage=stage)
+    trace = _trace.get()
+    if trace is not None:
+        trace.stages[stage] = trace.stages.get(stage, 0.0) + seconds
+
+
+class _Trace:
+    __slots__ = ("kind", "stages", "counters", "outcome", "started", "token")
+
+    def __init__(self, kind: str):
+        self.kind = kind
+        self.stages: Dict[str, float] = {}
+        self.counters: Dict[str, float] = {}
+        self.outcome = "ok"
+
+    def set_outcome(self, outcome: str) -> None:
+        self.outcome = outcome
+
+    def __enter__(self):
+        self.start()
+        self.token = _trace.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _trace.reset(self.token)
+        self.finish(exc_type is not None)
+        return False
+
+    def start(self) -> None:
+        self.started = time.perf_counter()
+
+    @contextlib.contextmanager
+    def active(self):
+        """Make this the current trace for the duration of the block only."""
+        token = _trace.set(self)
+        try:
+            yield self
+        finally:
+            _trace.reset(token)
+
+    def finish(self, failed: bool = False) -> None:
+        seconds = time.perf_counter() - self.started
+        if failed:
+            self.outcome = "error"
+        observe("request_seconds", seconds, kind=self.kind)
+        inc("requests_total", kind=self.kind, outcome=self.outcome)
+        if _log_requests:
+            logger.info(json.dumps({
+                "event": "request",
+                "kind": self.kind,
+                "outcome": self.outcome,
+                "seconds": round(seconds, 6),
+                "stages": {k: round(v, 6) for k, v in self.stages.items()},
+                "counters": self.counters,
+            }, sort_keys=True))
+
+
+class _NoopTrace(_NoopSpan):
+    __slots__ = ()
+
+    def set_outcome(self, outcome: str) -> None:
+        pass
+
+    def start(self) -> None:
+        pass
+
+    def active(self):
+        return _NOOP
+
+    def finish(self, failed: bool = False) -> None:
+        pass
+
+
+_NOOP_TRACE = _NoopTrace()
+
+
+def request_trace(kind: str):
+    """
+    Context manager for one request: collects its spans and counters, then
+    records request_seconds / requests_total and logs a JSON summary line.
+    Use `.set_outcome(...)` on the returned object to label the result.
+    """
+    return _Trace(kind) if _enabled else _NOOP_TRACE
+
+
+def traced_stream(kind: str, stream: Callable[[object], Iterator]) -> Iterator:
+    """
+    Request trace for a generator: `stream(trace)` creates the generator,
+    whose items are passed through. The trace is only current while the
+    generator runs (set around each resume, not held across yields), since
+    its consumer may resume or close it from a different context.
+    """
+    trace = request_trace(kind)
+    trace.start()
+    failed, gen = False, None
+    try:
+        with trace.active():
+            gen = stream(trace)
+        while True:
+            with trace.active():
+                try:
+                    item = next(gen)
+                except StopIteration:
+                    return
+            yield item
+    except BaseException:
+        failed = True
+        raise
+    finally:
+        if gen is not None:
+            with trace.active():
+                gen.close()
+        trace.finish(failed)
+
+
+async def atraced_stream(kind: str, stream: Callable[[object], AsyncIterator]) -> AsyncIterator:
+    """Async variant of traced_stream (safe to aclose() from another task)."""
+    trace = request_trace(kind)
+    trace.start()
+    failed, agen = False, None
+    try:
+        with trace.active():
+            agen = stream(trace)
+        while True:
+            with trace.active():
+                try:
+                    item = await agen.__anext__()
+                except StopAsyncIteration:
+                    return
+            yield item
+    except BaseException:
+        failed = True
+        raise
+    finally:
+        if agen is not None:
+            with trace.active():
+                await agen.aclose()
+        trace.finish(failed)
+
+
+def current_trace():
+    """The request trace in progress in this context, or None."""
+    return _trace.get()
+
+
+def _format_labels(labels: Iterable[Tuple[str, str]]) -> str:
+    parts = []
+    for k, v in labels:
+        v = str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        parts.append(f'{k}="{v}"')
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def render_prometheus() -> str:
+    """All metrics in the Prometheus text exposition format (version 0.0.4)."""
+    with _lock:
+        counters = sorted(_counters.items())
+        histograms = sorted((k, (list(v[0]), v[1])) for k, v in _histograms.items())
+    lines = []
+    seen = set()
+    for (name, labels), value in counters:
+        full = METRIC_PREFIX + name
+        if full not in seen:
+            seen.add(full)
+            lines.append(f"# HELP {full} {_HELP.get(name, name)}")
+            lines.append(f"# TYPE {full} counter")
+        lines.append(f"{full}{_format_labels(labels)} {value:g}")
+    for (name, labels), (buckets, total) in histograms:
+        full = METRIC_PREFIX + name
+        if full not in seen:
+            seen.add(full)
+            lines.append(f"# HELP {full} {_HELP.get(name, name)}")
+            lines.append(f"# TYPE {full} histogram")
+        cumulative = 0
+        for bound, n in zip(LATENCY_BUCKETS + (float("inf"),), buckets):
+            cumulative += n
+            le = "+Inf" if bound == float("inf") else f"{bound:g}"
+            lines.append(f"{full}_bucket{_format_labels(labels + (('le', le),))} {cumulative}")
+        lines.append(f"{full}_sum{_format_labels(labels)} {total:.6f}")
+        lines.append(f"{full}_count{_format_labels(labels)} {cumulative}")
+    return "\n".join(lines) + "\n"
+
+
+def snapshot() -> dict:
+    """Counters and histogram counts/sums as a plain dict (for tests and debugging)."""
+    with _lock:
+        return {
+            "counters": {f"{n}{_format_labels(l)}": v for (n, l), v in _counters.items()},
+            "histograms": {
+                f"{n}{_format_labels(l)}": {"count": sum(h[0]), "sum": h[1]}
+                for (n, l), h in _histograms.items()
+            },
+        }
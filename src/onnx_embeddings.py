@@ -0,0 +1,130 @@
+"""
+Optional ONNX Runtime embedding backend (EMBEDDING_BACKEND=onnx).
+
+all-MiniLM-L6-v2 is exported once to ONNX and quantized to int8 with dynamic
+quantization (`scripts/export_onnx_model.py`, needs torch and transformers).
+At runtime only onnxruntime, tokenizers and numpy are needed: texts are
+tokenized, run through the int8 model with ONNX_THREADS intra-op threads,
+mean-pooled over the attention mask and L2-normalized, which reproduces the
+sentence-transformers output. `cosine_parity` measures the drift against
+the torch model; the index build runs it on a sample of chunks.
+"""
+import logging
+from pathlib import Path
+from typing import Dict, List, Sequence
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from config.settings import EMBED_BATCH_SIZE, ONNX_MODEL_DIR, ONNX_THREADS
+
+logger = logging.getLogger(__name__)
+
+ONNX_MODEL_FILE = "model_int8.onnx"
+TOKENIZER_FILE = "tokenizer.json"
+MAX_SEQ_LENGTH = 256  # same as the sentence-transformers config for MiniLM
+ONNX_OPSET = 14
+
+
+def export_onnx_model(model_name: str, output_dir: Path = ONNX_MODEL_DIR) -> Path:
+    """
+    Export `model_name` (a HuggingFace encoder) to ONNX, quantize its weights
+    to int8 and save it with its tokenizer in `output_dir`. Returns the path
+    of the quantized model.
+    """
+    import torch
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    from transformers import AutoModel, AutoTokenizer
+
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModel.from_pretrained(model_name).eval()
+    sample = tokenizer(["warm up"], return_tensors="pt")
+    names = [n for n in ("input_ids", "attention_mask", "token_type_ids") if n in sample]
+    fp32_path = output_dir / "model_fp32.onnx"
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            tuple(sample[n] for n in names),
+            str(fp32_path),
+            input_names=names,
+            output_names=["last_hidden_state"],
+            dynamic_axes={n: {0: "batch", 1: "sequence"} for n in names + ["last_hidden_state"]},
+            opset_version=ONNX_OPSET,
+        )
+    int8_path = output_dir / ONNX_MODEL_FILE
+    quantize_dynamic(str(fp32_path), str(int8_path), weight_type=QuantType.QInt8)
+    fp32_path.unlink()
+    tokenizer.save_pretrained(str(output_dir))
+    logger.info("Exported %s to %s (int8, %.1f MB)", model_name, int8_path,
+                int8_path.stat().st_size / 1e6)
+    return int8_path
+
+
+class OnnxEmbeddings(Embeddings):
+    """Sentence embeddings from an int8 ONNX export of a MiniLM-style encoder."""
+
+    def __init__(
+        self,
+        model_dir: Path = ONNX_MODEL_DIR,
+        threads: int = ONNX_THREADS,
+        batch_size: int = EMBED_BATCH_SIZE,
+    ):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        self.model_dir = Path(model_dir)
+        model_path = self.model_dir / ONNX_MODEL_FILE
+        if not model_path.exists():
+            raise FileNotFoundError(
+                f"ONNX embedding model not found at {model_path}. "
+                "Run: python scripts/export_onnx_model.py"
+            )
+        self.threads = threads
+        self.batch_size = max(1, batch_size)
+        self.tokenizer = Tokenizer.from_file(str(self.model_dir / TOKENIZER_FILE))
+        self.tokenizer.enable_truncation(MAX_SEQ_LENGTH)
+        self.tokenizer.enable_padding()
+        options = ort.SessionOptions()
+        if threads > 0:
+            options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(
+            str(model_path), options, providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+    def _embed(self, texts: Sequence[str]) -> np.ndarray:
+        encoded = self.tokenizer.encode_batch(list(texts))
+        mask = np.asarray([e.attention_mask for e in encoded], dtype=np.int64)
+        feeds: Dict[str, np.ndarray] = {
+            "input_ids": np.asarray([e.ids for e in encoded], dtype=np.int64),
+            "attention_mask": mask,
+            "token_type_ids": np.asarray([e.type_ids for e in encoded], dtype=np.int64),
+        }
+        hidden = self.session.run(None, {k: v for k, v in feeds.items() if k in self.input_names})[0]
+        weights = mask[:, :, None].astype(np.float32)
+        pooled = (hidden * weights).sum(axis=1) / np.maximum(weights.sum(axis=1), 1e-9)
+        return pooled / np.maximum(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        vectors = [
+            self._embed(texts[i:i + self.batch_size])
+            for i in range(0, len(texts), self.batch_size)
+        ]
+        return np.concatenate(vectors).tolist() if vectors else []
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed([text])[0].tolist()
+
+
+def cosine_parity(texts: Sequence[str], embeddings: Embeddings, reference: Embeddings) -> Dict[str, float]:
+    """Cosine similarity between two backends' vectors for `texts` (1.0 = identical)."""
+    a = np.asarray(embeddings.embed_documents(list(texts)), dtype=np.float32)
+    b = np.asarray(reference.embed_documents(list(texts)), dtype=np.float32)
+    a /= np.maximum(np.linalg.norm(a, axis=1, keepdims=True), 1e-12)
+    b /= np.maximum(np.linalg.norm(b, axis=1, keepdims=True), 1e-12)
+    cos = (a * b).sum(axis=1)
+    return {"samples": len(texts), "min_cosine": float(cos.min()), "mean_cosine": float(cos.mean())}
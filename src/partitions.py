@@ -0,0 +1,235 @@
+"""
+Category-partitioned sub-indexes with query routing.
+
+FAQ chunks carry a `category` (symptoms, medication, ...; text files fall
+under "general"). With CATEGORY_PARTITIONS on, the build also writes one
+exact sub-index per category plus the category centroids (mean normalized
+chunk vector) under partitions/ next to the store. A query is compared with
+the centroids and only the PARTITION_PROBE closest partitions are searched,
+so search cost grows with the size of a partition rather than the corpus,
+and chunks from unrelated categories stay out of the prompt. Callers can
+also name the categories to search explicitly.
+
+Sub-index rows map back to rows of the main index, so documents are still
+read from the main docstore and BM25 results can be restricted to the
+same rows.
+
+Layout of the partitions/ directory:
+    partitions.json   {"categories": [...], "starts": [...]} (rows.npy slices)
+    centroids.npy     float32 (n_categories, dim), L2-normalized
+    rows.npy          int64 main-index rows, grouped by category
+    <i>.faiss         flat sub-index for categories[i]
+"""
+import json
+import logging
+import shutil
+from pathlib import Path
+from typing import Dict, List, Sequence
+
+import faiss
+import numpy as np
+from langchain_core.documents import Document
+
+from config.settings import EMBED_BATCH_SIZE, HYBRID_CANDIDATES, PARTITION_PROBE
+from src import metrics
+from src.lexical import BM25Index, reciprocal_rank_fusion, rows_to_documents
+from src.store import read_index
+from src.versions import resolve_store_path
+
+logger = logging.getLogger(__name__)
+
+PARTITIONS_DIR = "partitions"
+PARTITIONS_FILE = "partitions.json"
+CENTROIDS_FILE = "centroids.npy"
+ROWS_FILE = "rows.npy"
+DEFAULT_CATEGORY = "general"
+
+
+def category_of(metadata: dict) -> str:
+    """Partition a chunk belongs to (DEFAULT_CATEGORY if it has no category)."""
+    return str(metadata.get("category") or DEFAULT_CATEGORY)
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+
+def _index_vectors(vector_store) -> np.ndarray:
+    """All vectors of the main index in row order (re-embedded if the index type can't return them)."""
+    index = vector_store.index
+    try:
+        return index.reconstruct_n(0, index.ntotal)
+    except RuntimeError as e:
+        logger.info("Index cannot reconstruct vectors (%s); re-embedding chunks for partitions", e)
+    texts = [
+        vector_store.docstore.search(vector_store.index_to_docstore_id[row]).page_content
+        for row in range(index.ntotal)
+    ]
+    vectors = [
+        vector_store.embeddings.embed_documents(texts[i:i + EMBED_BATCH_SIZE])
+        for i in range(0, len(texts), EMBED_BATCH_SIZE)
+    ]
+    return np.asarray([v for batch in vectors for v in batch], dtype=np.float32)
+
+
+class PartitionedIndex:
+    """Per-category flat sub-indexes of one store, routed by category centroid."""
+
+    def __init__(self, categories: Sequence[str], starts: np.ndarray, rows: np.ndarray,
+                 centroids: np.ndarray, indexes: Sequence):
+        self.categories = list(categories)
+        self.starts = starts
+        self.rows = rows
+        self.centroids = centroids
+        self.indexes = list(indexes)
+        self._positions = {name: i for i, name in enumerate(self.categories)}
+
+    def __len__(self) -> int:
+        return len(self.categories)
+
+    def sizes(self) -> Dict[str, int]:
+        return {name: int(self.starts[i + 1] - self.starts[i]) for i, name in enumerate(self.categories)}
+
+    def _partition(self, category: str) -> int:
+        try:
+            return self._positions[category]
+        except KeyError:
+            raise ValueError(
+                f"Unknown category {category!r}; expected one of {self.categories}"
+            ) from None
+
+    def route(self, vector: np.ndarray, probe: int = PARTITION_PROBE) -> List[str]:
+        """The `probe` categories whose centroids are closest (cosine) to `vector`."""
+        scores = self.centroids @ _normalize(vector.reshape(1, -1))[0]
+        best = np.argsort(-scores, kind="stable")[: max(1, probe)]
+        return [self.categories[i] for i in best]
+
+    def search(self, vector: np.ndarray, k: int, categories: Sequence[str]) -> List[int]:
+        """Main-index rows of the k nearest chunks to `vector` within `categories`."""
+        query = vector.reshape(1, -1).astype(np.float32)
+        hits = []
+        for category in categories:
+            i = self._partition(category)
+            distances, indices = self.indexes[i].search(query, k)
+            rows = self.rows[self.starts[i]:self.starts[i + 1]]
+            hits.extend((float(d), int(rows[j])) for d, j in zip(distances[0], indices[0]) if j != -1)
+        hits.sort()
+        return [row for _, row in hits[:k]]
+
+    def row_mask(self, categories: Sequence[str], n_rows: int) -> np.ndarray:
+        """Boolean mask over main-index rows that belong to `categories`."""
+        mask = np.zeros(n_rows, dtype=bool)
+        for category in categories:
+            i = self._partition(category)
+            mask[self.rows[self.starts[i]:self.starts[i + 1]]] = True
+        return mask
+
+    def save(self, persist_path: Path) -> None:
+        directory = Path(persist_path) / PARTITIONS_DIR
+        if directory.exists():
+            shutil.rmtree(directory)
+        directory.mkdir(parents=True)
+        np.save(directory / CENTROIDS_FILE, self.centroids)
+        np.save(directory / ROWS_FILE, self.rows)
+        for i, index in enumerate(self.indexes):
+            faiss.write_index(index, str(directory / f"{i}.faiss"))
+        (directory / PARTITIONS_FILE).write_text(
+            json.dumps({"categories": self.categories, "starts": self.starts.tolist()}),
+            encoding="utf-8",
+        )
+
+    @classmethod
+    def load(cls, persist_path: Path) -> "PartitionedIndex":
+        directory = Path(persist_path) / PARTITIONS_DIR
+        meta = json.loads((directory / PARTITIONS_FILE).read_text(encoding="utf-8"))
+        return cls(
+            meta["categories"],
+            np.asarray(meta["starts"], dtype=np.int64),
+            np.load(directory / ROWS_FILE, mmap_mode="r"),
+            np.load(directory / CENTROIDS_FILE),
+            [read_index(directory / f"{i}.faiss", True) for i in range(len(meta["categories"]))],
+        )
+
+
+def build_partitions(vector_store, persist_path: Path) -> PartitionedIndex:
+    """Build and save one sub-index per category of the chunks in `vector_store`."""
+    by_category: Dict[str, List[int]] = {}
+    for row in range(vector_store.index.ntotal):
+        doc = vector_store.docstore.search(vector_store.index_to_docstore_id[row])
+        metadata = doc.metadata if isinstance(doc, Document) else {}
+        by_category.setdefault(category_of(metadata), []).append(row)
+    vectors = np.asarray(_index_vectors(vector_store), dtype=np.float32)
+
+    categories = sorted(by_category)
+    starts = np.zeros(len(categories) + 1, dtype=np.int64)
+    rows, centroids, indexes = [], [], []
+    for i, category in enumerate(categories):
+        members = np.asarray(by_category[category], dtype=np.int64)
+        index = faiss.IndexFlatL2(vectors.shape[1])
+        index.add(vectors[members])
+        centroids.append(_normalize(vectors[members]).mean(axis=0))
+        indexes.append(index)
+        rows.append(members)
+        starts[i + 1] = starts[i] + len(members)
+    partitions = PartitionedIndex(
+        categories, starts, np.concatenate(rows),
+        _normalize(np.asarray(centroids, dtype=np.float32)), indexes,
+    )
+    partitions.save(persist_path)
+    logger.info(
+        "Category partitions saved (%s)",
+        ", ".join(f"{name}: {n}" for name, n in partitions.sizes().items()),
+    )
+    return partitions
+
+
+def load_partitions(persist_path: Path) -> PartitionedIndex | None:
+    """Load the partitions of a store, or None if it was built without them."""
+    persist_path = resolve_store_path(persist_path)
+    if not (persist_path / PARTITIONS_DIR / PARTITIONS_FILE).exists():
+        return None
+    return PartitionedIndex.load(persist_path)
+
+
+class PartitionedRetriever:
+    """
+    Searches only the routed (or requested) category partitions; with a BM25
+    index, lexical hits are restricted to the same rows and fused with RRF.
+    """
+
+    def __init__(
+        self,
+        vector_store,
+        partitions: PartitionedIndex,
+        k: int,
+        lexical_index: BM25Index | None = None,
+        candidates: int = HYBRID_CANDIDATES,
+        probe: int = PARTITION_PROBE,
+    ):
+        self.vector_store = vector_store
+        self.partitions = partitions
+        self.lexical_index = lexical_index
+        self.k = k
+        self.candidates = max(candidates, k)
+        self.probe = probe
+
+    def invoke(self, query: str, categories: Sequence[str] | None = None) -> List[Document]:
+        with metrics.span("retrieve.embed_query"):
+            vector = np.asarray(self.vector_store.embeddings.embed_query(query), dtype=np.float32)
+        if getattr(self.vector_store, "_normalize_L2", False):
+            vector /= np.linalg.norm(vector)
+        if not categories:
+            with metrics.span("retrieve.route"):
+                categories = self.partitions.route(vector, self.probe)
+        metrics.inc("partition_searches_total", value=len(categories))
+        n = self.k if self.lexical_index is None else self.candidates
+        with metrics.span("retrieve.vector_search"):
+            dense = self.partitions.search(vector, n, categories)
+        if self.lexical_index is None:
+            return rows_to_documents(self.vector_store, dense)
+        with metrics.span("retrieve.lexical_search"):
+            allowed = self.partitions.row_mask(categories, self.lexical_index.n_docs)
+            sparse = [row for row, _ in self.lexical_index.search(query, n, allowed=allowed)]
+        with metrics.span("retrieve.fusion"):
+            fused = reciprocal_rank_fusion([dense, sparse])[: self.k]
+        return rows_to_documents(self.vector_store, fused)
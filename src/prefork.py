@@ -0,0 +1,229 @@
+"""
+Pre-fork worker processes that share one loaded model and index.
+
+The parent loads everything once (embedding model, FAISS index, docstore,
+BM25 and partitions), freezes the loaded objects out of the garbage
+collector, then forks `workers` children. Children share the parent's pages
+copy-on-write: the mmapped index and docstore are file-backed and shared
+through the page cache anyway, and the model weights and BM25 arrays stay
+shared as long as nobody writes to them. So adding a worker costs its
+private memory (request state, Python objects it touches), not another copy
+of the model and index.
+
+Each worker has an index (0 .. workers-1, see worker_index()) that a
+replacement inherits from the worker it replaces, for per-worker files such
+as the conversation log.
+
+The parent only supervises: it restarts workers that die, logs each
+worker's memory (RSS, and on Linux PSS / shared / private from
+/proc/<pid>/smaps_rollup) every `report_seconds`, and on SIGTERM / SIGINT
+stops the workers (SIGTERM, then SIGKILL after `grace_seconds`).
+
+Threads do not survive fork(); objects that own one (src.hotswap,
+src.batching) restart it in the child via os.register_at_fork, and the
+parent must not run the model before forking (torch / OpenMP thread pools
+would be inherited half-alive). POSIX only.
+
+Sharing covers what the parent loaded. When a new index version is
+published (src.hotswap), each worker loads it on its own: the embedding
+model stays shared and the mmapped index and docstore are still shared
+through the page cache, but BM25 arrays, partitions and row offsets of the
+new version are private to every worker until the server is restarted.
+"""
+import gc
+import logging
+import os
+import signal
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Dict
+
+from config.settings import SERVER_MEMORY_REPORT_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# smaps_rollup fields (kB) -> report keys
+_SMAPS_FIELDS = {
+    "Rss": "rss",
+    "Pss": "pss",
+    "Shared_Clean": "shared",
+    "Shared_Dirty": "shared",
+    "Private_Clean": "private",
+    "Private_Dirty": "private",
+}
+
+_worker_index: int | None = None
+
+
+def process_memory(pid: int | str = "self") -> Dict[str, float]:
+    """
+    Memory of a process in MiB: rss, and on Linux also pss (RSS with shared
+    pages split between the processes sharing them), shared and private.
+    Empty if the process is gone or the platform has no /proc.
+    """
+    proc = Path("/proc") / str(pid)
+    memory: Dict[str, float] = {}
+    try:
+        for line in (proc / "smaps_rollup").read_text().splitlines():
+            name, _, value = line.partition(":")
+            key = _SMAPS_FIELDS.get(name)
+            if key:
+                memory[key] = memory.get(key, 0.0) + int(value.split()[0]) / 1024
+        return memory
+    except (OSError, ValueError, IndexError):
+        pass
+    try:  # older kernels: RSS only
+        for line in (proc / "status").read_text().splitlines():
+            if line.startswith("VmRSS:"):
+                return {"rss": int(line.split()[1]) / 1024}
+    except (OSError, ValueError, IndexError):
+        pass
+    return memory
+
+
+def set_worker_threads(threads: int) -> None:
+    """Limit torch / FAISS intra-op threads so N workers don't oversubscribe the cores."""
+    if threads <= 0:
+        return
+    if "torch" in sys.modules:
+        torch = sys.modules["torch"]
+        torch.set_num_threads(threads)
+        try:
+            torch.set_num_interop_threads(threads)
+        except RuntimeError:  # only allowed before the first inter-op parallel work
+            pass
+    if "faiss" in sys.modules:
+        sys.modules["faiss"].omp_set_num_threads(threads)
+
+
+def worker_index() -> int | None:
+    """Index of this pre-fork worker process, or None outside one."""
+    return _worker_index
+
+
+class Prefork:
+    """Forks and supervises `workers` processes that each run `worker()`."""
+
+    def __init__(
+        self,
+        worker: Callable[[], None],
+        workers: int,
+        report_seconds: float = SERVER_MEMORY_REPORT_SECONDS,
+        grace_seconds: float = 10.0,
+    ):
+        if not hasattr(os, "fork"):
+            raise RuntimeError("Pre-fork workers need os.fork() (Linux/macOS)")
+        self.worker = worker
+        self.workers = max(1, workers)
+        self.report_seconds = report_seconds
+        self.grace_seconds = grace_seconds
+        self.pids: Dict[int, float] = {}  # pid -> start time
+        self._indexes: Dict[int, int] = {}  # pid -> worker index
+        self._stopping = False
+
+    def _spawn(self, index: int) -> int:
+        global _worker_index
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            _worker_index = index
+            try:
+                signal.signal(signal.SIGTERM, signal.SIG_DFL)
+                signal.signal(signal.SIGINT, signal.SIG_DFL)
+                self.worker()
+            except SystemExit as e:
+                code = e.code if isinstance(e.code, int) else 1
+            except BaseException as e:
+                logger.exception("Worker %d failed: %s", os.getpid(), e)
+                code = 1
+            finally:
+                logging.shutdown()
+                os._exit(code)
+        self.pids[pid] = time.monotonic()
+        self._indexes[pid] = index
+        logger.info("Started worker %d (index %d)", pid, index)
+        return pid
+
+    def start(self) -> None:
+        """Fork the workers (loaded objects are frozen first so worker GCs leave them shared)."""
+        gc.collect()
+        gc.freeze()
+        used = set(self._indexes.values())
+        for index in [i for i in range(self.workers) if i not in used]:
+            self._spawn(index)
+
+    def memory(self) -> Dict[int, Dict[str, float]]:
+        """Memory (MiB) of each live worker, keyed by pid."""
+        return {pid: process_memory(pid) for pid in sorted(self.pids)}
+
+    def log_memory(self) -> None:
+        for pid, memory in self.memory().items():
+            logger.info("Worker %d memory: %s", pid, ", ".join(f"{k} {v:.1f} MiB" for k, v in memory.items()))
+        parent = process_memory()
+        if parent:
+            logger.info("Parent %d memory: %s", os.getpid(), ", ".join(f"{k} {v:.1f} MiB" for k, v in parent.items()))
+
+    def reap(self) -> None:
+        """Collect exited workers and replace them (unless stopping)."""
+        while self.pids:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                self.pids.clear()
+                self._indexes.clear()
+                return
+            if pid == 0:
+                return
+            started = self.pids.pop(pid, None)
+            index = self._indexes.pop(pid, None)
+            if started is None:
+                continue
+            if self._stopping:
+                continue
+            logger.warning("Worker %d exited (status %d); restarting", pid, os.waitstatus_to_exitcode(status))
+            if time.monotonic() - started < 1.0:
+                time.sleep(1.0)  # don't spin if workers crash on startup
+            self._spawn(index)
+
+    def stop(self) -> None:
+        """SIGTERM all workers, wait up to `grace_seconds`, then SIGKILL the rest."""
+        self._stopping = True
+        for pid in list(self.pids):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        deadline = time.monotonic() + self.grace_seconds
+        while self.pids and time.monotonic() < deadline:
+            self.reap()
+            time.sleep(0.05)
+        for pid in list(self.pids):
+            logger.warning("Worker %d did not stop in time; killing it", pid)
+            try:
+                os.kill(pid, signal.SIGKILL)
+                os.waitpid(pid, 0)
+            except (ProcessLookupError, ChildProcessError):
+                pass
+            self.pids.pop(pid, None)
+            self._indexes.pop(pid, None)
+
+    def _request_stop(self, signum, frame) -> None:
+        self._stopping = True
+
+    def run(self) -> None:
+        """Start the workers and supervise them until SIGTERM / SIGINT."""
+        signal.signal(signal.SIGTERM, self._request_stop)
+        signal.signal(signal.SIGINT, self._request_stop)
+        self.start()
+        next_report = time.monotonic() + self.report_seconds
+        try:
+            while not self._stopping:
+                self.reap()
+                if self.report_seconds > 0 and time.monotonic() >= next_report:
+                    self.log_memory()
+                    next_report = time.monotonic() + self.report_seconds
+                time.sleep(0.5)
+        finally:
+            logger.info("Stopping %d worker(s)", len(self.pids))
+            self.stop()
@@ -5,22 +5,39 @@ Uses LCEL (LangChain Expression Language) – no OpenAI dependency.
 """
 
 import logging
-from typing import List
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING, AsyncIterator, Iterator, List, Sequence
 
-from langchain_groq import ChatGroq
-from langchain_community.vectorstores import FAISS
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain_core.messages import HumanMessage, AIMessage
-from langchain_core.runnables import RunnablePassthrough
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+from langchain_core.runnables import RunnableLambda, RunnablePassthrough
 from langchain_core.output_parsers import StrOutputParser
 
 from config.settings import (
     GROQ_API_KEY,
     GROQ_MODEL,
+    CATEGORY_PARTITIONS,
     MAX_CONTEXT_DOCS,
+    HYBRID_CANDIDATES,
+    HYBRID_RETRIEVAL,
     MAX_RESPONSE_TOKENS,
+    RETRIEVAL_BATCHING,
+    VECTOR_STORE_PATH,
 )
-from src.embeddings import load_faiss_index
+from src import metrics
+from src.batching import RetrievalBatcher
+from src.context import pack_context
+from src.history import ConversationHistory
+from src.hotswap import HotSwapRetriever
+from src.lexical import HybridRetriever, load_lexical_index, rows_to_documents, vector_rows
+
+if TYPE_CHECKING:
+    # Heavy imports (Groq client, langchain_community, faiss) are deferred to
+    # first use so that importing the app stays fast
+    from langchain_community.vectorstores import FAISS
+    from langchain_groq import ChatGroq
 
 logger = logging.getLogger(__name__)
 
@@ -37,10 +54,11 @@ Rules:
 
 
 # ✅ LLaMA from Groq
-def get_llm() -> ChatGroq:
+def get_llm() -> "ChatGroq":
     """Create Groq LLaMA chat model (no OpenAI)."""
     if not GROQ_API_KEY:
         raise ValueError("GROQ_API_KEY is not set. Add it to .env.")
+    from langchain_groq import ChatGroq
 
     return ChatGroq(
         groq_api_key=GROQ_API_KEY,
@@ -51,22 +69,193 @@ def get_llm() -> ChatGroq:
 
 
 def _format_docs(docs):
-    """Turn retrieved documents into a single context string."""
-    return "\n\n".join(doc.page_content for doc in docs)
+    """
+    Turn retrieved documents into a single context string: overlapping chunks
+    are merged, near-duplicates dropped and CONTEXT_TOKEN_BUDGET enforced.
+    """
+    with metrics.span("pack_context"):
+        return pack_context(docs)
+
+
+def _traced_retrieve(retrieve, question: str, categories: Sequence[str] | None = None):
+    with metrics.span("retrieve"):
+        return retrieve(question, categories)
+
+
+def _traced_prompt(prompt: ChatPromptTemplate, inputs: dict):
+    with metrics.span("prompt"):
+        return prompt.invoke(inputs)
+
+
+class LlmMetricsHandler(BaseCallbackHandler):
+    """Times LLM calls (total and to first token) and counts their tokens."""
+
+    def __init__(self):
+        self._started = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._started[run_id] = [time.perf_counter(), False]
+
+    def on_llm_new_token(self, token, *, run_id, **kwargs):
+        state = self._started.get(run_id)
+        if state is not None and not state[1]:
+            state[1] = True
+            metrics.record_stage("llm.first_token", time.perf_counter() - state[0])
+
+    def on_llm_end(self, response: LLMResult, *, run_id, **kwargs):
+        state = self._started.pop(run_id, None)
+        if state is not None:
+            metrics.record_stage("llm", time.perf_counter() - state[0])
+        usage = {}
+        for generations in response.generations:
+            for generation in generations:
+                message = getattr(generation, "message", None)
+                usage = getattr(message, "usage_metadata", None) or usage
+        if not usage:
+            token_usage = (response.llm_output or {}).get("token_usage") or {}
+            usage = {
+                "input_tokens": token_usage.get("prompt_tokens", 0),
+                "output_tokens": token_usage.get("completion_tokens", 0),
+            }
+        metrics.inc("tokens_total", usage.get("input_tokens", 0) or 0, kind="prompt")
+        metrics.inc("tokens_total", usage.get("output_tokens", 0) or 0, kind="completion")
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._started.pop(run_id, None)
+
+
+def _without_categories(search):
+    """Wrap a retriever that cannot filter by category."""
+    def retrieve(question: str, categories: Sequence[str] | None = None):
+        if categories:
+            raise ValueError(
+                "Category filters need an index built with category partitions "
+                "(CATEGORY_PARTITIONS=true)."
+            )
+        return search(question)
+    return retrieve
+
+
+class LoadedRetriever:
+    """
+    Retriever over one loaded store version, as returned by load_retriever.
+    close() stops its retrieval batcher threads, which otherwise keep the
+    store alive after a hot swap has replaced it (see src.hotswap).
+    """
+
+    def __init__(self, retrieve, batchers: List[RetrievalBatcher]):
+        self._retrieve = retrieve
+        self._batchers = batchers
+
+    def __call__(self, question: str, categories: Sequence[str] | None = None):
+        return self._retrieve(question, categories)
+
+    def close(self) -> None:
+        for batcher in self._batchers:
+            batcher.close()
+
+
+def _build_retriever(
+    vector_store: "FAISS", lexical_index, batch_retrieval: bool, partitions=None, batchers=None
+):
+    """
+    Return a callable mapping a question (and optional list of categories to
+    search) to its top MAX_CONTEXT_DOCS documents. Retrieval batchers it
+    starts are appended to `batchers` if given.
+    """
+    if partitions is not None:
+        from src.partitions import PartitionedRetriever
+        if batch_retrieval:
+            logger.info("Retrieval batching is not used with category partitions")
+        return PartitionedRetriever(
+            vector_store, partitions, k=MAX_CONTEXT_DOCS, lexical_index=lexical_index,
+            candidates=max(HYBRID_CANDIDATES, MAX_CONTEXT_DOCS),
+        ).invoke
+    return _without_categories(_build_search(vector_store, lexical_index, batch_retrieval, batchers))
+
+
+def _batcher(vector_store: "FAISS", k: int, batchers) -> RetrievalBatcher:
+    batcher = RetrievalBatcher(vector_store, k=k)
+    if batchers is not None:
+        batchers.append(batcher)
+    return batcher
+
+
+def _build_search(vector_store: "FAISS", lexical_index, batch_retrieval: bool, batchers=None):
+    if lexical_index is not None:
+        candidates = max(HYBRID_CANDIDATES, MAX_CONTEXT_DOCS)
+        vector_search = (
+            _batcher(vector_store, candidates, batchers).search_rows
+            if batch_retrieval else None
+        )
+        return HybridRetriever(
+            vector_store, lexical_index, k=MAX_CONTEXT_DOCS,
+            candidates=candidates, vector_search=vector_search,
+        ).invoke
+    if batch_retrieval:
+        return _batcher(vector_store, MAX_CONTEXT_DOCS, batchers).search
+    # Same search as vector_store.as_retriever(), with per-stage timing
+    return lambda q: rows_to_documents(vector_store, vector_rows(vector_store, q, MAX_CONTEXT_DOCS))
+
+
+def load_retriever(store_path: Path, batch_retrieval: bool = RETRIEVAL_BATCHING, embeddings=None):
+    """
+    Load the vector store in `store_path` (a store root or one version
+    directory), plus its BM25 index if HYBRID_RETRIEVAL and its category
+    partitions if CATEGORY_PARTITIONS, and return a LoadedRetriever over them.
+    Every file comes from the same version. `embeddings` defaults to the
+    model the store was built with.
+    """
+    from src.embeddings import load_faiss_index
+    from src.partitions import load_partitions
+    from src.versions import resolve_store_path
+
+    store_path = resolve_store_path(store_path)
+    vector_store = load_faiss_index(store_path, embeddings=embeddings)
+    lexical_index = load_lexical_index(store_path) if HYBRID_RETRIEVAL else None
+    partitions = load_partitions(store_path) if CATEGORY_PARTITIONS else None
+    batchers: List[RetrievalBatcher] = []
+    retrieve = _build_retriever(vector_store, lexical_index, batch_retrieval, partitions, batchers)
+    return LoadedRetriever(retrieve, batchers)
 
 
-def build_rag_chain(vector_store: FAISS | None = None):
+def build_rag_chain(
+    vector_store: "FAISS | None" = None,
+    batch_retrieval: bool = RETRIEVAL_BATCHING,
+    lexical_index=None,
+    llm=None,
+    partitions=None,
+    retriever=None,
+):
     """
     Build RAG chain using:
     Retriever -> Format Docs -> Prompt -> Groq LLaMA -> String Output
-    """
 
-    if vector_store is None:
-        vector_store = load_faiss_index()
+    With `batch_retrieval`, concurrent queries share one embedding call and
+    one FAISS search (see src.batching.RetrievalBatcher). When a BM25 index
+    is available (loaded alongside the default vector store if HYBRID_RETRIEVAL
+    is on, or passed as `lexical_index`), lexical and vector results are fused
+    with reciprocal rank fusion (see src.lexical). `llm` replaces the Groq
+    model (e.g. the offline benchmark's FakeChatModel).
 
-    retriever = vector_store.as_retriever(
-        search_kwargs={"k": MAX_CONTEXT_DOCS}
-    )
+    With category partitions (loaded alongside the default vector store if
+    CATEGORY_PARTITIONS is on, or passed as `partitions`), each question
+    searches only the closest categories, or those given in the chain
+    input's optional "categories" list (see src.partitions).
+
+    Without `vector_store`, the current version of the store at
+    VECTOR_STORE_PATH is loaded with its BM25 index and partitions (per the
+    settings) and replaced in the background whenever a build publishes a
+    new version (see src.hotswap). `retriever` (a callable taking the
+    question and optional categories) replaces retrieval altogether.
+    """
+
+    if retriever is not None:
+        retrieve = retriever
+    elif vector_store is None:
+        retrieve = HotSwapRetriever(VECTOR_STORE_PATH, lambda path: load_retriever(path, batch_retrieval))
+    else:
+        retrieve = _build_retriever(vector_store, lexical_index, batch_retrieval, partitions)
 
     prompt = ChatPromptTemplate.from_messages([
         ("system", SYSTEM_INSTRUCTION + "\n\nContext:\n{context}"),
@@ -74,15 +263,19 @@ def build_rag_chain(vector_store: FAISS | None = None):
         ("human", "{input}"),
     ])
 
-    llm = get_llm()
+    if llm is None:
+        llm = get_llm()
+
+    if metrics.enabled():
+        llm = llm.with_config(callbacks=[LlmMetricsHandler()])
 
     chain = (
         RunnablePassthrough.assign(
             context=lambda x: _format_docs(
-                retriever.invoke(x["input"])
+                _traced_retrieve(retrieve, x["input"], x.get("categories"))
             ),
         )
-        | prompt
+        | RunnableLambda(lambda x: _traced_prompt(prompt, x))
         | llm
         | StrOutputParser()
     )
@@ -90,35 +283,85 @@ def build_rag_chain(vector_store: FAISS | None = None):
     return chain
 
 
-def format_chat_history(messages: List[tuple]) -> List:
-    """Convert (role, content) into LangChain messages."""
-    result = []
-    for role, content in messages:
-        if role == "user":
-            result.append(HumanMessage(content=content))
-        else:
-            result.append(AIMessage(content=content))
-    return result
+def format_chat_history(messages: List[tuple] | ConversationHistory) -> List:
+    """
+    Convert (role, content) pairs or a ConversationHistory into LangChain
+    messages, compacted to HISTORY_TOKEN_BUDGET (see src.history).
+    """
+    with metrics.span("history"):
+        if not isinstance(messages, ConversationHistory):
+            messages = ConversationHistory.from_pairs(messages)
+        return messages.messages()
+
+
+def _chain_input(question: str, chat_history, categories: Sequence[str] | None) -> dict:
+    inputs = {
+        "input": question,
+        "chat_history": format_chat_history(chat_history or []),
+    }
+    if categories:
+        inputs["categories"] = list(categories)
+    return inputs
 
 
 def query_rag(
     question: str,
     rag_chain,
-    chat_history: List[tuple] | None = None,
+    chat_history: List[tuple] | ConversationHistory | None = None,
+    categories: Sequence[str] | None = None,
 ) -> dict:
     """
-    Run RAG query with Groq LLaMA.
+    Run RAG query with Groq LLaMA. `categories` limits retrieval to those
+    category partitions.
     Returns: {input, answer}
     """
 
-    history = format_chat_history(chat_history or [])
+    result = rag_chain.invoke(_chain_input(question, chat_history, categories))
 
-    result = rag_chain.invoke({
+    return {
         "input": question,
-        "chat_history": history,
-    })
+        "answer": result if isinstance(result, str) else result.content,
+    }
+
+
+def stream_rag(
+    question: str,
+    rag_chain,
+    chat_history: List[tuple] | ConversationHistory | None = None,
+    categories: Sequence[str] | None = None,
+) -> Iterator[str]:
+    """
+    Streaming variant of query_rag: yields answer text chunks from the
+    Groq LLM as they are generated.
+    """
+
+    for chunk in rag_chain.stream(_chain_input(question, chat_history, categories)):
+        yield chunk if isinstance(chunk, str) else chunk.content
+
+
+async def aquery_rag(
+    question: str,
+    rag_chain,
+    chat_history: List[tuple] | ConversationHistory | None = None,
+    categories: Sequence[str] | None = None,
+) -> dict:
+    """Async variant of query_rag (uses the chain's ainvoke)."""
+
+    result = await rag_chain.ainvoke(_chain_input(question, chat_history, categories))
 
     return {
         "input": question,
         "answer": result if isinstance(result, str) else result.content,
     }
+
+
+async def astream_rag(
+    question: str,
+    rag_chain,
+    chat_history: List[tuple] | ConversationHistory | None = None,
+    categories: Sequence[str] | None = None,
+) -> AsyncIterator[str]:
+    """Async variant of stream_rag (uses the chain's astream)."""
+
+    async for chunk in rag_chain.astream(_chain_input(question, chat_history, categories)):
+        yield chunk if isinstance(chunk, str) else chunk.content
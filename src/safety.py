@@ -0,0 +1,269 @@
+r"""
+Compiled safety rules for user messages.
+
+Rules are loaded once from a JSON file (SAFETY_RULES_PATH) and compiled,
+so checking a message costs about the same with ten rules as with a
+thousand:
+
+- phrase rules: every literal phrase goes into one Aho-Corasick automaton
+  over words (case-folded, punctuation ignored), so a message is scanned
+  once, word by word, whatever the number of phrases;
+- regex rules: a literal that every match must contain is derived from
+  each pattern ("mg" or "dosage" for r"\b(?:mg|dosage)\s*\d+") and all of
+  them go into one character-level Aho-Corasick automaton; only the rules
+  whose literal occurs in the message are run. Python's regex engine tries
+  every branch of an alternation at every position, so one big alternation
+  would still grow linearly with the rule count; it is only used for the
+  few patterns without a literal (e.g. r"\d{3}-\d{2}-\d{4}"), where the
+  matched group names the rule.
+
+Rules file:
+    {
+      "messages": {"<category>": "reply shown when a rule of this category matches"},
+      "rules": [
+        {"id": "overdose", "category": "self_harm", "phrases": ["lethal dose", "..."]},
+        {"id": "phi-ssn", "category": "phi", "pattern": "\\b\\d{3}-\\d{2}-\\d{4}\\b"}
+      ]
+    }
+
+Patterns are matched case-insensitively and may use plain groups, but not
+named groups or backreferences (names would clash and numbers shift once
+patterns are combined).
+"""
+import json
+import logging
+import re
+import unicodedata
+from collections import deque
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+from config.settings import SAFETY_RULES_PATH
+
+try:  # Python 3.11+
+    from re import _parser as sre_parse
+except ImportError:  # pragma: no cover
+    import sre_parse
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MESSAGE = "I can't help with that request. Please rephrase your health question."
+
+_WORD_RE = re.compile(r"\w+")
+_UNSUPPORTED_RE = re.compile(r"\\[1-9]|\(\?P[<=]")
+
+
+def words(text: str) -> List[str]:
+    """Case-folded words of `text`, the unit phrase rules are matched on."""
+    return _WORD_RE.findall(unicodedata.normalize("NFKC", text).casefold())
+
+
+@dataclass(frozen=True)
+class SafetyMatch:
+    """A rule that matched a message."""
+
+    rule_id: str
+    category: str
+    message: str
+    text: str
+
+
+class Automaton:
+    """
+    Aho-Corasick automaton over sequences of symbols (words of a message, or
+    characters of a string): one left-to-right pass finds every key in the
+    input, however many keys there are.
+    """
+
+    def __init__(self, keys: Iterable[Tuple[Sequence[str], int]]):
+        self._goto: List[Dict[str, int]] = [{}]
+        # Per node: (value, key length) of every key ending here, own key first
+        self._out: List[Tuple[Tuple[int, int], ...]] = [()]
+        for key, value in keys:
+            node = 0
+            for symbol in key:
+                nxt = self._goto[node].get(symbol)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[node][symbol] = nxt
+                    self._goto.append({})
+                    self._out.append(())
+                node = nxt
+            if key:
+                self._out[node] += ((value, len(key)),)
+        self._fail = [0] * len(self._goto)
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for symbol, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and symbol not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(symbol, 0)
+                # Keys ending at the longest proper suffix also end here
+                self._out[child] += self._out[self._fail[child]]
+
+    def __len__(self) -> int:
+        return len(self._goto)
+
+    def _scan(self, symbols: Sequence[str]):
+        goto, fail, out = self._goto, self._fail, self._out
+        node = 0
+        for i, symbol in enumerate(symbols):
+            while node and symbol not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(symbol, 0)
+            if out[node]:
+                yield i, out[node]
+
+    def first(self, symbols: Sequence[str]) -> Tuple[int, int, int] | None:
+        """(value, start, end) of the key that ends first in `symbols`, or None."""
+        for i, hits in self._scan(symbols):
+            value, length = hits[0]
+            return value, i + 1 - length, i + 1
+        return None
+
+    def values(self, symbols: Sequence[str]) -> set:
+        """Values of every key found in `symbols`."""
+        return {value for _, hits in self._scan(symbols) for value, _ in hits}
+
+
+def required_literals(pattern: str) -> set | None:
+    """
+    Lower-cased literals of which at least one occurs in every match of
+    `pattern` (e.g. {"dosage", "mg"} for r"\\b(?:dosage|mg)\\s*\\d+"), or None
+    if no such literal can be derived (the pattern then always runs).
+    """
+    try:
+        return _required(sre_parse.parse(pattern))
+    except Exception:  # unusual syntax: just don't prefilter this rule
+        return None
+
+
+def _better(current: set | None, candidate: set | None) -> set | None:
+    # Prefer the literal set whose shortest member is longest (most selective)
+    if not candidate or any(not lit for lit in candidate):
+        return current
+    if current is None or min(map(len, candidate)) > min(map(len, current)):
+        return candidate
+    return current
+
+
+def _required(parsed) -> set | None:
+    best, run = None, []
+    for op, arg in list(parsed) + [(None, None)]:
+        if op is sre_parse.LITERAL:
+            run.append(chr(arg).lower())
+            continue
+        best = _better(best, {"".join(run)} if run else None)
+        run = []
+        if op is sre_parse.SUBPATTERN:
+            best = _better(best, _required(arg[-1]))
+        elif op is sre_parse.BRANCH:
+            branches = [_required(branch) for branch in arg[1]]
+            if all(branches):
+                best = _better(best, set().union(*branches))
+        elif op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT) and arg[0] >= 1:
+            best = _better(best, _required(arg[2]))
+    return best
+
+
+class SafetyEngine:
+    """Phrase and regex rules compiled into automata and a combined pattern."""
+
+    def __init__(self, rules: Sequence[dict], messages: Dict[str, str] | None = None):
+        messages = messages or {}
+        self.rules: List[SafetyMatch] = []
+        phrases: List[Tuple[List[str], int]] = []
+        literals: List[Tuple[str, int]] = []
+        unfiltered: List[str] = []
+        self._patterns: Dict[int, re.Pattern] = {}
+        self._groups: Dict[str, int] = {}
+        seen = set()
+        for spec in rules:
+            rule_id = str(spec.get("id") or "")
+            if not rule_id or rule_id in seen:
+                raise ValueError(f"Safety rules need unique ids (got {rule_id!r})")
+            seen.add(rule_id)
+            category = str(spec.get("category") or "general")
+            index = len(self.rules)
+            self.rules.append(SafetyMatch(
+                rule_id, category, spec.get("message") or messages.get(category, DEFAULT_MESSAGE), "",
+            ))
+            if ("phrases" in spec) == ("pattern" in spec):
+                raise ValueError(f"Safety rule {rule_id!r} needs either 'phrases' or 'pattern'")
+            if "phrases" in spec:
+                for phrase in spec["phrases"]:
+                    phrase_words = words(phrase)
+                    if not phrase_words:
+                        raise ValueError(f"Safety rule {rule_id!r} has an empty phrase")
+                    phrases.append((phrase_words, index))
+                continue
+            pattern = spec["pattern"]
+            if _UNSUPPORTED_RE.search(pattern):
+                raise ValueError(f"Safety rule {rule_id!r}: named groups and backreferences are not supported")
+            try:
+                self._patterns[index] = re.compile(pattern, re.IGNORECASE)
+            except re.error as e:
+                raise ValueError(f"Safety rule {rule_id!r}: invalid pattern: {e}") from None
+            required = required_literals(pattern)
+            if required:
+                literals.extend((literal, index) for literal in required)
+            else:
+                group = f"_rule{index}"
+                self._groups[group] = index
+                unfiltered.append(f"(?P<{group}>{pattern})")
+        self._phrases = Automaton(phrases) if phrases else None
+        self._literals = Automaton(literals) if literals else None
+        self._unfiltered = re.compile("|".join(unfiltered), re.IGNORECASE) if unfiltered else None
+        self.phrase_count = len(phrases)
+        self.pattern_count = len(self._patterns)
+
+    def __len__(self) -> int:
+        return len(self.rules)
+
+    def _match(self, index: int, text: str) -> SafetyMatch:
+        rule = self.rules[index]
+        return SafetyMatch(rule.rule_id, rule.category, rule.message, text)
+
+    def check(self, text: str) -> SafetyMatch | None:
+        """
+        The first rule `text` matches, or None. Phrase rules are checked
+        first, then regex rules whose required literal occurs in `text` (in
+        file order), then regex rules without one, as a single alternation.
+        """
+        if self._phrases is not None:
+            text_words = words(text)
+            hit = self._phrases.first(text_words)
+            if hit is not None:
+                index, start, end = hit
+                return self._match(index, " ".join(text_words[start:end]))
+        if self._literals is not None:
+            for index in sorted(self._literals.values(text.lower())):
+                m = self._patterns[index].search(text)
+                if m is not None:
+                    return self._match(index, m.group(0))
+        if self._unfiltered is not None:
+            m = self._unfiltered.search(text)
+            if m is not None:
+                return self._match(self._groups[m.lastgroup], m.group(0))
+        return None
+
+    @classmethod
+    def from_file(cls, path: Path) -> "SafetyEngine":
+        config = json.loads(Path(path).read_text(encoding="utf-8"))
+        engine = cls(config.get("rules", []), config.get("messages"))
+        logger.info(
+            "Loaded %d safety rule(s) from %s (%d phrases, %d patterns)",
+            len(engine), path, engine.phrase_count, engine.pattern_count,
+        )
+        return engine
+
+
+@lru_cache(maxsize=1)
+def get_safety_engine() -> SafetyEngine:
+    """The engine for SAFETY_RULES_PATH (loaded once per process)."""
+    return SafetyEngine.from_file(SAFETY_RULES_PATH)
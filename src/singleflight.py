@@ -0,0 +1,303 @@
+"""
+Single-flight coalescing of identical in-flight questions.
+
+During news spikes many users ask the same question within the same second.
+The first request for a key (normalized question + a fingerprint of what
+else shapes the answer: chat history, category filter, chain) becomes the
+leader and makes the LLM call; requests with the same key that arrive while
+it is running become followers and share its answer instead of making their
+own call. The leader publishes every token to its flight, so a follower of a
+streaming request replays the tokens so far and then receives the rest as
+they are generated; a non-streaming follower just waits for the full text.
+
+Leaders and followers can be sync or async in any combination: a flight is
+guarded by a threading.Condition (sync followers wait on it) and wakes async
+followers through their event loop. An error in the leader is raised in
+every follower. If a streaming leader's consumer stops early (e.g. the reply
+hit its length limit), the leader still drains the LLM stream while it has
+followers, who do their own truncation. Flights only coalesce within one
+process (with --workers N each worker has its own registry).
+
+Coalesced calls are counted in `stats()` and, with metrics on, in
+singleflight_coalesced_total.
+"""
+import asyncio
+import hashlib
+import logging
+import threading
+from typing import AsyncIterable, AsyncIterator, Awaitable, Callable, Dict, Iterable, Iterator, List, Sequence, Tuple
+
+from config.settings import SINGLE_FLIGHT_ENABLED
+from src import metrics
+from src.faq import normalize_question
+from src.history import ConversationHistory
+
+logger = logging.getLogger(__name__)
+
+
+class FlightAbandoned(RuntimeError):
+    """The leading request stopped before its answer was complete."""
+
+
+def flight_key(
+    question: str,
+    rag_chain,
+    chat_history: List[tuple] | ConversationHistory | None = None,
+    categories: Sequence[str] | None = None,
+) -> str:
+    """
+    Key under which identical requests coalesce: the normalized question plus
+    a fingerprint of the retrieval context (categories, chat history, chain).
+    """
+    digest = hashlib.sha1()
+    digest.update(str(id(rag_chain)).encode("utf-8"))
+    for category in sorted(categories or ()):
+        digest.update(b"\x00c" + str(category).encode("utf-8"))
+    if isinstance(chat_history, ConversationHistory):
+        pairs = [(m.type, m.content) for m in chat_history.messages()]
+    else:
+        pairs = chat_history or []
+    for role, content in pairs:
+        digest.update(b"\x00r" + str(role).encode("utf-8") + b"\x00" + str(content).encode("utf-8"))
+    return f"{normalize_question(question)}\x00{digest.hexdigest()}"
+
+
+class Flight:
+    """One in-flight LLM call: the tokens published so far and how it ended."""
+
+    def __init__(self, key: str):
+        self.key = key
+        self.tokens: List[str] = []
+        self.done = False
+        self.error: BaseException | None = None
+        self.followers = 0
+        self._cond = threading.Condition()
+        self._wakers: List[Callable[[], None]] = []
+
+    def publish(self, token: str | None = None, done: bool = False, error: BaseException | None = None) -> None:
+        with self._cond:
+            if token:
+                self.tokens.append(token)
+            if done:
+                self.done, self.error = True, error
+            self._cond.notify_all()
+            wakers = list(self._wakers)
+        for wake in wakers:
+            wake()
+
+    def _take(self, start: int) -> Tuple[List[str], bool, BaseException | None]:
+        # Caller holds self._cond; once done, every token has been published
+        return self.tokens[start:], self.done, self.error
+
+    def replay(self) -> Iterator[str]:
+        """Yield every token of the flight (blocking), then raise its error if any."""
+        position = 0
+        while True:
+            with self._cond:
+                while position == len(self.tokens) and not self.done:
+                    self._cond.wait()
+                new, done, error = self._take(position)
+            position += len(new)
+            yield from new
+            if done:
+                if error is not None:
+                    raise error
+                return
+
+    async def areplay(self) -> AsyncIterator[str]:
+        """Async replay: waits on the running event loop instead of blocking it."""
+        loop = asyncio.get_running_loop()
+        event = asyncio.Event()
+
+        def wake() -> None:
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:  # loop closed: the follower is gone
+                pass
+
+        with self._cond:
+            self._wakers.append(wake)
+        try:
+            position = 0
+            while True:
+                event.clear()
+                with self._cond:
+                    new, done, error = self._take(position)
+                position += len(new)
+                for token in new:
+                    yield token
+                if done:
+                    if error is not None:
+                        raise error
+                    return
+                await event.wait()
+        finally:
+            with self._cond:
+                self._wakers.remove(wake)
+
+
+def _leader_error(e: BaseException) -> Exception:
+    # Cancellation / interruption of the leader is not the followers' error
+    return e if isinstance(e, Exception) else FlightAbandoned("The request answering this question was cancelled.")
+
+
+class SingleFlight:
+    """Registry of in-flight calls by key; see the module docstring."""
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._flights: Dict[str, Flight] = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    def _join(self, key: str) -> Tuple[Flight, bool]:
+        """Return (flight, is_leader) for `key`."""
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                flight.followers += 1
+                self.coalesced += 1
+                return flight, False
+            flight = self._flights[key] = Flight(key)
+            self.leaders += 1
+            return flight, True
+
+    def _count(self, kind: str) -> None:
+        metrics.inc("singleflight_coalesced_total", kind=kind)
+        logger.debug("Coalesced %s request onto an in-flight LLM call", kind)
+
+    def _land(self, flight: Flight, error: BaseException | None = None) -> None:
+        with self._lock:
+            if self._flights.get(flight.key) is flight:
+                del self._flights[flight.key]
+        flight.publish(done=True, error=error)
+
+    def _keep_for_followers(self, flight: Flight) -> bool:
+        """True if `flight` has followers; otherwise close it to new ones."""
+        with self._lock:
+            if flight.followers:
+                return True
+            if self._flights.get(flight.key) is flight:
+                del self._flights[flight.key]
+            return False
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"in_flight": len(self._flights), "leaders": self.leaders, "coalesced": self.coalesced}
+
+    def call(self, key: str | None, fn: Callable[[], str]) -> str:
+        """Return fn()'s answer text, or the answer of an identical call in flight."""
+        if not self.enabled or key is None:
+            return fn()
+        flight, leader = self._join(key)
+        if not leader:
+            self._count("call")
+            return "".join(flight.replay())
+        error = None
+        try:
+            text = fn()
+            flight.publish(text)
+            return text
+        except BaseException as e:
+            error = _leader_error(e)
+            raise
+        finally:
+            self._land(flight, error)
+
+    def stream(self, key: str | None, tokens: Callable[[], Iterable[str]]) -> Iterator[str]:
+        """Yield the tokens of tokens(), or of an identical stream in flight."""
+        if not self.enabled or key is None:
+            yield from tokens()
+            return
+        flight, leader = self._join(key)
+        if not leader:
+            self._count("stream")
+            yield from flight.replay()
+            return
+        it = iter(tokens())
+        error = None
+        try:
+            for token in it:
+                flight.publish(token)
+                yield token
+        except GeneratorExit:
+            if self._keep_for_followers(flight):
+                try:
+                    for token in it:
+                        flight.publish(token)
+                except Exception as e:
+                    error = e
+            else:
+                error = FlightAbandoned("The request answering this question stopped early.")
+                getattr(it, "close", lambda: None)()
+            raise
+        except BaseException as e:
+            error = _leader_error(e)
+            raise
+        finally:
+            self._land(flight, error)
+
+    async def acall(self, key: str | None, fn: Callable[[], Awaitable[str]]) -> str:
+        """Async variant of call."""
+        if not self.enabled or key is None:
+            return await fn()
+        flight, leader = self._join(key)
+        if not leader:
+            self._count("call")
+            return "".join([token async for token in flight.areplay()])
+        error = None
+        try:
+            text = await fn()
+            flight.publish(text)
+            return text
+        except BaseException as e:
+            error = _leader_error(e)
+            raise
+        finally:
+            self._land(flight, error)
+
+    async def astream(self, key: str | None, tokens: Callable[[], AsyncIterable[str]]) -> AsyncIterator[str]:
+        """Async variant of stream."""
+        if not self.enabled or key is None:
+            async for token in tokens():
+                yield token
+            return
+        flight, leader = self._join(key)
+        if not leader:
+            self._count("stream")
+            async for token in flight.areplay():
+                yield token
+            return
+        it = tokens().__aiter__()
+        error = None
+        try:
+            async for token in it:
+                flight.publish(token)
+                yield token
+        except GeneratorExit:
+            if self._keep_for_followers(flight):
+                try:
+                    async for token in it:
+                        flight.publish(token)
+                except Exception as e:
+                    error = e
+            else:
+                error = FlightAbandoned("The request answering this question stopped early.")
+                aclose = getattr(it, "aclose", None)
+                if aclose is not None:
+                    await aclose()
+            raise
+        except BaseException as e:
+            error = _leader_error(e)
+            raise
+        finally:
+            self._land(flight, error)
+
+
+_single_flight = SingleFlight(enabled=SINGLE_FLIGHT_ENABLED)
+
+
+def get_single_flight() -> SingleFlight:
+    """The process-wide registry used by src.chatbot."""
+    return _single_flight
@@ -0,0 +1,283 @@
+"""
+Pickle-free on-disk vector store format with lazy, memory-mapped reads.
+
+Layout of a vector store directory:
+    index.faiss            FAISS index (faiss.write_index); memory-mapped on load
+    docstore.jsonl         one JSON record per chunk: {"id", "text", "metadata"}
+    docstore.offsets.npy   int64 byte offsets of each record (n + 1 entries)
+    docstore.ids           chunk id per line, in index row order
+    docstore.ids.offsets.npy  int64 byte offsets of each id line (n + 1 entries)
+    docstore.ids.lookup.npy   uint64 (2, n): sorted 64-bit id hashes, and the row of each
+
+Records are read on demand for each retrieved hit, and chunk ids are read
+from the mmapped ids file (row -> id) or found through the hash table
+(id -> row), so loading builds no per-chunk Python objects: start-up time and
+RSS stay flat as the corpus grows, and worker processes share the index,
+record and id pages through the OS page cache. Nothing is unpickled. Stores
+written before the id tables existed still load; their tables are then
+computed at load time (16 bytes per chunk, private to each process).
+"""
+import hashlib
+import json
+import logging
+import mmap
+import os
+from collections.abc import Mapping
+from pathlib import Path
+from typing import Dict, Iterator, List, Tuple, Union
+
+import faiss
+import numpy as np
+from langchain_community.docstore.base import Docstore
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILE = "index.faiss"
+DOCS_FILE = "docstore.jsonl"
+OFFSETS_FILE = "docstore.offsets.npy"
+IDS_FILE = "docstore.ids"
+IDS_OFFSETS_FILE = "docstore.ids.offsets.npy"
+IDS_LOOKUP_FILE = "docstore.ids.lookup.npy"
+
+
+def merge_metadata(metadata: dict, update: dict) -> dict:
+    """`metadata` with the keys of `update` set (None values remove the key)."""
+    merged = dict(metadata)
+    for key, value in update.items():
+        if value is None:
+            merged.pop(key, None)
+        else:
+            merged[key] = value
+    return merged
+
+
+def has_store(persist_path: Path) -> bool:
+    """True if persist_path holds a store in this format."""
+    persist_path = Path(persist_path)
+    return all((persist_path / name).exists() for name in (INDEX_FILE, DOCS_FILE, OFFSETS_FILE, IDS_FILE))
+
+
+def _map_file(path: Path) -> Union[mmap.mmap, bytes]:
+    """Read-only mapping of `path` (b"" if empty); only the mapping keeps it open."""
+    with open(path, "rb") as f:
+        if not os.fstat(f.fileno()).st_size:
+            return b""
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def _id_hash(cid: str) -> int:
+    return int.from_bytes(hashlib.blake2b(cid.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def _id_tables(ids: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """(offsets, lookup) for the ids file written by StoreWriter (see module docstring)."""
+    offsets = np.zeros(len(ids) + 1, dtype=np.int64)
+    np.cumsum([len(cid.encode("utf-8")) + 1 for cid in ids], out=offsets[1:])
+    hashes = np.fromiter((_id_hash(cid) for cid in ids), dtype=np.uint64, count=len(ids))
+    order = np.argsort(hashes, kind="stable")
+    return offsets, np.stack([hashes[order], order.astype(np.uint64)])
+
+
+class RowIds(Mapping):
+    """
+    Read-only row -> chunk id mapping over the mmapped ids file, used as the
+    store's index_to_docstore_id. row_of() does the reverse lookup.
+    """
+
+    def __init__(self, persist_path: Path):
+        persist_path = Path(persist_path)
+        self._data = _map_file(persist_path / IDS_FILE)
+        if (persist_path / IDS_OFFSETS_FILE).exists() and (persist_path / IDS_LOOKUP_FILE).exists():
+            self._offsets = np.load(persist_path / IDS_OFFSETS_FILE, mmap_mode="r")
+            self._lookup = np.load(persist_path / IDS_LOOKUP_FILE, mmap_mode="r")
+        else:
+            # Older stores: "\n"-joined ids (maybe without a final newline), no tables
+            ids = [cid for cid in bytes(self._data).decode("utf-8").split("\n") if cid]
+            self._offsets, self._lookup = _id_tables(ids)
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(range(len(self)))
+
+    def __getitem__(self, row: int) -> str:
+        if not 0 <= row < len(self):
+            raise KeyError(row)
+        start, end = int(self._offsets[row]), int(self._offsets[row + 1]) - 1
+        return self._data[start:end].decode("utf-8")
+
+    def row_of(self, cid: str) -> int | None:
+        """Row of chunk `cid`, or None if the store has no such chunk."""
+        hashes = self._lookup[0]
+        h = np.uint64(_id_hash(cid))
+        i = int(np.searchsorted(hashes, h))
+        while i < len(hashes) and hashes[i] == h:
+            row = int(self._lookup[1][i])
+            if self[row] == cid:
+                return row
+            i += 1
+        return None
+
+    def close(self) -> None:
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+
+
+class LazyDocstore(Docstore):
+    """
+    Read-only docstore that decodes one record per lookup from a mmapped
+    file. `ids` maps FAISS rows to chunk ids. Only the mappings hold the
+    files open; they are released by close() or when the docstore is
+    garbage collected.
+    """
+
+    def __init__(self, persist_path: Path):
+        persist_path = Path(persist_path)
+        self._offsets = np.load(persist_path / OFFSETS_FILE, mmap_mode="r")
+        self._data = _map_file(persist_path / DOCS_FILE)
+        self.ids = RowIds(persist_path)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def record(self, row: int) -> dict:
+        start, end = int(self._offsets[row]), int(self._offsets[row + 1])
+        return json.loads(self._data[start:end])
+
+    def document(self, row: int) -> Document:
+        rec = self.record(row)
+        return Document(page_content=rec["text"], metadata=rec["metadata"])
+
+    def search(self, search: str) -> Union[str, Document]:
+        row = self.ids.row_of(search)
+        if row is None:
+            return f"ID {search} not found."
+        return self.document(row)
+
+    def close(self) -> None:
+        """Unmap the records and ids files; later lookups fail."""
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+        self.ids.close()
+
+    def to_memory(self) -> InMemoryDocstore:
+        """Materialize every record (used when the index is edited in place)."""
+        return InMemoryDocstore({cid: self.document(row) for row, cid in self.ids.items()})
+
+
+class StoreWriter:
+    """
+    Streams chunk records to docstore.jsonl as they are produced, so a full
+    build never holds all chunk texts in memory. Call finish(index) once the
+    FAISS index (whose rows match the order of add() calls) is complete.
+    """
+
+    def __init__(self, persist_path: Path):
+        self.persist_path = Path(persist_path)
+        self.persist_path.mkdir(parents=True, exist_ok=True)
+        # Records go to a temp file until finish() so a failed build leaves
+        # the previous store readable
+        self._tmp = self.persist_path / (DOCS_FILE + ".tmp")
+        self._file = open(self._tmp, "wb")
+        self._offsets = [0]
+        self._ids: List[str] = []
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def add(self, cid: str, doc: Document) -> None:
+        line = json.dumps(
+            {"id": cid, "text": doc.page_content, "metadata": doc.metadata},
+            ensure_ascii=False,
+            default=str,
+        ).encode("utf-8") + b"\n"
+        self._file.write(line)
+        self._offsets.append(self._offsets[-1] + len(line))
+        self._ids.append(cid)
+
+    def _rewrite_metadata(self, updates: Dict[str, dict]) -> None:
+        """Stream the records once more, merging `updates` into their metadata."""
+        rewritten = self.persist_path / (DOCS_FILE + ".rewrite.tmp")
+        offsets = [0]
+        with open(self._tmp, "rb") as src, open(rewritten, "wb") as dst:
+            for line in src:
+                rec = json.loads(line)
+                if rec["id"] in updates:
+                    rec["metadata"] = merge_metadata(rec["metadata"], updates[rec["id"]])
+                    line = json.dumps(rec, ensure_ascii=False, default=str).encode("utf-8") + b"\n"
+                dst.write(line)
+                offsets.append(offsets[-1] + len(line))
+        os.replace(rewritten, self._tmp)
+        self._offsets = offsets
+
+    def finish(self, index, metadata_updates: Dict[str, dict] | None = None) -> None:
+        """
+        Write the store. `metadata_updates` (chunk id -> keys to set, None to
+        remove) is applied to records already written, e.g. merged sources.
+        """
+        self._file.close()
+        if index.ntotal != len(self._ids):
+            self.abort()
+            raise ValueError(f"Index has {index.ntotal} vectors but {len(self._ids)} records")
+        if metadata_updates:
+            self._rewrite_metadata(metadata_updates)
+        os.replace(self._tmp, self.persist_path / DOCS_FILE)
+        np.save(self.persist_path / OFFSETS_FILE, np.asarray(self._offsets, dtype=np.int64))
+        (self.persist_path / IDS_FILE).write_text("".join(cid + "\n" for cid in self._ids), encoding="utf-8")
+        ids_offsets, ids_lookup = _id_tables(self._ids)
+        np.save(self.persist_path / IDS_OFFSETS_FILE, ids_offsets)
+        np.save(self.persist_path / IDS_LOOKUP_FILE, ids_lookup)
+        faiss.write_index(index, str(self.persist_path / INDEX_FILE))
+        # Drop files from the older pickle-based format so loaders can't pick them up
+        (self.persist_path / "index.pkl").unlink(missing_ok=True)
+
+    def abort(self) -> None:
+        """Discard records written so far."""
+        self._file.close()
+        self._tmp.unlink(missing_ok=True)
+
+
+def save_store(vector_store: FAISS, persist_path: Path) -> None:
+    """Write `vector_store` in the pickle-free format (see module docstring)."""
+    writer = StoreWriter(persist_path)
+    for row in range(vector_store.index.ntotal):
+        cid = vector_store.index_to_docstore_id[row]
+        writer.add(cid, vector_store.docstore.search(cid))
+    writer.finish(vector_store.index)
+
+
+def read_index(path: Path, mmap_index: bool):
+    """Read a FAISS index, memory-mapped read-only if possible when `mmap_index`."""
+    if mmap_index:
+        flags = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+        try:
+            return faiss.read_index(str(path), flags)
+        except RuntimeError as e:
+            logger.info("Index type cannot be memory-mapped (%s); reading into RAM", e)
+    return faiss.read_index(str(path))
+
+
+def load_store(persist_path: Path, embeddings, mmap_index: bool = True, editable: bool = False) -> FAISS:
+    """
+    Load a store saved by save_store. By default the index is memory-mapped
+    read-only and records are decoded lazily; pass editable=True to read
+    everything into RAM so chunks can be added or deleted.
+    """
+    persist_path = Path(persist_path)
+    index = read_index(persist_path / INDEX_FILE, mmap_index and not editable)
+    docstore = LazyDocstore(persist_path)
+    index_to_docstore_id = docstore.ids
+    if editable:
+        index_to_docstore_id = dict(docstore.ids.items())
+        docstore, lazy = docstore.to_memory(), docstore
+        lazy.close()
+    return FAISS(
+        embedding_function=embeddings,
+        index=index,
+        docstore=docstore,
+        index_to_docstore_id=index_to_docstore_id,
+    )
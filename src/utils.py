@@ -3,7 +3,10 @@ Utility functions: input validation, error handling, and safe text processing.
 """
 import re
 import logging
-from typing import Optional
+from typing import Iterable, Iterator, Optional
+
+from src import metrics
+from src.safety import get_safety_engine
 
 # Configure module logger
 logger = logging.getLogger(__name__)
@@ -11,11 +14,6 @@ logger = logging.getLogger(__name__)
 # Max length for user query (prevent abuse and token overflow)
 MAX_QUERY_LENGTH = 2000
 
-# Patterns to detect potentially harmful or non-medical content (basic filter)
-BLOCKED_PATTERNS = [
-    r"\b( prescribe | dosage | mg | mcg | units )\s*\d+",  # dosage requests
-]
-
 
 def validate_query(query: Optional[str]) -> tuple[bool, str]:
     """
@@ -31,17 +29,32 @@ def validate_query(query: Optional[str]) -> tuple[bool, str]:
         return False, "Please enter a question."
     if len(stripped) > MAX_QUERY_LENGTH:
         return False, f"Query is too long. Please keep it under {MAX_QUERY_LENGTH} characters."
-    # Block obvious dosage-style requests (informational only – we don't prescribe)
-    for pattern in BLOCKED_PATTERNS:
-        if re.search(pattern, stripped, re.IGNORECASE):
-            logger.warning(f"Blocked query matching pattern: {pattern}")
-            return False, (
-                "I can't provide specific dosing. Please ask your doctor or pharmacist "
-                "for dosage information."
-            )
+    # Blocked phrases, dosing requests, PHI (rules in SAFETY_RULES_PATH)
+    match = get_safety_engine().check(stripped)
+    if match is not None:
+        logger.warning("Blocked query (safety rule %s)", match.rule_id)
+        metrics.inc("safety_blocks_total", rule=match.rule_id)
+        return False, match.message
     return True, ""
 
 
+_TOKEN_PIECE_RE = re.compile(r"\w+|[^\w\s]")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Cheap LLM token estimate (no tokenizer dependency): words count as ~4/3
+    tokens, each punctuation mark as one. Close enough for prompt budgeting.
+    """
+    words = punct = 0
+    for piece in _TOKEN_PIECE_RE.findall(text):
+        if piece[0].isalnum() or piece[0] == "_":
+            words += 1
+        else:
+            punct += 1
+    return (words * 4 + 2) // 3 + punct
+
+
 def sanitize_for_display(text: Optional[str], max_len: int = 5000) -> str:
     """Ensure text is safe for display and truncate if needed."""
     if text is None:
@@ -52,6 +65,64 @@ def sanitize_for_display(text: Optional[str], max_len: int = 5000) -> str:
     return s
 
 
+class StreamSanitizer:
+    """
+    Incremental sanitize_for_display: feed() text chunks as they arrive and
+    get back what can be shown now; finish() returns the remainder. The
+    concatenated output equals sanitize_for_display(full_text, max_len).
+    """
+
+    def __init__(self, max_len: int = 5000):
+        self.max_len = max_len
+        self.emitted = 0
+        self.tail = ""  # received but not yet emitted (held-back whitespace)
+        self.started = False
+        self.done = False
+
+    def feed(self, chunk: Optional[str]) -> str:
+        if self.done or not chunk:
+            return ""
+        s = str(chunk)
+        if not self.started:
+            s = s.lstrip()
+            if not s:
+                return ""
+            self.started = True
+        self.tail += s
+        body = self.tail.rstrip()
+        limit = self.max_len - 3
+        out = body[: limit - self.emitted]
+        if self.emitted + len(body) > self.max_len:
+            self.done = True
+            return out + "..."
+        self.emitted += len(out)
+        self.tail = self.tail[len(out):]
+        return out
+
+    def finish(self) -> str:
+        if self.done:
+            return ""
+        self.done = True
+        return self.tail.rstrip()
+
+
+def sanitize_stream(chunks: Iterable[Optional[str]], max_len: int = 5000) -> Iterator[str]:
+    """
+    Streaming counterpart of sanitize_for_display: yields text as it arrives
+    and produces the same overall output (stripped, truncated with "...").
+    """
+    sanitizer = StreamSanitizer(max_len)
+    for chunk in chunks:
+        out = sanitizer.feed(chunk)
+        if out:
+            yield out
+        if sanitizer.done:
+            return
+    rest = sanitizer.finish()
+    if rest:
+        yield rest
+
+
 def setup_logging(level: int = logging.INFO) -> None:
     """Configure root logger for the application."""
     logging.basicConfig(
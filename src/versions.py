@@ -0,0 +1,103 @@
+"""
+Versioned vector store directories with an atomic "current" pointer.
+
+Each build writes a complete store into a fresh directory under
+VECTOR_STORE_PATH/versions/ and, only once everything is on disk, points
+VECTOR_STORE_PATH/CURRENT at it (write to a temp file + os.replace, which
+is atomic). Readers resolve the pointer once and load every file of the
+store from that one directory, so they never see a half-written index,
+and running processes can pick up the new version without a restart (see
+src.hotswap). Older versions are pruned after publishing, keeping the
+VECTOR_STORE_KEEP_VERSIONS most recent ones for processes that have not
+switched yet and for rollback (point CURRENT at an older version).
+
+Layout:
+    CURRENT                       name of the active version
+    versions/<version>/           a complete store (see src.store)
+
+A directory without CURRENT (stores built by older versions, or a single
+version directory) is used as-is.
+"""
+import logging
+import os
+import shutil
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import List, Tuple
+
+from config.settings import VECTOR_STORE_KEEP_VERSIONS
+
+logger = logging.getLogger(__name__)
+
+CURRENT_FILE = "CURRENT"
+VERSIONS_DIR = "versions"
+
+
+def current_version(root: Path) -> str | None:
+    """Name of the active version under `root`, or None if it is not versioned."""
+    try:
+        version = (Path(root) / CURRENT_FILE).read_text(encoding="utf-8").strip()
+    except OSError:
+        return None
+    return version or None
+
+
+def version_path(root: Path, version: str) -> Path:
+    return Path(root) / VERSIONS_DIR / version
+
+
+def resolve_store_path(root: Path) -> Path:
+    """Directory holding the active store: the current version, or `root` itself if unversioned."""
+    version = current_version(root)
+    return version_path(root, version) if version else Path(root)
+
+
+def list_versions(root: Path) -> List[str]:
+    """Version names under `root`, oldest first."""
+    directory = Path(root) / VERSIONS_DIR
+    if not directory.is_dir():
+        return []
+    return sorted(p.name for p in directory.iterdir() if p.is_dir())
+
+
+def new_version(root: Path) -> Tuple[str, Path]:
+    """Create an empty directory for a new version; returns (name, path)."""
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%f")
+    version = f"{stamp}-{uuid.uuid4().hex[:6]}"
+    path = version_path(root, version)
+    path.mkdir(parents=True)
+    return version, path
+
+
+def publish_version(root: Path, version: str) -> None:
+    """Atomically make `version` the current one."""
+    root = Path(root)
+    if not version_path(root, version).is_dir():
+        raise FileNotFoundError(f"No version {version!r} under {root}")
+    tmp = root / f"{CURRENT_FILE}.{uuid.uuid4().hex}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(version)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, root / CURRENT_FILE)
+    logger.info("Published vector store version %s", version)
+
+
+def prune_versions(root: Path, keep: int = VECTOR_STORE_KEEP_VERSIONS) -> List[str]:
+    """
+    Delete versions older than the current one, keeping the `keep` most recent
+    (the current one included). Newer, unpublished versions (a build in
+    progress) are left alone. Returns the deleted version names.
+    """
+    current = current_version(root)
+    if current is None:
+        return []
+    older = [v for v in list_versions(root) if v < current]
+    stale = older[: max(0, len(older) - max(keep - 1, 0))]
+    for version in stale:
+        # Processes still reading an old version keep their open/mmapped files (POSIX)
+        shutil.rmtree(version_path(root, version), ignore_errors=True)
+    if stale:
+        logger.info("Removed %d old vector store version(s)", len(stale))
+    return stale
@@ -0,0 +1,117 @@
+"""
+Background warm-up for a fast cold start.
+
+Importing the RAG stack (LangChain, the Groq client, faiss, and later torch /
+sentence-transformers) and loading the embedding model and index take
+seconds. This module imports nothing heavy itself: `start_warmup()` does all
+of that on a daemon thread, primes the model and index with a warm-up query,
+and hands back a `Warmup` handle, so the UI can render immediately and only
+wait (via `Warmup.wait`) when the first question actually needs the chain.
+"""
+import logging
+import threading
+import time
+from typing import Callable, Dict
+
+from config.settings import VECTOR_STORE_PATH, WARMUP_QUERY
+
+logger = logging.getLogger(__name__)
+
+
+def warm_model(query: str = WARMUP_QUERY) -> None:
+    """Run `query` through the embedding model once (initializes it and its thread pools)."""
+    from src.embeddings import get_embeddings
+    get_embeddings().embed_query(query)
+
+
+def load_warm_chain(timings: Dict[str, float], query: str | None = WARMUP_QUERY):
+    """
+    Load the safety rules, import the RAG stack, load the embedding model
+    and the current version of the index (with its BM25 index and category
+    partitions, if enabled), run `query` through retrieval once, and return
+    the RAG chain, which follows new index versions (see src.hotswap).
+    With query=None nothing is run through the model (the pre-fork parent:
+    see server.serve_prefork). Each step's duration is stored in `timings`
+    (seconds).
+    """
+    started = time.perf_counter()
+    from src.safety import get_safety_engine
+    get_safety_engine()  # a broken rules file fails start-up, not the first message
+    timings["safety_rules"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    from src.embeddings import get_embeddings
+    from src.hotswap import HotSwapRetriever
+    from src.rag import build_rag_chain, load_retriever
+    timings["imports"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    get_embeddings()
+    if query is not None:
+        warm_model(query)  # first call initializes the model
+    timings["embedding_model"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    retriever = HotSwapRetriever(VECTOR_STORE_PATH, load_retriever)
+    timings["index"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    if query is not None:
+        retriever(query)  # page in the index, BM25 postings and records
+    chain = build_rag_chain(retriever=retriever)
+    timings["warmup_query"] = time.perf_counter() - started
+    return chain
+
+
+class Warmup:
+    """Handle for a chain being loaded on a background thread."""
+
+    def __init__(self, load: Callable[[Dict[str, float]], object] = load_warm_chain):
+        self.timings: Dict[str, float] = {}
+        self._load = load
+        self._done = threading.Event()
+        self._result = None
+        self._error: BaseException | None = None
+        self._thread = threading.Thread(target=self._run, name="warmup", daemon=True)
+
+    def start(self) -> "Warmup":
+        self._thread.start()
+        return self
+
+    def _run(self) -> None:
+        started = time.perf_counter()
+        try:
+            self._result = self._load(self.timings)
+        except BaseException as e:  # re-raised in wait()
+            self._error = e
+        finally:
+            self.timings["total"] = time.perf_counter() - started
+            self._done.set()
+        if self._error is None:
+            logger.info(
+                "Warm-up finished in %.2fs (%s)", self.timings["total"],
+                ", ".join(f"{k} {v:.2f}s" for k, v in self.timings.items() if k != "total"),
+            )
+        else:
+            logger.warning("Warm-up failed after %.2fs: %s", self.timings["total"], self._error)
+
+    @property
+    def done(self) -> bool:
+        """True once loading finished (successfully or not)."""
+        return self._done.is_set()
+
+    def wait(self, timeout: float | None = None):
+        """
+        Block until the chain is ready and return it; re-raises the loading
+        error if warm-up failed. Raises TimeoutError if `timeout` expires.
+        """
+        if not self._done.wait(timeout):
+            raise TimeoutError("Warm-up still in progress")
+        if self._error is not None:
+            raise self._error
+        return self._result
+
+
+def start_warmup(load: Callable[[Dict[str, float]], object] = load_warm_chain) -> Warmup:
+    """Start loading the RAG chain in the background and return its handle."""
+    return Warmup(load).start()
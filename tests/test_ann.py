@@ -0,0 +1,42 @@
+"""
+Tests for approximate index construction and the recall report.
+"""
+import faiss
+import numpy as np
+
+from src.ann import build_ann_index
+
+
+def make_exact(n=500, d=16):
+    rng = np.random.default_rng(0)
+    index = faiss.IndexFlatL2(d)
+    index.add(rng.random((n, d), dtype=np.float32))
+    return index
+
+
+def test_flat_spec_returns_exact_index():
+    exact = make_exact()
+    index, report = build_ann_index(exact, "Flat")
+    assert index is exact
+    assert report is None
+
+
+def test_ivf_index_with_report():
+    exact = make_exact()
+    index, report = build_ann_index(exact, "IVF8,Flat", k=4)
+    assert index.ntotal == exact.ntotal
+    assert 0.0 <= report["recall@4"] <= 1.0
+    assert report["recall@4"] > 0.5
+
+
+def test_hnsw_index_needs_no_training():
+    index, report = build_ann_index(make_exact(), "HNSW16", k=4)
+    assert isinstance(index, faiss.IndexHNSWFlat)
+    assert report["recall@4"] > 0.5
+
+
+def test_too_small_corpus_falls_back_to_flat():
+    exact = make_exact(n=10)
+    index, report = build_ann_index(exact, "IVF256,Flat")
+    assert index is exact
+    assert report is None
@@ -0,0 +1,78 @@
+"""
+Tests for micro-batched retrieval.
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from langchain_community.vectorstores import FAISS
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from src import batching, metrics
+from src.batching import RetrievalBatcher
+
+
+def make_store():
+    texts = [f"chunk number {i}" for i in range(20)]
+    return FAISS.from_texts(texts, DeterministicFakeEmbedding(size=16))
+
+
+def test_batched_results_match_direct_search():
+    store = make_store()
+    batcher = RetrievalBatcher(store, k=3, max_wait_ms=50, max_batch_size=8)
+    queries = [f"chunk number {i}" for i in range(8)]
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(batcher.search, queries))
+    for q, docs in zip(queries, results):
+        expected = store.similarity_search(q, k=3)
+        assert [d.page_content for d in docs] == [d.page_content for d in expected]
+    stats = batcher.stats()
+    assert stats["queries"] == 8
+    assert stats["batches"] < 8
+
+
+def test_single_query_respects_max_batch_size():
+    batcher = RetrievalBatcher(make_store(), k=2, max_wait_ms=0, max_batch_size=1)
+    assert len(batcher.search("chunk number 1")) == 2
+    assert batcher.stats()["batch_size_histogram"] == {1: 1}
+
+
+class ZeroForBlank(DeterministicFakeEmbedding):
+    """Fake embeddings that map blank text to the zero vector."""
+
+    def embed_documents(self, texts):
+        return [[0.0] * self.size if not t.strip() else v for t, v in zip(texts, super().embed_documents(texts))]
+
+
+def test_zero_query_vector_with_normalized_index():
+    texts = [f"chunk number {i}" for i in range(5)]
+    store = FAISS.from_texts(texts, ZeroForBlank(size=16), normalize_L2=True)
+    batcher = RetrievalBatcher(store, k=2, max_wait_ms=0)
+    rows = batcher._search_many([" ", "chunk number 1"])
+    assert len(rows[0]) == 2 and all(0 <= r < 5 for r in rows[0])
+    assert np.isfinite(store.index.reconstruct(rows[1][0])).all()
+    batcher.close()
+
+
+def test_batch_sizes_exported_to_metrics():
+    metrics.enable(True)
+    metrics.reset()
+    try:
+        batcher = RetrievalBatcher(make_store(), k=2, max_wait_ms=0, max_batch_size=1)
+        batcher.search("chunk number 1")
+        batcher.search("chunk number 2")
+        counters = metrics.snapshot()["counters"]
+    finally:
+        metrics.enable(False)
+    assert counters['retrieval_batches_total{size="1"}'] == 2
+
+
+def test_fork_restarts_only_live_batchers():
+    live = RetrievalBatcher(make_store(), k=2)
+    closed = RetrievalBatcher(make_store(), k=2)
+    closed.close()
+    assert live in batching._live_batchers and closed not in batching._live_batchers
+    old_thread = live._thread
+    batching._restart_after_fork()
+    assert live._thread is not old_thread and live._thread.is_alive()
+    assert len(live.search("chunk number 3")) == 2
+    live.close()
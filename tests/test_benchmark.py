@@ -0,0 +1,76 @@
+"""
+Tests for the offline benchmark (tiny corpus, fast fake LLM).
+"""
+import asyncio
+
+import pytest
+from langchain_core.messages import HumanMessage
+
+from src import chatbot
+from src.benchmark import (
+    BenchmarkConfig,
+    FakeChatModel,
+    compare_results,
+    latency_summary,
+    measure_import_time,
+    run_benchmark,
+    write_synthetic_corpus,
+)
+
+
+@pytest.fixture(autouse=True)
+def no_cache(monkeypatch):
+    monkeypatch.setattr(chatbot, "get_semantic_cache", lambda: None)
+    monkeypatch.setattr(chatbot, "get_faq_lookup", lambda: None)
+
+
+def test_fake_llm_is_deterministic_and_streams():
+    llm = FakeChatModel(latency_ms=0, tokens_per_second=0, response_tokens=5)
+    messages = [HumanMessage(content="hello")]
+    reply = llm.invoke(messages).content
+    assert len(reply.split()) == 5
+    assert llm.invoke(messages).content == reply
+    assert "".join(c.content for c in llm.stream(messages)) == reply
+
+    async def astream():
+        return "".join([c.content async for c in llm.astream(messages)])
+
+    assert asyncio.run(astream()) == reply
+
+
+def test_synthetic_corpus(tmp_path):
+    config = BenchmarkConfig(faq_entries=7, text_files=2, paragraphs_per_file=3)
+    questions = write_synthetic_corpus(tmp_path, config)
+    assert len(questions) == 7
+    assert len(list(tmp_path.glob("*.json"))) == 1
+    assert len(list(tmp_path.glob("*.txt"))) == 2
+
+
+def test_latency_summary():
+    summary = latency_summary([0.001, 0.002, 0.003])
+    assert summary["count"] == 3
+    assert summary["p50_ms"] == 2.0
+    assert latency_summary([]) == {"count": 0}
+
+
+def test_run_benchmark_end_to_end(tmp_path):
+    config = BenchmarkConfig(
+        faq_entries=20, text_files=1, paragraphs_per_file=5, queries=5,
+        clients=2, requests_per_client=2, llm_latency_ms=0, llm_tokens_per_second=0,
+    )
+    results = run_benchmark(config, workdir=tmp_path)
+    assert results["build"]["chunks"] > 20
+    assert results["retrieval"]["count"] == 5
+    assert results["chat"]["count"] == 4
+    assert results["peak_rss_mb"]["self"] > 0
+    assert results["safety"]["rules_1000.p50_us"] > 0
+    assert results["cold_start"]["src.chatbot.import_ms"] > results["cold_start"]["src.warmup.import_ms"]
+
+    faster = {**results, "chat": {**results["chat"], "p50_ms": results["chat"]["p50_ms"] / 2}}
+    assert any("chat.p50_ms" in line and "better" in line for line in compare_results(results, faster))
+
+
+def test_measure_import_time():
+    measured = measure_import_time("src.warmup")
+    assert measured["import_ms"] > 0
+    assert "config.settings" in [m["module"] for m in measured["slowest"]]
@@ -0,0 +1,79 @@
+"""
+Tests for the semantic answer cache.
+"""
+import re
+
+from src.cache import SemanticCache
+
+
+class BagOfWordsEmbeddings:
+    """Tiny deterministic embeddings: one dimension per known word."""
+
+    VOCAB = ["flu", "symptoms", "common", "what", "are", "dehydration", "signs", "the"]
+
+    def embed_query(self, text):
+        words = re.findall(r"\w+", text.lower())
+        return [float(words.count(w)) for w in self.VOCAB]
+
+
+def make_cache(**kwargs):
+    kwargs.setdefault("threshold", 0.9)
+    kwargs.setdefault("max_entries", 10)
+    kwargs.setdefault("ttl_seconds", 60)
+    return SemanticCache(embeddings=BagOfWordsEmbeddings(), **kwargs)
+
+
+def test_hit_on_reworded_question():
+    cache = make_cache()
+    assert cache.lookup("What are common flu symptoms?").answer is None
+    cache.store("What are common flu symptoms?", "Fever and aches.")
+    hit = cache.lookup("what are the common flu symptoms")
+    assert hit.answer == "Fever and aches."
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_miss_below_threshold():
+    cache = make_cache()
+    cache.store("What are common flu symptoms?", "Fever and aches.")
+    assert cache.lookup("Signs of dehydration").answer is None
+
+
+def test_lru_eviction():
+    cache = make_cache(max_entries=1)
+    cache.store("flu symptoms", "A")
+    cache.store("signs of dehydration", "B")
+    assert len(cache) == 1
+    assert cache.lookup("flu symptoms").answer is None
+    assert cache.stats()["evictions"] == 1
+
+
+def test_ttl_expiry():
+    now = [0.0]
+    cache = make_cache(ttl_seconds=10, clock=lambda: now[0])
+    cache.store("flu symptoms", "A")
+    now[0] = 11.0
+    assert cache.lookup("flu symptoms").answer is None
+
+
+def test_invalidated_when_index_version_changes():
+    version = ["v1"]
+    cache = make_cache(index_version_fn=lambda: version[0])
+    cache.store("flu symptoms", "A")
+    assert cache.lookup("flu symptoms").answer == "A"
+    version[0] = "v2"
+    assert cache.lookup("flu symptoms").answer is None
+    assert len(cache) == 0
+
+
+def test_answer_from_old_index_is_not_stored():
+    version = ["v1"]
+    cache = make_cache(index_version_fn=lambda: version[0])
+    lookup = cache.lookup("flu symptoms")
+    assert lookup.index_version == "v1"
+    version[0] = "v2"  # swapped while the request was answering from v1
+    assert cache.lookup("signs of dehydration").answer is None
+    cache.store("flu symptoms", "old", vector=lookup.vector, index_version=lookup.index_version)
+    assert len(cache) == 0 and cache.stats()["stale_stores"] == 1
+    cache.store("flu symptoms", "new", index_version=cache.lookup("flu symptoms").index_version)
+    assert cache.lookup("flu symptoms").answer == "new"
@@ -0,0 +1,168 @@
+"""
+Tests for chat orchestration with a fake RAG chain (no LLM or index needed).
+"""
+import asyncio
+
+import pytest
+
+from src import chatbot
+from src.cache import CacheLookup
+from src.chatbot import DISCLAIMER_FOOTER, ChatError, chat, chat_stream
+
+
+class FakeChain:
+    def __init__(self, tokens=None, error=None):
+        self.tokens = tokens or []
+        self.error = error
+
+    def invoke(self, inputs):
+        if self.error:
+            raise self.error
+        return "".join(self.tokens)
+
+    def stream(self, inputs):
+        for token in self.tokens:
+            yield token
+        if self.error:
+            raise self.error
+
+
+@pytest.fixture(autouse=True)
+def no_cache(monkeypatch):
+    monkeypatch.setattr(chatbot, "get_semantic_cache", lambda: None)
+    monkeypatch.setattr(chatbot, "get_faq_lookup", lambda: None)
+
+
+def test_chat_appends_disclaimer():
+    reply, err = chat("What is flu?", FakeChain(["  Flu is ", "a virus. "]))
+    assert err is None
+    assert reply == "Flu is a virus." + DISCLAIMER_FOOTER
+
+
+def test_chat_stream_matches_chat():
+    chain = FakeChain(["  Flu is ", "a virus. "])
+    streamed = "".join(chat_stream("What is flu?", chain))
+    assert streamed == chat("What is flu?", chain)[0]
+
+
+def test_chat_stream_empty_answer_uses_fallback():
+    streamed = "".join(chat_stream("What is flu?", FakeChain([" "])))
+    assert streamed == chatbot.NO_ANSWER_MESSAGE + DISCLAIMER_FOOTER
+
+
+def test_chat_stream_invalid_query():
+    with pytest.raises(ChatError):
+        list(chat_stream("   ", FakeChain()))
+
+
+def test_chat_stream_maps_errors():
+    with pytest.raises(ChatError, match="knowledge base"):
+        list(chat_stream("What is flu?", FakeChain(["Flu"], error=FileNotFoundError("x"))))
+
+
+class AsyncFakeChain(FakeChain):
+    async def ainvoke(self, inputs):
+        return self.invoke(inputs)
+
+    async def astream(self, inputs):
+        for token in self.stream(inputs):
+            yield token
+
+
+async def _collect(agen):
+    return "".join([piece async for piece in agen])
+
+
+def test_achat_and_achat_stream_match_chat():
+    chain = AsyncFakeChain(["  Flu is ", "a virus. "])
+    expected = chat("What is flu?", chain)[0]
+
+    async def run():
+        slots = asyncio.Semaphore(1)
+        reply, err = await chatbot.achat("What is flu?", chain, llm_slots=slots)
+        streamed = await _collect(chatbot.achat_stream("What is flu?", chain, llm_slots=slots))
+        return reply, err, streamed
+
+    reply, err, streamed = asyncio.run(run())
+    assert err is None
+    assert reply == expected
+    assert streamed == expected
+
+
+def test_chat_faq_fast_path_skips_llm(monkeypatch):
+    from src.faq import FaqLookup, normalize_question
+
+    question = "What are signs of dehydration?"
+    faq = FaqLookup([{
+        "key": normalize_question(question),
+        "question": question,
+        "answer": "Thirst and dark urine.",
+        "category": "symptoms",
+        "source": "faqs.json",
+    }])
+    monkeypatch.setattr(chatbot, "get_faq_lookup", lambda: faq)
+    chain = FakeChain(error=AssertionError("LLM should not be called"))
+    reply, err = chat("  what are SIGNS of dehydration ", chain)
+    assert err is None
+    assert reply == "Thirst and dark urine." + DISCLAIMER_FOOTER
+    assert "".join(chat_stream(question, chain)) == reply
+    assert faq.stats()["hits"] == 2
+
+    # A category-restricted question goes to retrieval, not the FAQ table
+    chain = AsyncFakeChain(["From ", "medication docs."])
+    assert chat(question, chain, categories=["medication"])[0].startswith("From medication docs.")
+    reply, err = asyncio.run(chatbot.achat(question, chain, categories=["medication"]))
+    assert reply.startswith("From medication docs.")
+    assert asyncio.run(chatbot.achat(question, chain))[0] == "Thirst and dark urine." + DISCLAIMER_FOOTER
+    assert faq.stats()["hits"] == 3
+
+
+class RecordingCache:
+    """Semantic cache that always misses and records what gets stored."""
+
+    def __init__(self):
+        self.stored = []
+
+    def lookup(self, question):
+        return CacheLookup(answer=None, similarity=0.0, vector=None, index_version=None)
+
+    def store(self, question, answer, vector=None, index_version=None):
+        self.stored.append(answer)
+
+
+def test_chat_and_streams_cache_the_same_answer(monkeypatch):
+    cache = RecordingCache()
+    monkeypatch.setattr(chatbot, "get_semantic_cache", lambda: cache)
+    chain = AsyncFakeChain(["  Flu is ", "a virus. "])
+    chat("What is flu?", chain)
+    "".join(chat_stream("What is flu?", chain))
+    asyncio.run(_collect(chatbot.achat_stream("What is flu?", chain)))
+    assert cache.stored == ["Flu is a virus."] * 3
+
+    # A stream cut off at the display limit never read the rest of the answer
+    cache.stored.clear()
+    long_chain = AsyncFakeChain(["x" * 3000, "y" * 3000, "z"])
+    "".join(chat_stream("What is flu?", long_chain))
+    asyncio.run(_collect(chatbot.achat_stream("What is flu?", long_chain)))
+    assert cache.stored == []
+
+
+class FakeGroqError(Exception):
+    __module__ = "groq._exceptions"
+
+
+@pytest.mark.parametrize("message, error, kind", [
+    ("   ", None, "invalid"),
+    ("What is flu?", ValueError("Unknown category 'x'"), "config"),
+    ("What is flu?", FileNotFoundError("no index"), "unavailable"),
+    ("What is flu?", FakeGroqError("rate limited"), "upstream"),
+    ("What is flu?", RuntimeError("bug"), "internal"),
+])
+def test_errors_carry_their_kind(message, error, kind):
+    chain = AsyncFakeChain(["Flu"], error=error)
+    reply, err = asyncio.run(chatbot.achat_result(message, chain))
+    assert reply == "" and err.kind == kind
+    assert asyncio.run(chatbot.achat(message, chain)) == ("", str(err))
+    with pytest.raises(ChatError) as raised:
+        list(chat_stream(message, chain))
+    assert raised.value.kind == kind and str(raised.value) == str(err)
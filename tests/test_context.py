@@ -0,0 +1,63 @@
+"""
+Tests for token-budgeted context packing.
+"""
+from langchain_core.documents import Document
+
+from src.context import pack_context
+from src.ingest import iter_chunks
+from src.utils import estimate_tokens
+
+
+def _doc(text, **metadata):
+    return Document(page_content=text, metadata=metadata)
+
+
+def test_estimate_tokens():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("Flu symptoms: fever, cough.") == 6 + 3  # 4 words, 3 marks
+    assert estimate_tokens("one two three") > estimate_tokens("one two")
+
+
+def test_chunks_carry_packing_metadata():
+    text = " ".join(f"Sentence number {i} about hydration." for i in range(60))
+    chunks = list(iter_chunks([_doc(text, source="a.txt")]))
+    assert len(chunks) > 1
+    for chunk in chunks:
+        start = chunk.metadata["start_index"]
+        assert text[start:start + len(chunk.page_content)] == chunk.page_content
+        assert chunk.metadata["part"] == 0
+        assert chunk.metadata["n_tokens"] == estimate_tokens(chunk.page_content)
+
+
+def test_overlapping_chunks_are_merged_back_into_source_text():
+    text = " ".join(f"Sentence number {i} about hydration." for i in range(60))
+    chunks = list(iter_chunks([_doc(text, source="a.txt")]))[:3]
+    # Retrieved out of order; the merged span must still read as the original
+    packed = pack_context([chunks[2], chunks[0], chunks[1]], budget=10_000)
+    start = chunks[0].metadata["start_index"]
+    end = chunks[2].metadata["start_index"] + len(chunks[2].page_content)
+    assert packed == text[start:end]
+
+
+def test_chunks_from_other_sources_are_not_merged():
+    a = _doc("alpha beta gamma", source="a.txt", part=0, start_index=0)
+    b = _doc("delta epsilon", source="b.txt", part=0, start_index=16)
+    assert pack_context([a, b], budget=100) == "alpha beta gamma\n\ndelta epsilon"
+
+
+def test_near_duplicates_are_dropped():
+    a = _doc("Q: What is the flu?\nA: A viral infection of the nose and throat.", source="x.json")
+    b = _doc("Q: What is the flu\nA: A viral infection of the nose and throat!", source="y.json")
+    c = _doc("Q: What is dehydration?\nA: Losing more fluid than you take in.", source="x.json")
+    assert pack_context([a, b, c], budget=1000) == a.page_content + "\n\n" + c.page_content
+
+
+def test_budget_is_filled_in_relevance_order():
+    big = _doc("word " * 50, source="big", n_tokens=67)
+    small1 = _doc("first small chunk", source="s1", n_tokens=4)
+    small2 = _doc("second small chunk", source="s2", n_tokens=4)
+    # The top chunk is always kept; the big one does not fit and is skipped
+    packed = pack_context([small1, big, small2], budget=20)
+    assert packed == "first small chunk\n\nsecond small chunk"
+    assert pack_context([big, small1], budget=10).startswith("word")
+    assert pack_context([], budget=10) == ""
@@ -0,0 +1,130 @@
+"""
+Tests for the background conversation log writer: batching, rotation and overflow.
+"""
+import gzip
+import json
+import os
+
+import pytest
+
+from src import prefork
+from src.conversation_log import LOG_FILE, ConversationLogWriter, log_file_name
+
+
+def read_records(directory):
+    records = []
+    for path in sorted(directory.glob("*.gz")):
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            records.extend(json.loads(line) for line in f)
+    current = directory / LOG_FILE
+    if current.exists():
+        records.extend(json.loads(line) for line in current.read_text(encoding="utf-8").splitlines())
+    return records
+
+
+def test_records_written_on_close(tmp_path):
+    writer = ConversationLogWriter(tmp_path, flush_interval=0.01).start()
+    assert writer.log("s1", "user", "What is flu?")
+    assert writer.log("s1", "assistant", "A virus.", error=None)
+    writer.close()
+    records = read_records(tmp_path)
+    assert [(r["session"], r["role"], r["content"]) for r in records] == [
+        ("s1", "user", "What is flu?"),
+        ("s1", "assistant", "A virus."),
+    ]
+    assert "ts" in records[0] and records[1]["error"] is None
+    assert writer.stats()["written"] == 2
+    assert not writer.log("s1", "user", "after close")
+
+
+def test_appends_to_existing_log(tmp_path):
+    for text in ("first", "second"):
+        writer = ConversationLogWriter(tmp_path, flush_interval=0.01).start()
+        writer.log("s", "user", text)
+        writer.close()
+    assert [r["content"] for r in read_records(tmp_path)] == ["first", "second"]
+
+
+def test_rotates_and_compresses_by_size(tmp_path):
+    writer = ConversationLogWriter(tmp_path, batch_size=5, flush_interval=0.01, max_bytes=200).start()
+    for i in range(50):
+        writer.log("s", "user", f"message {i}")
+    writer.close()
+    assert writer.rotations > 0
+    assert list(tmp_path.glob("conversations-*.jsonl.gz"))
+    assert not list(tmp_path.glob("conversations-*.jsonl"))  # only compressed copies kept
+    assert [r["content"] for r in read_records(tmp_path)] == [f"message {i}" for i in range(50)]
+
+
+def test_rotates_by_age(tmp_path):
+    writer = ConversationLogWriter(tmp_path, flush_interval=0.01, max_bytes=0, rotate_seconds=1e-6)
+    writer.start()
+    writer.log("s", "user", "old")
+    writer.close()
+    writer = ConversationLogWriter(tmp_path, flush_interval=0.01, max_bytes=0, rotate_seconds=1e-6)
+    writer.start()
+    writer.log("s", "user", "new")
+    writer.close()
+    assert writer.rotations >= 1
+    assert [r["content"] for r in read_records(tmp_path)] == ["old", "new"]
+
+
+def test_drop_policy_discards_when_full(tmp_path):
+    writer = ConversationLogWriter(tmp_path, queue_size=2, overflow="drop")  # not started yet
+    assert writer.log("s", "user", "a")
+    assert writer.log("s", "user", "b")
+    assert not writer.log("s", "user", "c")
+    assert writer.stats()["dropped"] == 1
+    writer.start()
+    writer.close()
+    assert [r["content"] for r in read_records(tmp_path)] == ["a", "b"]
+
+
+def test_block_policy_keeps_everything(tmp_path):
+    writer = ConversationLogWriter(tmp_path, queue_size=2, batch_size=1, flush_interval=0.01,
+                                   overflow="block").start()
+    for i in range(20):
+        assert writer.log("s", "user", str(i))
+    writer.close()
+    assert writer.stats()["dropped"] == 0
+    assert len(read_records(tmp_path)) == 20
+
+
+def test_unknown_overflow_policy(tmp_path):
+    with pytest.raises(ValueError):
+        ConversationLogWriter(tmp_path, overflow="spill")
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="needs os.fork()")
+def test_worker_processes_rotate_their_own_files(tmp_path):
+    assert log_file_name() == LOG_FILE
+    pids = []
+    for index in range(2):
+        pid = os.fork()
+        if pid == 0:
+            code = 1
+            try:
+                prefork._worker_index = index
+                writer = ConversationLogWriter(
+                    tmp_path, batch_size=3, flush_interval=0.01, max_bytes=300, file_name=log_file_name()
+                ).start()
+                for i in range(60):
+                    writer.log(f"w{index}", "user", f"message {i}")
+                writer.close()
+                code = 0 if writer.rotations else 1
+            finally:
+                os._exit(code)
+        pids.append(pid)
+    for pid in pids:
+        _, status = os.waitpid(pid, 0)
+        assert os.waitstatus_to_exitcode(status) == 0
+
+    for index in range(2):
+        assert list(tmp_path.glob(f"conversations-{index}-*.jsonl.gz"))
+    records = []
+    for path in sorted(tmp_path.glob("*.gz")) + sorted(tmp_path.glob("*.jsonl")):
+        with (gzip.open(path, "rt", encoding="utf-8") if path.suffix == ".gz" else open(path, encoding="utf-8")) as f:
+            records.extend(json.loads(line) for line in f)
+    for index in range(2):
+        contents = [r["content"] for r in records if r["session"] == f"w{index}"]
+        assert sorted(contents) == sorted(f"message {i}" for i in range(60))
@@ -0,0 +1,84 @@
+"""
+Tests for exact / near-duplicate chunk removal at ingest (fake embeddings).
+"""
+import json
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from src.dedup import NearDuplicateFilter, cluster_metadata
+from src.embeddings import build_faiss_index
+from src.manifest import read_manifest
+from src.versions import resolve_store_path
+
+FLU = (
+    "Influenza symptoms include fever, cough, sore throat, runny nose, body aches, "
+    "headache and fatigue. Most people recover within one to two weeks without "
+    "treatment, but should rest, drink plenty of fluids and stay home while sick."
+)
+WATER = "Adults should drink about two liters of water a day, more in hot weather or during exercise."
+
+
+def build(raw, index, **kwargs):
+    return build_faiss_index(
+        persist_path=index, data_dir=raw, embeddings=DeterministicFakeEmbedding(size=8), **kwargs
+    )
+
+
+def stored_metadata(index):
+    path = resolve_store_path(index) / "docstore.jsonl"
+    return {rec["text"]: rec["metadata"] for rec in map(json.loads, path.read_text().splitlines())}
+
+
+def test_filter_detects_exact_and_near_duplicates():
+    dedup = NearDuplicateFilter(threshold=0.7)
+    assert dedup.add("a", FLU) is None
+    assert dedup.add("b", "  " + FLU.upper()) == "a"  # same after normalization
+    assert dedup.add("c", FLU.replace("headache", "headaches")) == "a"
+    assert dedup.add("d", WATER) is None
+    assert (dedup.seen, dedup.exact, dedup.near) == (4, 1, 1)
+
+
+def test_filter_records_duplicates():
+    dedup = NearDuplicateFilter()
+    dedup.register("old", FLU)
+    duplicates = {}
+    docs = [(Document(page_content=text), cid) for text, cid in [(FLU, "new"), (WATER, "water"), (FLU, "old")]]
+    kept = [cid for _, cid in dedup.filter(docs, duplicates)]
+    assert kept == ["water"]
+    assert duplicates == {"new": "old"}  # "old" already has a vector
+
+
+def test_cluster_metadata():
+    duplicates = {"d1": "r", "d2": "r"}
+    sources = {"r": "a.txt", "d1": "b.txt", "d2": "a.txt"}
+    assert cluster_metadata(duplicates, sources, ["r"]) == {"r": {"sources": ["a.txt", "b.txt"]}}
+    del sources["r"]
+    assert cluster_metadata(duplicates, sources, ["r"])["r"] == {"sources": ["b.txt", "a.txt"], "source": "b.txt"}
+
+
+def test_build_skips_duplicates_and_merges_sources(tmp_path):
+    raw, index = tmp_path / "raw", tmp_path / "index"
+    raw.mkdir()
+    (raw / "a.txt").write_text(FLU, encoding="utf-8")
+    (raw / "b.txt").write_text(FLU, encoding="utf-8")
+    (raw / "c.txt").write_text(WATER, encoding="utf-8")
+
+    assert build(raw, index).index.ntotal == 3  # off by default
+    store = build(raw, index, dedup=True)
+    assert store.index.ntotal == 2
+    meta = stored_metadata(index)[FLU]
+    assert meta["source"] == str(raw / "a.txt")
+    assert meta["sources"] == [str(raw / "a.txt"), str(raw / "b.txt")]
+    assert len(read_manifest(resolve_store_path(index))["duplicates"]) == 1
+
+    # The representative's file goes away: its vector stays for the duplicate
+    (raw / "a.txt").unlink()
+    assert build(raw, index, dedup=True).index.ntotal == 2
+    meta = stored_metadata(index)[FLU]
+    assert meta["source"] == str(raw / "b.txt") and "sources" not in meta
+    assert "duplicates" in read_manifest(resolve_store_path(index))
+
+    (raw / "b.txt").unlink()
+    assert build(raw, index, dedup=True).index.ntotal == 1
+    assert FLU not in stored_metadata(index)
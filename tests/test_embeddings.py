@@ -0,0 +1,138 @@
+"""
+Tests for incremental FAISS index builds (fake embeddings, no model download).
+"""
+import json
+
+import pytest
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from src.embeddings import build_faiss_index
+from src.lexical import LEXICAL_FILE
+from src.manifest import MANIFEST_FILE
+from src.versions import resolve_store_path
+
+
+class CountingEmbeddings(DeterministicFakeEmbedding):
+    embedded: int = 0
+
+    def embed_documents(self, texts):
+        self.embedded += len(texts)
+        return super().embed_documents(texts)
+
+
+def write_faqs(path, entries):
+    path.write_text(json.dumps(entries), encoding="utf-8")
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    raw = tmp_path / "raw"
+    raw.mkdir()
+    write_faqs(raw / "a.json", [{"question": "Q1?", "answer": "A1"}, {"question": "Q2?", "answer": "A2"}])
+    write_faqs(raw / "b.json", [{"question": "Q3?", "answer": "A3"}])
+    return raw, tmp_path / "index"
+
+
+def test_full_then_noop_build(corpus):
+    raw, index = corpus
+    emb = CountingEmbeddings(size=8)
+    store = build_faiss_index(persist_path=index, data_dir=raw, embeddings=emb)
+    assert emb.embedded == 3
+    assert store.index.ntotal == 3
+    assert (resolve_store_path(index) / MANIFEST_FILE).exists()
+
+    emb.embedded = 0
+    store = build_faiss_index(persist_path=index, data_dir=raw, embeddings=emb)
+    assert emb.embedded == 0
+    assert store.index.ntotal == 3
+
+
+def test_lexical_index_only_when_enabled(corpus):
+    raw, index = corpus
+    emb = CountingEmbeddings(size=8)
+    build_faiss_index(persist_path=index, data_dir=raw, embeddings=emb, lexical_index=False)
+    first = resolve_store_path(index)
+    assert not (first / LEXICAL_FILE).exists()
+
+    # Turning it on later publishes a new version without re-embedding
+    emb.embedded = 0
+    build_faiss_index(persist_path=index, data_dir=raw, embeddings=emb, lexical_index=True)
+    assert emb.embedded == 0
+    assert resolve_store_path(index) != first
+    assert (resolve_store_path(index) / LEXICAL_FILE).exists()
+    assert not (first / LEXICAL_FILE).exists()
+
+
+def test_incremental_add_change_and_remove(corpus):
+    raw, index = corpus
+    emb = CountingEmbeddings(size=8)
+    build_faiss_index(persist_path=index, data_dir=raw, embeddings=emb)
+
+    emb.embedded = 0
+    write_faqs(raw / "a.json", [{"question": "Q1?", "answer": "A1"}, {"question": "Q2?", "answer": "changed"}])
+    (raw / "b.json").unlink()
+    store = build_faiss_index(persist_path=index, data_dir=raw, embeddings=emb)
+    assert emb.embedded == 1
+    assert store.index.ntotal == 2
+    texts = sorted(d.page_content for d in store.docstore._dict.values())
+    assert any("changed" in t for t in texts)
+    assert not any("Q3?" in t for t in texts)
+
+
+def test_full_rebuild_when_params_change(corpus, monkeypatch):
+    raw, index = corpus
+    emb = CountingEmbeddings(size=8)
+    build_faiss_index(persist_path=index, data_dir=raw, embeddings=emb)
+
+    emb.embedded = 0
+    monkeypatch.setattr("src.embeddings.HF_EMBEDDING_MODEL_NAME", "other-model")
+    build_faiss_index(persist_path=index, data_dir=raw, embeddings=emb)
+    assert emb.embedded == 3
+
+
+def test_embed_batches_in_order():
+    from src.embedding_engine import embed_batches
+
+    emb = DeterministicFakeEmbedding(size=4)
+    texts = [f"text {i}" for i in range(5)]
+    out = list(embed_batches(iter(texts), emb, workers=1, batch_size=2))
+    assert [batch for batch, _ in out] == [texts[0:2], texts[2:4], texts[4:]]
+    vectors = [v for _, batch in out for v in batch]
+    assert vectors == emb.embed_documents(texts)
+
+
+def test_build_with_small_batches(corpus):
+    raw, index = corpus
+    store = build_faiss_index(
+        persist_path=index, data_dir=raw, embeddings=CountingEmbeddings(size=8), batch_size=1
+    )
+    assert store.index.ntotal == 3
+
+
+def test_build_streams_jsonl_and_text(tmp_path):
+    raw = tmp_path / "raw"
+    raw.mkdir()
+    (raw / "faqs.jsonl").write_text(
+        '{"question": "Q1?", "answer": "A1"}\n\n{"question": "Q2?", "answer": "A2"}\n',
+        encoding="utf-8",
+    )
+    (raw / "notes.txt").write_text("Para one.\n\nPara two.", encoding="utf-8")
+    store = build_faiss_index(
+        persist_path=tmp_path / "index", data_dir=raw, embeddings=CountingEmbeddings(size=8)
+    )
+    assert store.index.ntotal == 3
+
+
+def test_parallel_ingest_matches_serial(tmp_path):
+    raw = tmp_path / "raw"
+    raw.mkdir()
+    for i in range(4):
+        write_faqs(raw / f"f{i}.json", [{"question": f"Q{i}-{j}?", "answer": "A"} for j in range(3)])
+    serial = build_faiss_index(
+        persist_path=tmp_path / "serial", data_dir=raw, embeddings=CountingEmbeddings(size=8)
+    )
+    parallel = build_faiss_index(
+        persist_path=tmp_path / "parallel", data_dir=raw, embeddings=CountingEmbeddings(size=8),
+        ingest_workers=2,
+    )
+    assert serial.index_to_docstore_id == parallel.index_to_docstore_id
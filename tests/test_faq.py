@@ -0,0 +1,29 @@
+"""
+Tests for the exact-match FAQ fast path table.
+"""
+import json
+
+from src.faq import FaqLookup, build_faq_lookup, normalize_question
+
+
+def test_normalize_question():
+    assert normalize_question("  What's   the FLU?! ") == "whats the flu"
+
+
+def test_build_and_match(tmp_path):
+    raw = tmp_path / "raw"
+    raw.mkdir()
+    (raw / "faqs.json").write_text(json.dumps([
+        {"question": "What are signs of dehydration?", "answer": "Thirst.", "category": "symptoms"},
+        {"question": "What are signs of dehydration", "answer": "Duplicate."},
+        {"question": "No answer?"},
+    ]), encoding="utf-8")
+    (raw / "notes.txt").write_text("Q: ignored?", encoding="utf-8")
+
+    assert build_faq_lookup(tmp_path, raw) == 1
+    lookup = FaqLookup.load(tmp_path)
+    entry = lookup.match("what are signs of DEHYDRATION")
+    assert entry["answer"] == "Thirst."
+    assert entry["category"] == "symptoms"
+    assert lookup.match("signs of dehydration in kids?") is None
+    assert lookup.stats() == {"size": 1, "hits": 1, "misses": 1}
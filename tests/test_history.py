@@ -0,0 +1,73 @@
+"""
+Tests for conversation history compaction.
+"""
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+from config.settings import DISCLAIMER_FOOTER
+from src.history import ConversationHistory, strip_footer, truncate_to_tokens
+from src.rag import format_chat_history
+from src.utils import estimate_tokens
+
+
+def _turns(n):
+    for i in range(n):
+        yield "user", f"Question {i} about hydration?"
+        yield "assistant", f"Answer {i}. Drink water regularly." + DISCLAIMER_FOOTER
+
+
+def test_strip_footer():
+    assert strip_footer("Drink water." + DISCLAIMER_FOOTER) == "Drink water."
+    assert strip_footer("No footer here.") == "No footer here."
+
+
+def test_recent_turns_verbatim_older_folded_into_summary():
+    history = ConversationHistory.from_pairs(_turns(4), recent_turns=2, token_budget=1000)
+    messages = history.messages()
+    assert isinstance(messages[0], SystemMessage)
+    assert "User asked: Question 0 about hydration?" in messages[0].content
+    assert "Assistant said: Answer 1." in messages[0].content
+    assert "Drink water" not in messages[0].content
+    assert [type(m) for m in messages[1:]] == [HumanMessage, AIMessage] * 2
+    assert messages[1].content == "Question 2 about hydration?"
+    assert messages[-1].content == "Answer 3. Drink water regularly."
+
+
+def test_messages_are_cached_until_next_add():
+    history = ConversationHistory(recent_turns=1)
+    history.add("user", "Hi")
+    first = history.messages()
+    assert history.messages() is first
+    history.add("assistant", "Hello")
+    assert history.messages() is not first
+    assert len(history) == 2
+
+
+def test_error_replies_are_skipped():
+    history = ConversationHistory()
+    history.add("user", "Hi")
+    history.add("assistant", "[Error: Something went wrong]")
+    assert [m.content for m in history.messages()] == ["Hi"]
+
+
+def test_token_budget_is_a_hard_cap():
+    history = ConversationHistory.from_pairs(
+        _turns(10), recent_turns=5, token_budget=60, summary_tokens=20
+    )
+    assert history.token_count() <= 60
+    assert history.messages()[-1].content == "Answer 9. Drink water regularly."
+
+    long = ConversationHistory(token_budget=20)
+    long.add("user", "word " * 100 + "final")
+    (message,) = long.messages()
+    assert message.content.endswith("final")
+    assert estimate_tokens(message.content) <= 20
+
+
+def test_truncate_to_tokens():
+    assert truncate_to_tokens("short text", 10) == "short text"
+    assert truncate_to_tokens("a b c d e f", 4) == "… e f"
+
+
+def test_format_chat_history_accepts_pairs():
+    messages = format_chat_history([("user", "Hi"), ("assistant", "Hello" + DISCLAIMER_FOOTER)])
+    assert [m.content for m in messages] == ["Hi", "Hello"]
@@ -8,7 +8,14 @@ from pathlib import Path
 import pytest
 from langchain_core.documents import Document
 
-from src.ingest import load_faq_json, load_all_raw_data, split_documents
+from src.ingest import (
+    iter_json_array,
+    iter_raw_file,
+    iter_text_file,
+    load_all_raw_data,
+    load_faq_json,
+    split_documents,
+)
 
 
 def test_load_faq_json():
@@ -39,3 +46,32 @@ def test_split_documents():
     for c in chunks:
         assert isinstance(c, Document)
         assert len(c.page_content) > 0
+
+
+@pytest.mark.parametrize("read_chars", [1, 7, 1 << 16])
+def test_iter_json_array_streams_items(tmp_path, read_chars):
+    data = [{"question": "Q1? ] [", "answer": "A1"}, 12345, [1, [2]], None]
+    path = tmp_path / "faqs.json"
+    path.write_text(json.dumps(data, indent=2), encoding="utf-8")
+    assert list(iter_json_array(path, read_chars)) == data
+
+
+def test_load_faq_jsonl(tmp_path):
+    path = tmp_path / "faqs.jsonl"
+    path.write_text(
+        '{"question": "Q1?", "answer": "A1", "category": "symptoms"}\n\n'
+        '{"question": "Q2?", "answer": "A2"}\n',
+        encoding="utf-8",
+    )
+    docs = list(iter_raw_file(path))
+    assert len(docs) == 2
+    assert docs[0].metadata == {"source": str(path), "category": "symptoms"}
+
+
+def test_iter_text_file_blocks(tmp_path):
+    path = tmp_path / "notes.txt"
+    path.write_text("one\n\ntwo\n\nthree", encoding="utf-8")
+    assert [d.page_content for d in iter_text_file(path)] == ["one\n\ntwo\n\nthree"]
+    blocks = [d.page_content for d in iter_text_file(path, block_chars=6)]
+    assert len(blocks) > 1
+    assert "".join(blocks).replace("\n", "") == "onetwothree"
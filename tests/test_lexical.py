@@ -0,0 +1,86 @@
+"""
+Tests for BM25 lexical retrieval and reciprocal rank fusion.
+"""
+import numpy as np
+from langchain_community.vectorstores import FAISS
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from src.lexical import (
+    LEXICAL_FILE,
+    BM25Index,
+    HybridRetriever,
+    load_lexical_index,
+    reciprocal_rank_fusion,
+    tokenize,
+)
+
+TEXTS = [
+    "Ibuprofen and aspirin can interact; ask a pharmacist.",
+    "Signs of dehydration include thirst and dark urine.",
+    "Flu symptoms: fever, cough, body aches.",
+    "Metformin is commonly used for type 2 diabetes.",
+]
+
+
+def test_tokenize():
+    assert tokenize("Take 200mg Ibuprofen!") == ["take", "200mg", "ibuprofen"]
+
+
+def test_bm25_finds_rare_term():
+    index = BM25Index.build(TEXTS)
+    hits = index.search("metformin", k=2)
+    assert hits[0][0] == 3
+    assert len(hits) == 1
+    assert index.search("unknownword", k=2) == []
+
+
+def test_bm25_postings_grouped_by_term():
+    index = BM25Index.build(["flu flu fever", "cough", "fever flu", ""] * 2, k1=1.2, b=0.0)
+    assert sorted(index.vocab) == ["cough", "fever", "flu"]
+    t = index.vocab["flu"]
+    lo, hi = index.starts[t], index.starts[t + 1]
+    assert index.rows[lo:hi].tolist() == [0, 2, 4, 6]
+    # b=0: the weight only depends on tf (2, 1, 2, 1)
+    weights = index.weights[lo:hi]
+    assert weights[0] == weights[2] > weights[1] == weights[3] > 0
+    assert index.starts[-1] == len(index.rows) == len(index.weights) == 10
+
+
+def test_bm25_allowed_rows():
+    index = BM25Index.build(TEXTS)
+    allowed = np.array([True, True, True, False])
+    assert index.search("metformin", k=2, allowed=allowed) == []
+    assert index.search("flu metformin", k=2, allowed=allowed)[0][0] == 2
+
+
+def test_bm25_save_and_load(tmp_path):
+    index = BM25Index.build(TEXTS)
+    index.save(tmp_path)
+    loaded = load_lexical_index(tmp_path)
+    assert loaded.search("dehydration thirst", k=3) == index.search("dehydration thirst", k=3)
+    assert load_lexical_index(tmp_path / "missing") is None
+
+
+def test_bm25_vocab_saved_as_utf8(tmp_path):
+    index = BM25Index.build(["Paracétamol 500mg", "Grippe und Fieber"])
+    index.save(tmp_path)
+    with np.load(tmp_path / LEXICAL_FILE) as data:
+        assert "vocab" not in data and data["vocab_bytes"].dtype == np.uint8
+    assert load_lexical_index(tmp_path).vocab == index.vocab
+
+    # Indexes saved with a fixed-width unicode vocab array still load
+    vocab = sorted(index.vocab, key=index.vocab.get)
+    np.savez(tmp_path / LEXICAL_FILE, vocab=np.asarray(vocab, dtype=str), starts=index.starts,
+             rows=index.rows, weights=index.weights, n_docs=np.asarray([index.n_docs]))
+    assert load_lexical_index(tmp_path).search("paracétamol", k=1) == index.search("paracétamol", k=1)
+
+
+def test_reciprocal_rank_fusion():
+    assert reciprocal_rank_fusion([[1, 2, 3], [3, 1]])[:2] == [1, 3]
+
+
+def test_hybrid_retriever_surfaces_exact_term():
+    store = FAISS.from_texts(TEXTS, DeterministicFakeEmbedding(size=8))
+    retriever = HybridRetriever(store, BM25Index.build(TEXTS), k=2, candidates=2)
+    docs = retriever.invoke("metformin")
+    assert any("Metformin" in d.page_content for d in docs)
@@ -0,0 +1,130 @@
+"""
+Tests for per-stage tracing and the Prometheus export.
+"""
+import asyncio
+import json
+import logging
+
+import pytest
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from src import chatbot, metrics
+from src.benchmark import FakeChatModel
+from src.chatbot import achat_stream, chat, chat_stream
+from src.embeddings import build_faiss_index
+from src.rag import build_rag_chain
+
+
+@pytest.fixture
+def enabled():
+    metrics.reset()
+    metrics.enable(True, log_requests=True)
+    yield
+    metrics.enable(False)
+    metrics.reset()
+
+
+@pytest.fixture(autouse=True)
+def no_cache(monkeypatch):
+    monkeypatch.setattr(chatbot, "get_semantic_cache", lambda: None)
+    monkeypatch.setattr(chatbot, "get_faq_lookup", lambda: None)
+
+
+def test_disabled_is_a_no_op():
+    metrics.reset()
+    with metrics.request_trace("chat") as trace:
+        with metrics.span("retrieve"):
+            metrics.inc("tokens_total", 5, kind="prompt")
+        trace.set_outcome("ok")
+    assert metrics.snapshot() == {"counters": {}, "histograms": {}}
+    assert metrics.render_prometheus() == "\n"
+
+
+def test_spans_accumulate_into_request_trace(enabled, caplog):
+    with caplog.at_level(logging.INFO, logger="src.metrics"):
+        with metrics.request_trace("chat"):
+            with metrics.span("retrieve"):
+                pass
+            with metrics.span("retrieve"):
+                pass
+            metrics.inc("cache_lookups_total", cache="faq", result="miss")
+    record = json.loads(caplog.records[-1].getMessage())
+    assert record["kind"] == "chat" and record["outcome"] == "ok"
+    assert set(record["stages"]) == {"retrieve"}
+    assert record["counters"] == {"cache_lookups_total[faq,miss]": 1}
+    snap = metrics.snapshot()
+    assert snap["histograms"]['stage_seconds{stage="retrieve"}']["count"] == 2
+    assert snap["counters"]['requests_total{kind="chat",outcome="ok"}'] == 1
+
+
+def test_prometheus_format(enabled):
+    metrics.observe("stage_seconds", 0.003, stage="llm")
+    metrics.inc("tokens_total", 7, kind="prompt")
+    text = metrics.render_prometheus()
+    assert "# TYPE medchat_tokens_total counter" in text
+    assert 'medchat_tokens_total{kind="prompt"} 7' in text
+    assert "# TYPE medchat_stage_seconds histogram" in text
+    assert 'medchat_stage_seconds_bucket{stage="llm",le="0.0025"} 0' in text
+    assert 'medchat_stage_seconds_bucket{stage="llm",le="0.005"} 1' in text
+    assert 'medchat_stage_seconds_bucket{stage="llm",le="+Inf"} 1' in text
+    assert 'medchat_stage_seconds_count{stage="llm"} 1' in text
+
+
+def test_chat_and_build_are_instrumented(enabled, tmp_path):
+    data = tmp_path / "raw"
+    data.mkdir()
+    (data / "faq.json").write_text(json.dumps([
+        {"question": "What is flu?", "answer": "A viral infection.", "category": "flu"},
+        {"question": "What is dehydration?", "answer": "Losing too much fluid.", "category": "general"},
+    ]), encoding="utf-8")
+    store = build_faiss_index(
+        persist_path=tmp_path / "index", data_dir=data, embeddings=DeterministicFakeEmbedding(size=16)
+    )
+    chain = build_rag_chain(
+        store, batch_retrieval=False,
+        llm=FakeChatModel(latency_ms=0, tokens_per_second=0, response_tokens=3),
+    )
+    reply, err = chat("Tell me about flu", chain, conversation_history=[])
+    assert err is None and reply
+
+    histograms = metrics.snapshot()["histograms"]
+    for stage in (
+        "build.hash_files", "build.embed", "build.lexical_index",
+        "validate", "retrieve", "retrieve.vector_search", "pack_context",
+        "prompt", "llm", "history", "postprocess",
+    ):
+        assert f'stage_seconds{{stage="{stage}"}}' in histograms, stage
+    counters = metrics.snapshot()["counters"]
+    assert counters['requests_total{kind="chat",outcome="ok"}'] == 1
+    assert counters['requests_total{kind="build",outcome="ok"}'] == 1
+    assert counters['build_chunks_total'] == 2
+
+
+class SlowChain:
+    def stream(self, inputs):
+        yield from ["Flu ", "is ", "a virus."]
+
+    async def astream(self, inputs):
+        for token in self.stream(inputs):
+            await asyncio.sleep(0)
+            yield token
+
+
+def test_stream_trace_is_not_held_across_yields(enabled):
+    stream = chat_stream("What is flu?", SlowChain())
+    assert next(stream)
+    assert metrics.current_trace() is None  # only current while the generator runs
+    stream.close()
+    assert metrics.snapshot()["counters"]['requests_total{kind="chat_stream",outcome="error"}'] == 1
+
+
+def test_abandoned_async_stream_closed_from_another_task(enabled):
+    async def run():
+        stream = achat_stream("What is flu?", SlowChain())
+        assert await stream.__anext__()
+        assert metrics.current_trace() is None
+        # e.g. aiohttp dropping a disconnected client: finalized elsewhere
+        await asyncio.create_task(stream.aclose())
+
+    asyncio.run(run())
+    assert metrics.snapshot()["counters"]['requests_total{kind="chat_stream",outcome="error"}'] == 1
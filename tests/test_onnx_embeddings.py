@@ -0,0 +1,91 @@
+"""
+Tests for embedding backend selection and the ONNX parity check (fake
+embeddings; the ONNX model itself needs onnxruntime and an exported model).
+"""
+import json
+
+import pytest
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from src import embeddings as emb_module
+from src.embeddings import (
+    EMBEDDING_TYPE_FILE,
+    build_faiss_index,
+    embedding_model_id,
+    index_embedding_backend,
+)
+from src.onnx_embeddings import cosine_parity
+from src.versions import resolve_store_path
+
+
+class FlippedEmbeddings(DeterministicFakeEmbedding):
+    """Deterministic vectors pointing the opposite way (cosine -1 to the originals)."""
+
+    def embed_documents(self, texts):
+        return [[-x for x in v] for v in super().embed_documents(texts)]
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    raw = tmp_path / "raw"
+    raw.mkdir()
+    (raw / "a.json").write_text(
+        json.dumps([{"question": "Q1?", "answer": "A1"}, {"question": "Q2?", "answer": "A2"}]),
+        encoding="utf-8",
+    )
+    return raw, tmp_path / "index"
+
+
+def test_index_embedding_backend(tmp_path, monkeypatch):
+    monkeypatch.setattr(emb_module, "EMBEDDING_BACKEND", "onnx")
+    assert index_embedding_backend(tmp_path) == "onnx"  # nothing recorded yet
+
+    (tmp_path / EMBEDDING_TYPE_FILE).write_text("local_hf", encoding="utf-8")
+    assert index_embedding_backend(tmp_path) == "torch"
+    (tmp_path / EMBEDDING_TYPE_FILE).write_text("local_onnx_int8\n", encoding="utf-8")
+    assert index_embedding_backend(tmp_path) == "onnx"
+
+    (tmp_path / EMBEDDING_TYPE_FILE).write_text("openai", encoding="utf-8")
+    with pytest.raises(ValueError):
+        index_embedding_backend(tmp_path)
+
+
+def test_unknown_backend_rejected(monkeypatch):
+    with pytest.raises(ValueError):
+        emb_module.get_embeddings("gpu")
+
+
+def test_build_records_backend(corpus, monkeypatch):
+    raw, index = corpus
+    build_faiss_index(persist_path=index, data_dir=raw, embeddings=DeterministicFakeEmbedding(size=8))
+    assert (resolve_store_path(index) / EMBEDDING_TYPE_FILE).read_text(encoding="utf-8") == "local_hf"
+    assert embedding_model_id("onnx") != embedding_model_id("torch")
+
+
+def test_cosine_parity():
+    texts = ["fever and chills", "how much water", "sleep hygiene"]
+    same = cosine_parity(texts, DeterministicFakeEmbedding(size=16), DeterministicFakeEmbedding(size=16))
+    assert same["samples"] == 3
+    assert same["min_cosine"] == pytest.approx(1.0, abs=1e-5)
+
+    other = cosine_parity(texts, DeterministicFakeEmbedding(size=16), FlippedEmbeddings(size=16))
+    assert other["min_cosine"] == pytest.approx(-1.0, abs=1e-5)
+
+
+def test_check_parity_raises_on_drift(corpus, monkeypatch):
+    raw, index = corpus
+    store = build_faiss_index(persist_path=index, data_dir=raw, embeddings=DeterministicFakeEmbedding(size=8))
+    monkeypatch.setattr(emb_module, "_load_embeddings", lambda backend: DeterministicFakeEmbedding(size=8))
+    emb_module._check_parity(store, DeterministicFakeEmbedding(size=8))  # identical: passes
+
+    with pytest.raises(ValueError, match="drift"):
+        emb_module._check_parity(store, FlippedEmbeddings(size=8))
+
+
+def test_onnx_embeddings_missing_model(tmp_path):
+    pytest.importorskip("onnxruntime")
+    pytest.importorskip("tokenizers")
+    from src.onnx_embeddings import OnnxEmbeddings
+
+    with pytest.raises(FileNotFoundError, match="export_onnx_model"):
+        OnnxEmbeddings(model_dir=tmp_path)
@@ -0,0 +1,114 @@
+"""
+Tests for category-partitioned sub-indexes and query routing (fake embeddings).
+"""
+import json
+
+import pytest
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from src.embeddings import build_faiss_index
+from src.lexical import load_lexical_index
+from src.partitions import (
+    DEFAULT_CATEGORY,
+    PARTITIONS_DIR,
+    PartitionedRetriever,
+    category_of,
+    load_partitions,
+)
+from src.rag import _build_retriever
+from src.versions import resolve_store_path
+
+FAQS = [
+    {"question": "What are flu symptoms?", "answer": "Fever and cough.", "category": "symptoms"},
+    {"question": "What are signs of dehydration?", "answer": "Thirst, dark urine.", "category": "symptoms"},
+    {"question": "Can I take ibuprofen with aspirin?", "answer": "Ask a pharmacist.", "category": "medication"},
+    {"question": "What if I miss a dose?", "answer": "Check the leaflet.", "category": "medication"},
+    {"question": "How much water should I drink?", "answer": "About two liters.", "category": "wellness"},
+]
+
+
+@pytest.fixture
+def store(tmp_path):
+    raw = tmp_path / "raw"
+    raw.mkdir()
+    (raw / "faqs.json").write_text(json.dumps(FAQS), encoding="utf-8")
+    (raw / "notes.txt").write_text("General advice: see a doctor when unsure.", encoding="utf-8")
+    index = tmp_path / "index"
+    vector_store = build_faiss_index(
+        persist_path=index, data_dir=raw, embeddings=DeterministicFakeEmbedding(size=16),
+        category_partitions=True,
+    )
+    return vector_store, index
+
+
+def texts_by_category(vector_store):
+    out = {}
+    for row in range(vector_store.index.ntotal):
+        doc = vector_store.docstore.search(vector_store.index_to_docstore_id[row])
+        out.setdefault(category_of(doc.metadata), []).append(doc.page_content)
+    return out
+
+
+def test_category_of():
+    assert category_of({"category": "medication"}) == "medication"
+    assert category_of({"source": "notes.txt"}) == DEFAULT_CATEGORY
+
+
+def test_build_and_load_partitions(store):
+    vector_store, index = store
+    partitions = load_partitions(index)
+    assert partitions.categories == ["general", "medication", "symptoms", "wellness"]
+    assert partitions.sizes() == {"general": 1, "medication": 2, "symptoms": 2, "wellness": 1}
+    assert sum(partitions.sizes().values()) == vector_store.index.ntotal
+
+
+def test_search_stays_in_requested_categories(store):
+    vector_store, index = store
+    retriever = PartitionedRetriever(vector_store, load_partitions(index), k=4)
+    docs = retriever.invoke("fever and cough", categories=["medication"])
+    assert len(docs) == 2
+    assert {d.metadata["category"] for d in docs} == {"medication"}
+
+    with pytest.raises(ValueError, match="Unknown category"):
+        retriever.invoke("fever", categories=["surgery"])
+
+
+def test_routing_picks_the_query_category(store):
+    vector_store, index = store
+    retriever = PartitionedRetriever(vector_store, load_partitions(index), k=1, probe=1)
+    for category, texts in texts_by_category(vector_store).items():
+        docs = retriever.invoke(texts[0])
+        assert docs[0].page_content == texts[0]
+        assert category_of(docs[0].metadata) == category
+
+
+def test_hybrid_partitioned_retrieval_filters_lexical_hits(store):
+    vector_store, index = store
+    retriever = PartitionedRetriever(
+        vector_store, load_partitions(index), k=3, lexical_index=load_lexical_index(index),
+    )
+    docs = retriever.invoke("ibuprofen aspirin", categories=["symptoms"])
+    assert docs and all(d.metadata["category"] == "symptoms" for d in docs)
+
+
+def test_unpartitioned_retriever_rejects_category_filter(store, tmp_path):
+    vector_store, _ = store
+    retrieve = _build_retriever(vector_store, None, False)
+    assert retrieve("fever")
+    with pytest.raises(ValueError, match="CATEGORY_PARTITIONS"):
+        retrieve("fever", ["symptoms"])
+
+
+def test_build_without_partitions_removes_them(store):
+    vector_store, index = store
+    raw = index.parent / "raw"
+    published = resolve_store_path(index)
+    build_faiss_index(
+        persist_path=index, data_dir=raw, embeddings=DeterministicFakeEmbedding(size=16),
+        category_partitions=False,
+    )
+    # Nothing to embed, but a new version is published; the old one is untouched
+    assert resolve_store_path(index) != published
+    assert (published / PARTITIONS_DIR).exists()
+    assert not (resolve_store_path(index) / PARTITIONS_DIR).exists()
+    assert load_partitions(index) is None
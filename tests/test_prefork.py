@@ -0,0 +1,81 @@
+"""
+Tests for pre-fork workers: shared memory, supervision and thread restart after fork.
+"""
+import os
+import signal
+import time
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from src.hotswap import HotSwapRetriever
+from src.prefork import Prefork, process_memory
+from src.versions import new_version, publish_version
+
+pytestmark = pytest.mark.skipif(not hasattr(os, "fork"), reason="needs os.fork()")
+HAS_SMAPS = Path("/proc/self/smaps_rollup").exists()
+
+
+def idle() -> None:
+    time.sleep(60)
+
+
+def wait_for(condition, timeout: float = 5.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.05)
+
+
+@pytest.mark.skipif(not Path("/proc/self").exists(), reason="needs /proc")
+def test_process_memory():
+    memory = process_memory()
+    assert memory["rss"] > 0
+    assert process_memory(2 ** 22 + 1) == {}  # no such process
+
+
+@pytest.mark.skipif(not HAS_SMAPS, reason="needs /proc/<pid>/smaps_rollup")
+def test_workers_share_parent_memory():
+    loaded = np.ones(64 * 1024 * 1024 // 8)  # 64 MiB "model" loaded before forking
+    prefork = Prefork(idle, workers=2, report_seconds=0)
+    prefork.start()
+    try:
+        wait_for(lambda: all(m.get("rss", 0) > 64 for m in prefork.memory().values()))
+        memory = prefork.memory()
+        assert len(memory) == 2
+        for worker in memory.values():
+            assert worker["shared"] > 64
+            assert worker["private"] < 32  # the array was not copied
+    finally:
+        prefork.stop()
+    assert loaded.sum() > 0 and prefork.pids == {}
+
+
+def test_dead_workers_are_replaced():
+    prefork = Prefork(idle, workers=2, report_seconds=0)
+    prefork.start()
+    try:
+        first = set(prefork.pids)
+        victim = min(first)
+        os.kill(victim, signal.SIGKILL)
+        wait_for(lambda: (prefork.reap(), victim not in prefork.pids)[1])
+        assert len(prefork.pids) == 2 and victim not in prefork.pids
+    finally:
+        prefork.stop()
+    assert prefork.pids == {}
+
+
+def test_hot_swap_watcher_restarts_after_fork(tmp_path):
+    version, _ = new_version(tmp_path)
+    publish_version(tmp_path, version)
+    retriever = HotSwapRetriever(tmp_path, lambda path: (lambda q, c=None: [q]), poll_seconds=60)
+    try:
+        pid = os.fork()
+        if pid == 0:
+            alive = retriever._thread is not None and retriever._thread.is_alive()
+            os._exit(0 if alive and retriever("q") == ["q"] else 1)
+        _, status = os.waitpid(pid, 0)
+        assert os.waitstatus_to_exitcode(status) == 0
+    finally:
+        retriever.close()
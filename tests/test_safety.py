@@ -0,0 +1,84 @@
+"""
+Tests for the compiled safety rule engine and the shipped rules file.
+"""
+import json
+
+import pytest
+
+from config.settings import SAFETY_RULES_PATH
+from src.benchmark import bench_safety, synthetic_safety_rules
+from src.safety import DEFAULT_MESSAGE, Automaton, SafetyEngine, get_safety_engine, required_literals, words
+
+RULES = [
+    {"id": "overdose", "category": "self_harm", "phrases": ["lethal dose", "how many pills to overdose"]},
+    {"id": "dose-number", "category": "dosage", "pattern": r"\b(?:dosage|mg)\s*\d+"},
+    {"id": "ssn", "category": "phi", "pattern": r"\b\d{3}-\d{2}-\d{4}\b", "message": "No SSNs."},
+    {"id": "any-digits", "pattern": r"\d{12,}"},
+]
+MESSAGES = {"self_harm": "Call for help.", "dosage": "Ask a pharmacist."}
+
+
+@pytest.fixture
+def engine():
+    return SafetyEngine(RULES, MESSAGES)
+
+
+def test_automaton_finds_keys_across_failure_links():
+    automaton = Automaton([("he", 0), ("she", 1), ("hers", 2), ("his", 3)])
+    assert automaton.values("ushers") == {0, 1, 2}
+    assert automaton.first("ushers") == (1, 1, 4)  # "she" ends before "he" is reported
+    assert automaton.first("nothing here!") == (0, 8, 10)
+    assert automaton.first("xyz") is None
+
+
+def test_phrase_rules_match_whole_words(engine):
+    match = engine.check("What is the LETHAL   dose, roughly?")
+    assert (match.rule_id, match.category, match.message, match.text) == (
+        "overdose", "self_harm", "Call for help.", "lethal dose",
+    )
+    assert engine.check("Is a non-lethal dosed plan ok?") is None
+
+
+def test_regex_rules_return_rule_id(engine):
+    assert engine.check("dosage 40 please").rule_id == "dose-number"
+    assert engine.check("40 MG 5").rule_id == "dose-number"
+    match = engine.check("my number is 123-45-6789")
+    assert (match.rule_id, match.message, match.text) == ("ssn", "No SSNs.", "123-45-6789")
+    match = engine.check("card 123456789012")
+    assert (match.rule_id, match.category, match.message) == ("any-digits", "general", DEFAULT_MESSAGE)
+    assert engine.check("What are flu symptoms?") is None
+
+
+def test_required_literals():
+    assert required_literals(r"\b(?:dosage|mg)\s*\d+") == {"dosage", "mg"}
+    assert required_literals(r"Lethal\s+dose") == {"lethal"}
+    assert required_literals(r"x?\d+") is None
+
+
+@pytest.mark.parametrize("rules, error", [
+    ([{"id": "a", "pattern": "("}], "invalid pattern"),
+    ([{"id": "a", "pattern": r"(a)\1"}], "backreferences"),
+    ([{"id": "a", "phrases": ["x"], "pattern": "x"}], "either"),
+    ([{"id": "a", "phrases": ["x"]}, {"id": "a", "phrases": ["y"]}], "unique"),
+    ([{"id": "a", "phrases": ["?!"]}], "empty phrase"),
+])
+def test_invalid_rules_are_rejected(rules, error):
+    with pytest.raises(ValueError, match=error):
+        SafetyEngine(rules)
+
+
+def test_shipped_rules_load():
+    config = json.loads(SAFETY_RULES_PATH.read_text(encoding="utf-8"))
+    engine = get_safety_engine()
+    assert len(engine) == len(config["rules"])
+    assert engine.check("Can you prescribe me antibiotics?").category == "dosage"
+    assert engine.check("my MRN: 00123456").category == "phi"
+    assert engine.check("How much water should I drink daily?") is None
+
+
+def test_check_cost_does_not_grow_with_rule_count():
+    assert words("Don't PANIC") == ["don", "t", "panic"]
+    assert len(SafetyEngine(synthetic_safety_rules(200))) == 200
+    results = bench_safety(["What are the symptoms of flu and a persistent cough?"] * 50, rule_counts=(10, 1000))
+    # Generous bound: the point is that 100x the rules is not 100x the cost
+    assert results["rules_1000.p50_us"] < 10 * results["rules_10.p50_us"] + 50
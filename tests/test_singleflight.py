@@ -0,0 +1,183 @@
+"""
+Tests for single-flight coalescing of identical in-flight questions.
+"""
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from src import chatbot, metrics
+from src.chatbot import DISCLAIMER_FOOTER, achat_stream, chat, chat_stream
+from src.history import ConversationHistory
+from src.singleflight import SingleFlight, flight_key
+
+
+class GatedChain:
+    """Fake RAG chain that counts calls and holds its answer until released."""
+
+    def __init__(self, tokens=("Flu is ", "a virus."), error=None):
+        self.tokens = list(tokens)
+        self.error = error
+        self.calls = 0
+        self.release = threading.Event()
+
+    def invoke(self, inputs):
+        self.calls += 1
+        assert self.release.wait(5)
+        if self.error:
+            raise self.error
+        return "".join(self.tokens)
+
+    def stream(self, inputs):
+        self.calls += 1
+        for i, token in enumerate(self.tokens):
+            if i == 1:
+                assert self.release.wait(5)
+            yield token
+        if self.error:
+            raise self.error
+
+    async def astream(self, inputs):
+        self.calls += 1
+        for i, token in enumerate(self.tokens):
+            if i == 1:
+                while not self.release.is_set():
+                    await asyncio.sleep(0.01)
+            yield token
+
+
+@pytest.fixture(autouse=True)
+def fresh_registry(monkeypatch):
+    flights = SingleFlight()
+    monkeypatch.setattr(chatbot, "get_semantic_cache", lambda: None)
+    monkeypatch.setattr(chatbot, "get_faq_lookup", lambda: None)
+    monkeypatch.setattr(chatbot, "get_single_flight", lambda: flights)
+    return flights
+
+
+def wait_for_followers(flights, n):
+    for _ in range(500):
+        if flights.stats()["in_flight"] and flights.coalesced >= n:
+            return
+        threading.Event().wait(0.01)
+    raise AssertionError("followers did not join")
+
+
+def test_flight_key_covers_retrieval_context():
+    chain = object()
+    base = flight_key("What's  the flu?", chain)
+    assert flight_key("what's the FLU", chain) == base
+    assert flight_key("What is the flu?", chain) != base
+    assert flight_key("What's the flu?", object()) != base
+    assert flight_key("What's the flu?", chain, categories=["a", "b"]) == flight_key(
+        "What's the flu?", chain, categories=["b", "a"]
+    ) != base
+    pairs = [("user", "hi"), ("assistant", "hello")]
+    assert flight_key("What's the flu?", chain, pairs) != base
+    assert flight_key("What's the flu?", chain, ConversationHistory.from_pairs(pairs)) != base
+
+
+def test_concurrent_chats_share_one_llm_call(fresh_registry):
+    metrics.enable(True)
+    metrics.reset()
+    chain = GatedChain()
+    try:
+        with ThreadPoolExecutor(4) as pool:
+            futures = [pool.submit(chat, "What is flu?", chain) for _ in range(4)]
+            wait_for_followers(fresh_registry, 3)
+            chain.release.set()
+            replies = [f.result() for f in futures]
+        coalesced = metrics.snapshot()["counters"]
+    finally:
+        metrics.enable(False)
+    assert chain.calls == 1
+    assert replies == [("Flu is a virus." + DISCLAIMER_FOOTER, None)] * 4
+    assert fresh_registry.stats() == {"in_flight": 0, "leaders": 1, "coalesced": 3}
+    assert coalesced['singleflight_coalesced_total{kind="call"}'] == 3
+
+    # Once landed, the same question makes a new call
+    chat("What is flu?", chain)
+    assert chain.calls == 2
+
+
+def test_stream_followers_replay_and_follow(fresh_registry):
+    chain = GatedChain()
+    with ThreadPoolExecutor(3) as pool:
+        leader = pool.submit(lambda: "".join(chat_stream("What is flu?", chain)))
+        wait_for_followers(fresh_registry, 0)
+        followers = [pool.submit(lambda: "".join(chat_stream("what is flu", chain))) for _ in range(2)]
+        wait_for_followers(fresh_registry, 2)
+        chain.release.set()
+        results = [leader.result()] + [f.result() for f in followers]
+    assert chain.calls == 1
+    assert results == ["Flu is a virus." + DISCLAIMER_FOOTER] * 3
+
+
+def test_leader_error_reaches_followers(fresh_registry):
+    chain = GatedChain(error=FileNotFoundError("no index"))
+    with ThreadPoolExecutor(3) as pool:
+        futures = [pool.submit(chat, "What is flu?", chain) for _ in range(3)]
+        wait_for_followers(fresh_registry, 2)
+        chain.release.set()
+        replies = [f.result() for f in futures]
+    assert chain.calls == 1
+    assert all(reply == "" and "knowledge base" in err for reply, err in replies)
+
+
+def test_async_tasks_share_one_stream(fresh_registry):
+    chain = GatedChain()
+
+    async def collect():
+        return "".join([piece async for piece in achat_stream("What is flu?", chain)])
+
+    async def run():
+        tasks = [asyncio.create_task(collect()) for _ in range(3)]
+        while fresh_registry.coalesced < 2:
+            await asyncio.sleep(0.01)
+        # A sync caller in another thread joins the same async flight
+        sync = asyncio.to_thread(lambda: "".join(chat_stream("What is flu?", chain)))
+        sync_task = asyncio.create_task(sync)
+        while fresh_registry.coalesced < 3:
+            await asyncio.sleep(0.01)
+        chain.release.set()
+        return await asyncio.gather(*tasks, sync_task)
+
+    assert asyncio.run(run()) == ["Flu is a virus." + DISCLAIMER_FOOTER] * 4
+    assert chain.calls == 1
+
+
+def test_stream_leader_closed_early():
+    flights = SingleFlight()
+    produced = []
+
+    def tokens():
+        for token in "abc":
+            produced.append(token)
+            yield token
+
+    # Alone: the flight is abandoned and the LLM stream closed
+    stream = flights.stream("k", tokens)
+    assert next(stream) == "a"
+    stream.close()
+    assert produced == ["a"] and flights.stats()["in_flight"] == 0
+
+    follower = flights.stream("k", tokens)  # a new leader after the abandoned flight
+    assert list(follower) == list("abc")
+
+    # With a follower: the leader drains the stream for it
+    produced.clear()
+    flights = SingleFlight()
+    stream = flights.stream("k", tokens)
+    assert next(stream) == "a"
+    follower = flights.stream("k", tokens)
+    assert next(follower) == "a"
+    stream.close()
+    assert "".join(follower) == "bc" and produced == list("abc")
+
+
+def test_disabled_registry_passes_through():
+    flights = SingleFlight(enabled=False)
+    assert flights.call("k", lambda: "x") == "x"
+    assert list(flights.stream("k", lambda: iter("xy"))) == ["x", "y"]
+    assert flights.stats() == {"in_flight": 0, "leaders": 0, "coalesced": 0}
@@ -0,0 +1,106 @@
+"""
+Tests for the pickle-free, memory-mapped vector store format.
+"""
+import os
+from pathlib import Path
+
+import pytest
+from langchain_community.vectorstores import FAISS
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from src import store as store_module
+from src.store import (
+    IDS_FILE,
+    IDS_LOOKUP_FILE,
+    IDS_OFFSETS_FILE,
+    LazyDocstore,
+    has_store,
+    load_store,
+    save_store,
+)
+
+
+def test_round_trip(tmp_path):
+    emb = DeterministicFakeEmbedding(size=8)
+    texts = ["Q: flu?\nA: rest", "Q: dehydration? — thirst", "Q: headache?"]
+    metadatas = [{"source": "a", "category": "symptoms"}, {"source": "b"}, {"source": "c"}]
+    store = FAISS.from_texts(texts, emb, metadatas=metadatas, ids=["x", "y", "z"])
+    save_store(store, tmp_path)
+    assert has_store(tmp_path)
+    assert not (tmp_path / "index.pkl").exists()
+
+    loaded = load_store(tmp_path, emb)
+    assert isinstance(loaded.docstore, LazyDocstore)
+    assert loaded.index.ntotal == 3
+    for text in texts:
+        expected = store.similarity_search(text, k=2)
+        got = loaded.similarity_search(text, k=2)
+        assert [(d.page_content, d.metadata) for d in got] == [
+            (d.page_content, d.metadata) for d in expected
+        ]
+
+
+def test_chunk_ids_are_not_loaded_into_python_objects(tmp_path):
+    emb = DeterministicFakeEmbedding(size=8)
+    ids = ["x", "é-1", "zz"]
+    save_store(FAISS.from_texts(["a", "b", "c"], emb, ids=ids), tmp_path)
+    loaded = load_store(tmp_path, emb)
+    assert not isinstance(loaded.index_to_docstore_id, dict)
+    assert [loaded.index_to_docstore_id[row] for row in range(3)] == ids
+    assert loaded.docstore.search("é-1").page_content == "b"
+    assert loaded.docstore.search("missing") == "ID missing not found."
+    with pytest.raises(KeyError):
+        loaded.index_to_docstore_id[3]
+
+
+def test_id_lookup_resolves_hash_collisions(tmp_path, monkeypatch):
+    monkeypatch.setattr(store_module, "_id_hash", lambda cid: 7)
+    emb = DeterministicFakeEmbedding(size=8)
+    save_store(FAISS.from_texts(["a", "b", "c"], emb, ids=["x", "y", "z"]), tmp_path)
+    docstore = load_store(tmp_path, emb).docstore
+    assert [docstore.search(cid).page_content for cid in "zyx"] == ["c", "b", "a"]
+    assert docstore.search("w") == "ID w not found."
+
+
+def test_loads_store_without_id_tables(tmp_path):
+    emb = DeterministicFakeEmbedding(size=8)
+    save_store(FAISS.from_texts(["a", "b", "c"], emb, ids=["x", "y", "z"]), tmp_path)
+    # Stores from before the id tables: "\n"-joined ids, no offsets or lookup
+    (tmp_path / IDS_OFFSETS_FILE).unlink()
+    (tmp_path / IDS_LOOKUP_FILE).unlink()
+    (tmp_path / IDS_FILE).write_text("x\ny\nz", encoding="utf-8")
+    loaded = load_store(tmp_path, emb)
+    assert list(loaded.index_to_docstore_id.values()) == ["x", "y", "z"]
+    assert loaded.docstore.search("z").page_content == "c"
+    assert loaded.similarity_search("b", k=1)[0].page_content == "b"
+
+
+def test_editable_load_supports_delete(tmp_path):
+    emb = DeterministicFakeEmbedding(size=8)
+    store = FAISS.from_texts(["a", "b", "c"], emb, ids=["x", "y", "z"])
+    save_store(store, tmp_path)
+    editable = load_store(tmp_path, emb, editable=True)
+    editable.delete(["y"])
+    save_store(editable, tmp_path)
+    reloaded = load_store(tmp_path, emb)
+    assert reloaded.index.ntotal == 2
+    assert sorted(reloaded.index_to_docstore_id.values()) == ["x", "z"]
+
+
+def open_count(path):
+    fds = [os.path.realpath(f"/proc/self/fd/{fd}") for fd in os.listdir("/proc/self/fd")]
+    return fds.count(str(path.resolve()))
+
+
+@pytest.mark.skipif(not Path("/proc/self/fd").exists(), reason="needs /proc")
+def test_lazy_docstore_close_releases_records_file(tmp_path):
+    emb = DeterministicFakeEmbedding(size=8)
+    save_store(FAISS.from_texts(["a", "b"], emb, ids=["x", "y"]), tmp_path)
+    docstore = load_store(tmp_path, emb).docstore
+    records = tmp_path / "docstore.jsonl"
+    assert open_count(records) == 1  # only the mapping's own descriptor
+    assert docstore.search("y").page_content == "b"
+    docstore.close()
+    assert open_count(records) == 0
+    with pytest.raises(ValueError):
+        docstore.search("y")
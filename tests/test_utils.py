@@ -2,7 +2,7 @@
 Unit tests for input validation and sanitization.
 """
 import pytest
-from src.utils import validate_query, sanitize_for_display
+from src.utils import validate_query, sanitize_for_display, sanitize_stream
 
 
 def test_validate_query_empty():
@@ -33,6 +33,18 @@ def test_validate_query_too_long():
     assert "long" in err.lower()
 
 
+def test_validate_query_blocks_dosing_requests():
+    valid, err = validate_query("What dosage 500 should I take?")
+    assert not valid
+    assert "dosing" in err.lower()
+
+
+def test_validate_query_blocks_phi():
+    valid, err = validate_query("My SSN is 123-45-6789, am I covered?")
+    assert not valid
+    assert "identifiers" in err.lower()
+
+
 def test_sanitize_for_display_none():
     assert sanitize_for_display(None) == ""
 
@@ -42,3 +54,17 @@ def test_sanitize_for_display_truncate():
     out = sanitize_for_display(long_text, max_len=100)
     assert len(out) <= 100
     assert out.endswith("...")
+
+
+@pytest.mark.parametrize("text", [
+    "  Hello world.  ",
+    "a" * 120,
+    "a" * 97 + "   ",
+    "word " * 30,
+    "\n\n",
+])
+@pytest.mark.parametrize("piece", [1, 3, 7])
+def test_sanitize_stream_matches_sanitize_for_display(text, piece):
+    chunks = [text[i:i + piece] for i in range(0, len(text), piece)]
+    streamed = "".join(sanitize_stream(chunks, max_len=100))
+    assert streamed == sanitize_for_display(text, max_len=100)
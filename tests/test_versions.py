@@ -0,0 +1,150 @@
+"""
+Tests for versioned store directories and background index hot-swap.
+"""
+import json
+
+import pytest
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from src.embeddings import build_faiss_index, get_index_version
+from src.hotswap import HotSwapRetriever
+from src.rag import load_retriever
+from src.versions import (
+    CURRENT_FILE,
+    current_version,
+    list_versions,
+    new_version,
+    prune_versions,
+    publish_version,
+    resolve_store_path,
+)
+
+
+def write_faqs(raw, *answers):
+    raw.mkdir(exist_ok=True)
+    entries = [{"question": f"Q{i}?", "answer": a} for i, a in enumerate(answers)]
+    (raw / "faqs.json").write_text(json.dumps(entries), encoding="utf-8")
+
+
+def build(raw, index):
+    return build_faiss_index(persist_path=index, data_dir=raw, embeddings=DeterministicFakeEmbedding(size=8))
+
+
+def test_unversioned_directory_resolves_to_itself(tmp_path):
+    assert current_version(tmp_path) is None
+    assert resolve_store_path(tmp_path) == tmp_path
+    assert prune_versions(tmp_path) == []
+
+
+def test_publish_and_prune(tmp_path):
+    names = [new_version(tmp_path)[0] for _ in range(4)]
+    assert list_versions(tmp_path) == sorted(names)
+    publish_version(tmp_path, names[2])
+    assert resolve_store_path(tmp_path) == tmp_path / "versions" / names[2]
+    assert not list(tmp_path.glob(f"{CURRENT_FILE}.*.tmp"))
+
+    assert prune_versions(tmp_path, keep=2) == [names[0]]
+    # The previous version is kept, and so is the newer, unpublished one
+    assert list_versions(tmp_path) == names[1:]
+    with pytest.raises(FileNotFoundError):
+        publish_version(tmp_path, "missing")
+
+
+def test_builds_publish_new_versions(tmp_path):
+    raw, index = tmp_path / "raw", tmp_path / "index"
+    write_faqs(raw, "A0", "A1")
+    build(raw, index)
+    first = current_version(index)
+    assert first is not None and get_index_version(index) == first
+
+    build(raw, index)  # nothing changed: no new version
+    assert current_version(index) == first and list_versions(index) == [first]
+
+    write_faqs(raw, "A0", "changed")
+    store = build(raw, index)
+    second = current_version(index)
+    assert second > first and store.index.ntotal == 2
+
+    write_faqs(raw, "A0", "changed again")
+    build(raw, index)
+    assert list_versions(index) == [second, current_version(index)]  # keeps 2 by default
+
+
+def test_failed_build_keeps_current_version(tmp_path):
+    raw, index = tmp_path / "raw", tmp_path / "index"
+    write_faqs(raw, "A0")
+    build(raw, index)
+    before = current_version(index)
+    write_faqs(raw)  # empty corpus
+    with pytest.raises(ValueError):
+        build(raw, index)
+    assert current_version(index) == before
+    assert list_versions(index) == [before]
+
+
+def test_hot_swap_retriever_follows_new_versions(tmp_path):
+    loads = []
+
+    def load(path):
+        loads.append(path.name)
+        if path.name == "broken":
+            raise RuntimeError("corrupt index")
+        return lambda question, categories=None: [path.name, question]
+
+    first, _ = new_version(tmp_path)
+    publish_version(tmp_path, first)
+    retriever = HotSwapRetriever(tmp_path, load, poll_seconds=0)
+    assert retriever("q") == [first, "q"]
+    assert not retriever.check()
+
+    second, _ = new_version(tmp_path)
+    publish_version(tmp_path, second)
+    old = retriever._retrieve  # an in-flight request keeps the reference it started with
+    assert retriever.check()
+    assert retriever("q") == [second, "q"] and old("q") == [first, "q"]
+
+    (tmp_path / "versions" / "broken").mkdir()
+    publish_version(tmp_path, "broken")
+    assert not retriever.check()
+    assert not retriever.check()  # a failed version is not retried on every poll
+    assert retriever("q") == [second, "q"]
+    assert loads == [first, second, "broken"]
+
+
+def test_hot_swap_end_to_end(tmp_path):
+    raw, index = tmp_path / "raw", tmp_path / "index"
+    write_faqs(raw, "Drink water.")
+    build(raw, index)
+    embeddings = DeterministicFakeEmbedding(size=8)
+    retriever = HotSwapRetriever(index, lambda path: load_retriever(path, False, embeddings), poll_seconds=0)
+    assert "Drink water." in retriever("Q0?")[0].page_content
+
+    write_faqs(raw, "Rest and fluids.")
+    build(raw, index)
+    assert "Drink water." in retriever("Q0?")[0].page_content  # not swapped yet
+    assert retriever.check()
+    assert "Rest and fluids." in retriever("Q0?")[0].page_content
+
+
+def test_hot_swap_stops_retired_batchers(tmp_path):
+    raw, index = tmp_path / "raw", tmp_path / "index"
+    write_faqs(raw, "Drink water.")
+    build(raw, index)
+    embeddings = DeterministicFakeEmbedding(size=8)
+    retriever = HotSwapRetriever(index, lambda path: load_retriever(path, True, embeddings), poll_seconds=0)
+    threads = []
+    for answer in ("Rest and fluids.", "See a doctor."):
+        old = retriever._retrieve
+        threads += [batcher._thread for batcher in old._batchers]
+        write_faqs(raw, answer)
+        build(raw, index)
+        assert retriever.check()
+        assert answer in retriever("Q0?")[0].page_content
+        assert old("Q0?")  # a request still holding the old version is answered directly
+    assert len(threads) == 2
+    for thread in threads:
+        thread.join(timeout=5)
+        assert not thread.is_alive()
+    assert all(batcher._thread.is_alive() for batcher in retriever._retrieve._batchers)
+    retriever.close()
+    retriever._retrieve.close()
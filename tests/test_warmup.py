@@ -0,0 +1,61 @@
+"""
+Tests for background warm-up and lazy imports.
+"""
+import subprocess
+import sys
+import threading
+from pathlib import Path
+
+import pytest
+
+from src.warmup import start_warmup
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+
+
+def test_warmup_returns_loaded_chain():
+    release = threading.Event()
+
+    def load(timings):
+        release.wait(5)
+        timings["step"] = 0.0
+        return "chain"
+
+    warmup = start_warmup(load)
+    assert not warmup.done
+    with pytest.raises(TimeoutError):
+        warmup.wait(timeout=0.01)
+    release.set()
+    assert warmup.wait(timeout=5) == "chain"
+    assert warmup.done
+    assert set(warmup.timings) == {"step", "total"}
+
+
+def test_warmup_reraises_load_error():
+    def load(timings):
+        raise FileNotFoundError("no index")
+
+    warmup = start_warmup(load)
+    with pytest.raises(FileNotFoundError):
+        warmup.wait(timeout=5)
+    with pytest.raises(FileNotFoundError):
+        warmup.wait(timeout=5)
+
+
+def test_ui_entry_imports_stay_light():
+    code = (
+        "import sys, src.warmup, src.utils, config.settings\n"
+        "heavy = [m for m in ('langchain_core', 'langchain_community', 'langchain_groq',"
+        " 'faiss', 'torch', 'sentence_transformers') if m in sys.modules]\n"
+        "assert not heavy, heavy\n"
+    )
+    subprocess.run([sys.executable, "-c", code], cwd=PROJECT_ROOT, check=True)
+
+
+def test_chatbot_import_defers_groq_and_faiss():
+    code = (
+        "import sys, src.chatbot\n"
+        "heavy = [m for m in ('langchain_community', 'langchain_groq', 'faiss') if m in sys.modules]\n"
+        "assert not heavy, heavy\n"
+    )
+    subprocess.run([sys.executable, "-c", code], cwd=PROJECT_ROOT, check=True)